@@ -0,0 +1,87 @@
+# Autocomplete latency of the in-memory book index in database/book_index.py
+#
+#   python -m benchmarks.bench_book_search [books]
+import random
+import sys
+import time
+import tracemalloc
+
+from database.book_index import BookIndex
+
+WORDS = (
+    "the of a and in to night house shadow river king queen war peace secret garden "
+    "last first girl boy city star light dark blood fire ice storm sea winter summer "
+    "silent lost hidden empire glass iron golden broken wild little great long road "
+    "dream memory murder island mountain song stone wolf dragon ghost letter daughter "
+    "son mother father time world heart"
+).split()
+NAMES = "Anne Brontë Charles Dickens Jane Austen Leo Tolstoy Toni Morrison Ursula Le Guin Kazuo Ishiguro Haruki Murakami".split()
+
+
+def make_books(count: int, seed: int = 42) -> list[tuple[int, str, str]]:
+    rng = random.Random(seed)
+    books = []
+    for i in range(count):
+        # A long tail of invented words keeps the vocabulary realistic
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+        title += f" {''.join(rng.choices('bcdfghjklmnprstvz', k=2))}{rng.choice('aeiou')}{rng.randint(0, 999)}"
+        books.append((1000 + i, title.title(), f"{rng.choice(NAMES)} {rng.choice(NAMES)}"))
+    return books
+
+
+def build(books) -> BookIndex:
+    # As BookIndex.load does it
+    index = BookIndex()
+    for start in range(0, len(books), 1000):
+        index.add_many(books[start:start + 1000])
+    index.sort()
+    index.loaded = True
+    return index
+
+
+def queries(books, count: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    typed = []
+    for _ in range(count):
+        title = rng.choice(books)[1]
+        # Every keystroke of a title, as autocomplete sees it
+        cut = rng.randint(1, len(title))
+        typed.append(title[:cut])
+    typed += ["t", "th", "the", "dragn", "mountian storm", "bronte", "murakami wolf", "zzzz"]
+    return typed
+
+
+def main(count: int = 50_000):
+    books = make_books(count)
+    started = time.perf_counter()
+    index = build(books)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    measured = build(books)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+    print(f"indexed {count} books ({len(index.vocabulary)} words) in {elapsed * 1000:.0f} ms, {memory / 2**20:.1f} MiB")
+
+    timings = []
+    for query in queries(books, 2000):
+        started = time.perf_counter()
+        index.search(query, 25)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p50, p99, worst = timings[len(timings) // 2], timings[int(len(timings) * 0.99)], timings[-1]
+    print(f"search p50 {p50 * 1000:.2f} ms  p99 {p99 * 1000:.2f} ms  max {worst * 1000:.2f} ms")
+
+    # A full title finds its book first; a typo still finds it; new books are searchable at once
+    book_id, title, author = books[123]
+    assert index.search(title, 25)[0][0] == book_id
+    assert any(match[0] == book_id for match in index.search(f"{title.split()[-1]} {author.split()[-1][:-1]}x", 25))
+    index.add(1, "Zyxwv Chronicles", "Nobody")
+    assert index.search("zyx", 25)[0][0] == 1
+    assert index.search("bronte", 25), "accents are folded"
+    # Discord's autocomplete deadline is 3 seconds; stay well clear of it
+    assert worst < 0.05, "autocomplete too slow"
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
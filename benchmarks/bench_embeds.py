@@ -0,0 +1,67 @@
+# Micro-benchmarks for embed construction in cogs/message_sender.py
+#
+#   python -m benchmarks.bench_embeds [entries]
+import random
+import sys
+import timeit
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from cogs.FeedEntry import FeedEntry
+from cogs.message_sender import (
+    build_batch_feed_update_embeds,
+    build_current_book_embed,
+    build_finished_book_embed,
+    build_progress_update_embed,
+)
+
+SHELVES = ["to-read", "currently-reading", "read"]
+WORDS = "the of a book was really quite long and I could not put it down until the very end".split()
+
+
+def make_entries(count: int, seed: int = 42) -> list[FeedEntry]:
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        shelf = rng.choice(SHELVES)
+        review = " ".join(rng.choices(WORDS, k=rng.randint(0, 600))) if shelf == "read" else None
+        entries.append(FeedEntry(
+            book_id=1000 + i,
+            title=f"Book number {i} with a reasonably long title",
+            author=f"Author {i % 50}",
+            cover_image_url=f"https://images.example.com/{i}.jpg",
+            goodreads_url=f"https://www.goodreads.com/book/show/{1000 + i}",
+            shelf=shelf,
+            rating=rng.randint(0, 5) if shelf == "read" else 0,
+            average_rating=round(rng.uniform(2, 5), 2),
+            review=review or None,
+            published=datetime.now(timezone.utc),
+        ))
+    return entries
+
+
+def main(count: int = 500, repeat: int = 20):
+    user = SimpleNamespace(user_id=1, discord_username="reader", goodreads_user_id="123", goodreads_display_name="Reader")
+    discord_user = SimpleNamespace(mention="<@1>", avatar=None)
+    emojis = ()
+    entries = make_entries(count)
+    book = next(e for e in entries if e.shelf == "read" and e.review)
+    book_row = SimpleNamespace(cover_image_url=book.cover_image_url, goodreads_url=book.goodreads_url)
+    update = {"value": f"Reader is on page 120 of 300 of {book.title}", "book": book_row}
+
+    cases = {
+        f"build_batch_feed_update_embeds ({count} entries)": lambda: build_batch_feed_update_embeds(entries, emojis, user, discord_user),
+        "build_finished_book_embed": lambda: build_finished_book_embed(book, emojis, user, discord_user),
+        "build_current_book_embed": lambda: build_current_book_embed(book, emojis, user, discord_user),
+        "build_progress_update_embed": lambda: build_progress_update_embed(update, user, discord_user, emojis),
+    }
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        print(f"{best * 1000:10.3f} ms  {name}")
+
+    embeds = build_batch_feed_update_embeds(entries, emojis, user, discord_user)
+    print(f"{len(embeds)} embeds, largest {max(len(embed) for embed in embeds)} characters")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,56 @@
+# Simulated feed cycle: per-guild time until every member has been synced, with
+# guilds served one after another (the old cycle) vs. the fair scheduler
+#
+#   python -m benchmarks.bench_fair_scheduler [sync_ms]
+import asyncio
+import sys
+import time
+
+from cogs.fair_scheduler import FairScheduler
+
+GUILDS = {1: 500, 2: 40, 3: 12, 4: 5, 5: 1}
+
+
+async def sequential(sync_seconds: float) -> dict[int, float]:
+    started = time.monotonic()
+    finished = {}
+    for server_id, members in GUILDS.items():
+        for _ in range(members):
+            await asyncio.sleep(sync_seconds)
+        finished[server_id] = time.monotonic() - started
+    return finished
+
+
+async def fair(sync_seconds: float, concurrency: int) -> dict[int, float]:
+    scheduler = FairScheduler(concurrency=concurrency, guild_concurrency=2)
+    for server_id, members in GUILDS.items():
+        scheduler.add(server_id, list(range(members)))
+    started = time.monotonic()
+    finished = {}
+
+    async def sync(server_id: int, member: int):
+        await asyncio.sleep(sync_seconds)
+        finished[server_id] = time.monotonic() - started
+
+    results = await scheduler.run(sync)
+    assert {server_id: len(done) for server_id, done in results.items()} == GUILDS
+    return finished
+
+
+def main(sync_ms: float = 2.0):
+    sync_seconds = sync_ms / 1000
+    runs = {
+        "server by server": asyncio.run(sequential(sync_seconds)),
+        "fair, 1 in flight": asyncio.run(fair(sync_seconds, concurrency=1)),
+        "fair, 4 in flight": asyncio.run(fair(sync_seconds, concurrency=4)),
+    }
+    print(f"{'':20}" + "".join(f"{f'guild {server_id} ({members})':>18}" for server_id, members in GUILDS.items()))
+    for name, finished in runs.items():
+        print(f"{name:20}" + "".join(f"{finished[server_id] * 1000:15.0f} ms" for server_id in GUILDS))
+
+    # Small guilds no longer wait behind the large one
+    assert runs["fair, 1 in flight"][5] < runs["server by server"][5] / 10
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
@@ -0,0 +1,125 @@
+# Benchmark and self-check for the shelf diff engine in cogs/feed_diff.py
+#
+#   python -m benchmarks.bench_feed_diff [books]
+import random
+import sys
+import timeit
+import tracemalloc
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from cogs.FeedEntry import FeedEntry
+from cogs.feed_diff import ADDED, MOVED, RATED, RERATED, REVIEWED, REMOVED, diff_shelf, review_hash
+
+SHELVES = ["to-read", "currently-reading", "read"]
+
+
+def iter_feed(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(count):
+        shelf = rng.choice(SHELVES)
+        yield FeedEntry(
+            book_id=1000 + i,
+            title=f"Book number {i}",
+            author=f"Author {i % 50}",
+            cover_image_url=None,
+            goodreads_url=f"https://www.goodreads.com/book/show/{1000 + i}",
+            shelf=shelf,
+            rating=rng.randint(1, 5) if shelf == "read" and rng.random() < 0.7 else 0,
+            average_rating=round(rng.uniform(2, 5), 2),
+            review="Loved it." if shelf == "read" and rng.random() < 0.2 else None,
+            published=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        )
+
+
+def make_feed(count: int, seed: int = 42) -> list[FeedEntry]:
+    return list(iter_feed(count, seed))
+
+
+def snapshot(entries) -> dict[int, SimpleNamespace]:
+    # Stand-ins for the column-only rows returned by crud.get_account_shelf
+    return {
+        entry.book_id: SimpleNamespace(
+            book_id=entry.book_id,
+            shelf=entry.shelf,
+            rating=entry.rating,
+            review_hash=review_hash(entry.review),
+            review_date=entry.published.replace(tzinfo=None),
+        )
+        for entry in entries
+    }
+
+
+def peak_diff_memory(count: int) -> int:
+    # Peak allocations while streaming an unchanged feed of `count` books through the diff
+    stored = snapshot(iter_feed(count))
+    tracemalloc.start()
+    changes = list(diff_shelf(stored, iter_feed(count)))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert not changes
+    return peak
+
+
+def mutate(entries: list[FeedEntry], changes: int, seed: int = 7) -> tuple[list[FeedEntry], Counter]:
+    """
+    Applies `changes` edits of each kind and returns the new feed with the expected event counts.
+    """
+    rng = random.Random(seed)
+    feed = list(entries)
+    indexes = rng.sample(range(len(feed)), changes * 4)
+    moved, rated, reviewed, removed = (indexes[i * changes:(i + 1) * changes] for i in range(4))
+    for i in moved:
+        feed[i] = replace(feed[i], shelf=next(shelf for shelf in SHELVES if shelf != feed[i].shelf))
+    for i in rated:
+        feed[i] = replace(feed[i], rating=(feed[i].rating % 5) + 1)
+    for i in reviewed:
+        feed[i] = replace(feed[i], review=f"Edited review {i}")
+    expected = Counter({
+        MOVED: changes,
+        RATED: sum(1 for i in rated if not entries[i].rating),
+        RERATED: sum(1 for i in rated if entries[i].rating),
+        REVIEWED: changes,
+        REMOVED: changes,
+        ADDED: changes,
+    })
+    removed = set(removed)
+    feed = [entry for i, entry in enumerate(feed) if i not in removed]
+    feed += [replace(entry, book_id=10_000_000 + i) for i, entry in enumerate(make_feed(changes, seed=seed))]
+    return feed, expected
+
+
+def main(count: int = 10_000, repeat: int = 10):
+    feed = make_feed(count)
+    stored = snapshot(feed)
+    changed_feed, expected = mutate(feed, changes=max(1, count // 100))
+    fresh = make_feed(count, seed=1)
+
+    cases = {
+        f"unchanged library ({count} books)": lambda: list(diff_shelf(dict(stored), feed)),
+        f"1% of each change kind ({count} books)": lambda: list(diff_shelf(dict(stored), changed_feed)),
+        f"first sync ({count} books)": lambda: list(diff_shelf({}, fresh)),
+        f"library emptied ({count} books)": lambda: list(diff_shelf(dict(stored), [])),
+    }
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        print(f"{best * 1000:10.3f} ms  {name}")
+
+    assert not list(diff_shelf(dict(stored), feed)), "unchanged feed produced changes"
+    changed = Counter(event for change in diff_shelf(dict(stored), changed_feed) for event in change.events)
+    assert changed == expected, "unexpected events"
+    first = list(diff_shelf({}, fresh))
+    assert len(first) == count and all(change.events == (ADDED,) for change in first)
+    emptied = list(diff_shelf(dict(stored), []))
+    assert len(emptied) == count and all(change.entry is None for change in emptied)
+    print(f"events: {dict(changed)}")
+
+    # The stored snapshot grows with the shelf; the streamed feed should not add to it
+    for size in (count // 10, count, count * 5):
+        print(f"{peak_diff_memory(size) / 1024:10.1f} KiB peak while diffing {size} unchanged books")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,98 @@
+# Lookup latency of the per-poll progress queries as progress_updates grows,
+# and after the retention job compacts it. Uses the configured database (Postgres, or a
+# local file with DATABASE_BACKEND=sqlite); everything it writes lives under a synthetic
+# server and is removed afterwards.
+#
+#   python -m benchmarks.bench_progress_lookups [max_rows]
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, text
+
+from database import crud
+from database.connection import AsyncSessionLocal, get_engine
+from database.models import Book, ProgressSummary, ProgressUpdate, Server, User, init_db
+
+SERVER_ID = 900_000_000_000_000_001
+USER_ID = 900_000_000_000_000_002
+BOOK_BASE = 900_000_000_000
+BOOKS = 50
+START = datetime(2020, 1, 1)
+
+
+async def grow(session, start: int, stop: int):
+    # One update an hour, cycling through the member's books
+    rows = [
+        {
+            "message_id": i,
+            "server_id": SERVER_ID,
+            "user_id": USER_ID,
+            "book_id": BOOK_BASE + i % BOOKS,
+            "value": f"Benchmark is {i % 100}% done with Book {i % BOOKS}",
+            "percent": float(i % 100),
+            "published": START + timedelta(hours=i),
+        }
+        for i in range(start, stop)
+    ]
+    for offset in range(0, len(rows), 5000):
+        await session.execute(insert(ProgressUpdate), rows[offset:offset + 5000])
+    await session.commit()
+    # Fresh statistics, as autovacuum would have after real growth
+    await session.execute(text("ANALYZE progress_updates"))
+
+
+async def time_lookups(session, rows: int, repeat: int = 200) -> tuple[float, float]:
+    latest = START + timedelta(hours=rows - 1)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        assert await crud.check_sent_update(session, SERVER_ID, USER_ID, latest)
+    sent = (time.perf_counter() - started) / repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        assert await crud.get_last_progress_update(session, SERVER_ID, USER_ID, BOOK_BASE + (rows - 1) % BOOKS)
+    last = (time.perf_counter() - started) / repeat
+    return sent, last
+
+
+async def cleanup(session):
+    await session.execute(delete(ProgressSummary).where(ProgressSummary.server_id == SERVER_ID))
+    await session.execute(delete(ProgressUpdate).where(ProgressUpdate.server_id == SERVER_ID))
+    await session.execute(delete(User).where(User.server_id == SERVER_ID))
+    await session.execute(delete(Book).where(Book.book_id.between(BOOK_BASE, BOOK_BASE + BOOKS)))
+    await session.execute(delete(Server).where(Server.server_id == SERVER_ID))
+    await session.commit()
+
+
+async def main(max_rows: int = 100_000):
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        await cleanup(session)
+        session.add(Server(server_id=SERVER_ID, server_name="Benchmark"))
+        session.add_all(Book(book_id=BOOK_BASE + i, title=f"Book {i}", author="Benchmark") for i in range(BOOKS))
+        await session.flush()
+        session.add(User(server_id=SERVER_ID, user_id=USER_ID, discord_username="benchmark"))
+        await session.commit()
+        try:
+            rows = 0
+            for size in (max_rows // 100, max_rows // 10, max_rows):
+                await grow(session, rows, size)
+                rows = size
+                sent, last = await time_lookups(session, rows)
+                print(f"{rows:>10} rows  check_sent_update {sent * 1000:7.3f} ms  get_last_progress_update {last * 1000:7.3f} ms")
+
+            cutoff = START + timedelta(hours=rows)
+            archived = await crud.compact_progress_updates(session, 10, cutoff)
+            remaining = await session.scalar(select(func.count()).select_from(ProgressUpdate).where(ProgressUpdate.server_id == SERVER_ID))
+            summarized = await session.scalar(select(func.sum(ProgressSummary.archived_count)).where(ProgressSummary.server_id == SERVER_ID))
+            assert remaining == BOOKS * 10 and archived == summarized == rows - remaining
+            sent, last = await time_lookups(session, rows)
+            print(f"{remaining:>10} rows  check_sent_update {sent * 1000:7.3f} ms  get_last_progress_update {last * 1000:7.3f} ms  (after archiving {archived})")
+        finally:
+            await cleanup(session)
+    await get_engine().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
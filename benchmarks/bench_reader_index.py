@@ -0,0 +1,58 @@
+# Cost the discussion-thread check adds to the feed cycle, per shelf change
+#
+#   python -m benchmarks.bench_reader_index [changes]
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from cogs.discussions import ReaderIndex, touches_reading
+from cogs.feed_diff import ADDED, MOVED, RATED, ShelfChange
+
+SHELVES = ["read", "to-read", "currently-reading"]
+
+
+def make_changes(count: int, seed: int = 42) -> list[ShelfChange]:
+    rng = random.Random(seed)
+    changes = []
+    for _ in range(count):
+        book_id = rng.randint(1, 5000)
+        shelf = rng.choices(SHELVES, weights=[6, 3, 1])[0]
+        if rng.random() < 0.3:
+            changes.append(ShelfChange(book_id, (ADDED,), SimpleNamespace(shelf=shelf)))
+        else:
+            previous = rng.choice(SHELVES)
+            changes.append(ShelfChange(book_id, (MOVED,) if previous != shelf else (RATED,), SimpleNamespace(shelf=shelf), SimpleNamespace(shelf=previous)))
+    return changes
+
+
+def main(count: int = 200_000):
+    changes = make_changes(count)
+    # 50 accounts, each registered in the same two guilds
+    members = [[SimpleNamespace(server_id=guild, user_id=user_id) for guild in (1, 2)] for user_id in range(50)]
+    index = ReaderIndex()
+    index.loaded = True
+
+    started = time.perf_counter()
+    reading = [change for change in changes if touches_reading(change)]
+    filtered = time.perf_counter() - started
+
+    started = time.perf_counter()
+    crossed = 0
+    for i, change in enumerate(reading):
+        crossed += len(index.apply(members[i % len(members)], [change]))
+    applied = time.perf_counter() - started
+
+    total = filtered + applied
+    print(f"{count} changes, {len(reading)} onto or off the reading shelf, {crossed} crossings")
+    print(f"filter {filtered / count * 1e9:.0f} ns/change  apply {applied / max(len(reading), 1) * 1e9:.0f} ns/reading change  "
+          f"overall {total / count * 1e9:.0f} ns/change")
+
+    # A feed change costs a network fetch and a transaction; the check has to stay out of sight next to that
+    assert total / count < 5e-6, "reader index check too slow"
+    # Each book is queued at most once per guild while it waits for its thread
+    assert crossed == len(index.queued)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -3,9 +3,14 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import os
+import hashlib
+import json
+import time
 from database.connection import AsyncSessionLocal
 import database.crud as crud
-from database.models import Server, init_db
+from database.models import init_db
+from database.server_config import server_config_cache
+from database.book_index import book_index
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,47 +24,117 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# SHARD_COUNT / SHARD_IDS pin this process to a subset of shards; unset lets discord.py pick
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS").split(",")] if os.getenv("SHARD_IDS") else None
+
+bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+
+# Startup timings, exposed by the web server
+PROCESS_STARTED = time.monotonic()
+startup_metrics = {
+    "cold_start_seconds": None,
+    "command_sync_skipped": None,
+    "reconnects": 0,
+    "last_reconnect_seconds": None,
+    "shards": [],
+}
+_startup_done = False
+_disconnected_at: dict[int, float] = {}
+
+def command_tree_hash() -> str:
+    payload = sorted((cmd.to_dict() for cmd in bot.tree.get_commands()), key=lambda cmd: cmd["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands_if_changed(session) -> bool:
+    """
+    Syncs the global command tree only when its hash differs from the last synced one.
+    Returns True if a sync was performed.
+    """
+    state_key = "command_tree_hash:global"
+    current_hash = command_tree_hash()
+    if await crud.get_bot_state(session, state_key) == current_hash:
+        logging.info("Command tree unchanged since last sync, skipping sync.")
+        return False
+    synced = await bot.tree.sync()
+    for cmd in synced:
+        logging.info(f"Synced command: {cmd.name}")
+    await crud.set_bot_state(session, state_key, current_hash)
+    return True
+
+async def clear_legacy_guild_commands(session):
+    """
+    Commands used to be synced to the single guild in SERVER_ID. That guild
+    keeps its copies until they're overwritten with an empty set, and its
+    members would see every command twice; this runs once per guild.
+    """
+    if not os.getenv("SERVER_ID"):
+        return
+    guild = discord.Object(id=int(os.getenv("SERVER_ID")))
+    state_key = f"legacy_guild_commands_cleared:{guild.id}"
+    if await crud.get_bot_state(session, state_key):
+        return
+    bot.tree.clear_commands(guild=guild)
+    await bot.tree.sync(guild=guild)
+    await crud.set_bot_state(session, state_key, "1")
+    logging.info(f"Cleared the legacy guild commands of server {guild.id}.")
+
+def record_reconnect(shard_id: int):
+    disconnected_at = _disconnected_at.pop(shard_id, None)
+    if disconnected_at is None:
+        return
+    startup_metrics["reconnects"] += 1
+    startup_metrics["last_reconnect_seconds"] = round(time.monotonic() - disconnected_at, 3)
+    logging.info(f"Shard {shard_id} reconnected in {startup_metrics['last_reconnect_seconds']}s.")
 
 @bot.event
 async def on_ready():
-    server_id = int(os.getenv("SERVER_ID"))
-    guild = bot.get_guild(server_id)
-    synced = await bot.tree.sync(guild=guild)
-    for cmd in bot.tree.get_commands():
-        logging.info(f"Registered command: {cmd.name}")
-    logging.info(f"{bot.user} has connected.")
+    global _startup_done
+    # on_ready also fires after the gateway re-identifies; the setup below only needs to run once
+    if _startup_done:
+        return
+
     async with AsyncSessionLocal() as session:
-        existing_server_ids = [server.server_id for server in await crud.get_all_servers(session)]
-        for guild in bot.guilds:
-            if guild.id not in existing_server_ids:
-                new_server = Server(server_id=guild.id, server_name=guild.name)
-                session.add(new_server)
-                await session.commit()
-                logging.info(f"Added new server to DB: {guild.name} ({guild.id})")
-            else:
-                logging.info(f"Server already exists in DB: {guild.name} ({guild.id})")
-    print("Synced commands:")
-    for cmd in synced:
-        print(f" - {cmd.name}")
-        
+        await clear_legacy_guild_commands(session)
+        synced = await sync_commands_if_changed(session)
+        await crud.save_servers(session, bot.guilds)
+    logging.info(f"Reconciled {len(bot.guilds)} servers with the DB.")
+
+    _startup_done = True
+    startup_metrics["command_sync_skipped"] = not synced
+    startup_metrics["cold_start_seconds"] = round(time.monotonic() - PROCESS_STARTED, 3)
+    startup_metrics["shards"] = sorted(bot.shards.keys())
+    logging.info(f"{bot.user} has connected on shards {startup_metrics['shards']} in {startup_metrics['cold_start_seconds']}s.")
+
+@bot.event
+async def on_shard_disconnect(shard_id: int):
+    _disconnected_at.setdefault(shard_id, time.monotonic())
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    record_reconnect(shard_id)
+
+@bot.event
+async def on_shard_resumed(shard_id: int):
+    record_reconnect(shard_id)
+
 @bot.event
 async def on_guild_join(guild):
     async with AsyncSessionLocal() as session:
-        existing_server_ids = [server.id for server in await crud.get_all_servers(session)]
-        if guild.id not in existing_server_ids:
-            new_server = Server(server_id=guild.id, server_name=guild.name)
-            session.add(new_server)
-            await session.commit()
-            logging.info(f"Added new server to DB: {guild.name} ({guild.id})")
-        else:
-            logging.info(f"Server already exists in DB: {guild.name} ({guild.id})")
-        
+        await crud.save_servers(session, [guild])
+    logging.info(f"Registered server in DB: {guild.name} ({guild.id})")
+
 async def load_extensions():
     await bot.load_extension("cogs.user_commands")
     await bot.load_extension("cogs.scheduler")
-    
+    await bot.load_extension("cogs.outbox")
+    await bot.load_extension("cogs.polls")
+    await bot.load_extension("cogs.discussions")
+
 async def run_discord_bot():
     await init_db()
+    server_config_cache.start_listener()
+    # Autocomplete falls back to the database until the index has loaded
+    book_index.start_loading()
     await load_extensions()
-    await bot.start(TOKEN)
\ No newline at end of file
+    await bot.start(TOKEN)
@@ -1,9 +1,10 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 from typing import Optional
 from datetime import datetime
 
-@dataclass
+@dataclass(slots=True)
 class FeedEntry:
+    # Slotted: a large shelf holds thousands of these at once
     book_id: int
     title: str
     author: Optional[str]
@@ -13,4 +14,15 @@ class FeedEntry:
     rating: Optional[int]
     average_rating: Optional[float]
     review: Optional[str]
-    published: datetime
\ No newline at end of file
+    published: datetime
+
+    def to_dict(self) -> dict:
+        # JSON-safe form, used for outbox payloads
+        data = asdict(self)
+        data["published"] = self.published.isoformat() if self.published else None
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FeedEntry":
+        published = datetime.fromisoformat(data["published"]) if data.get("published") else None
+        return cls(**{**data, "published": published})
\ No newline at end of file
@@ -0,0 +1,109 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MANUAL_PRIORITY = 0
+SCHEDULED_PRIORITY = 1
+
+@dataclass(order=True)
+class FeedJob:
+    priority: int
+    sequence: int
+    key: Hashable = field(compare=False)
+    run: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+class FeedCoordinator:
+    """
+    Single-flight queue for feed cycles.
+
+    Jobs are keyed (e.g. ("server", server_id)); submitting a key that is already
+    queued or running returns the existing job's future instead of starting a
+    second run. Manual requests are ordered ahead of scheduled work and also get
+    a dedicated worker, so they never wait behind a long scheduled cycle.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.queue: list[FeedJob] = []
+        self.jobs: dict[Hashable, FeedJob] = {}
+        self.running: set[Hashable] = set()
+        self.sequence = itertools.count()
+        self.wakeup: asyncio.Event | None = None
+        self.worker_tasks: list[asyncio.Task] = []
+
+    def submit(self, key: Hashable, run: Callable[[], Awaitable[Any]], priority: int = SCHEDULED_PRIORITY) -> tuple[asyncio.Future, int]:
+        """
+        Queues `run` under `key` unless a job with that key is already pending.
+        Returns the job's future and its queue position (0 means running now).
+        The future is shared, so callers await it through asyncio.shield: cancelling
+        one waiter must not cancel the run for the others.
+        """
+        self._ensure_started()
+        job = self.jobs.get(key)
+        if job:
+            if key not in self.running and priority < job.priority:
+                # A manual request for a queued scheduled job moves it into the priority lane
+                job.priority = priority
+                heapq.heapify(self.queue)
+                self.wakeup.set()
+            return job.future, self.position(key)
+
+        job = FeedJob(priority, next(self.sequence), key, run, asyncio.get_running_loop().create_future())
+        self.jobs[key] = job
+        heapq.heappush(self.queue, job)
+        self.wakeup.set()
+        return job.future, self.position(key)
+
+    def position(self, key: Hashable) -> int:
+        if key in self.running or key not in self.jobs:
+            return 0
+        job = self.jobs[key]
+        return 1 + sum(1 for other in self.queue if other < job)
+
+    def is_pending(self, key: Hashable) -> bool:
+        return key in self.jobs
+
+    def _ensure_started(self):
+        if self.worker_tasks:
+            return
+        self.wakeup = asyncio.Event()
+        self.worker_tasks = [asyncio.create_task(self._worker(manual_only=False)) for _ in range(self.workers)]
+        self.worker_tasks.append(asyncio.create_task(self._worker(manual_only=True)))
+
+    def _next_job(self, manual_only: bool) -> FeedJob | None:
+        if not self.queue:
+            return None
+        if manual_only and self.queue[0].priority != MANUAL_PRIORITY:
+            return None
+        return heapq.heappop(self.queue)
+
+    async def _worker(self, manual_only: bool):
+        while True:
+            job = self._next_job(manual_only)
+            if job is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            self.running.add(job.key)
+            try:
+                result = await job.run()
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                logging.error(f"Feed job {job.key} failed: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.running.discard(job.key)
+                self.jobs.pop(job.key, None)
+
+coordinator = FeedCoordinator(workers=int(os.getenv("FEED_WORKERS", 1)))
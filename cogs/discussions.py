@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv
+
+import database.crud as crud
+from cogs.feed_diff import ShelfChange
+from cogs.message_sender import build_discussion_thread_embed, truncate
+from database.connection import AsyncSessionLocal
+from database.server_config import server_config_cache
+
+load_dotenv()
+
+# A book gets a discussion thread once this many of a guild's members are reading it
+DISCUSSION_THREAD_READERS = int(os.getenv("DISCUSSION_THREAD_READERS", 3))
+READING_SHELF = "currently-reading"
+
+_crossings: asyncio.Queue = asyncio.Queue()
+
+def touches_reading(change: ShelfChange) -> bool:
+    # Only changes onto or off the reading shelf move the index; everything else costs these two comparisons
+    entry_reading = change.entry is not None and change.entry.shelf == READING_SHELF
+    previous_reading = change.previous is not None and change.previous.shelf == READING_SHELF
+    return entry_reading != previous_reading
+
+class ReaderIndex:
+    """
+    Who is reading what, per guild: server_id -> book_id -> reader user ids.
+
+    Loaded once at startup and then kept current from the feed diff's shelf
+    changes, so spotting a book that crosses DISCUSSION_THREAD_READERS never
+    rescans the shelves. `opened` holds the (server_id, book_id) pairs whose
+    thread has been saved, and `queued` the crossings waiting for one, so a book
+    is queued at most once per guild until its thread exists.
+    """
+
+    def __init__(self):
+        self.readers: dict[int, dict[int, set[int]]] = {}
+        self.opened: set[tuple[int, int]] = set()
+        self.queued: set[tuple[int, int]] = set()
+        self.loaded = False
+        self.loader: asyncio.Task | None = None
+
+    def add(self, server_id: int, user_id: int, book_id: int) -> bool:
+        # Returns whether this reader takes the book over the threshold
+        readers = self.readers.setdefault(server_id, {}).setdefault(book_id, set())
+        if user_id in readers:
+            return False
+        readers.add(user_id)
+        # Readers added while loading are checked by the sweep at the end of load()
+        if not self.loaded or len(readers) < DISCUSSION_THREAD_READERS:
+            return False
+        return self.queue(server_id, book_id)
+
+    def queue(self, server_id: int, book_id: int) -> bool:
+        if (server_id, book_id) in self.opened or (server_id, book_id) in self.queued:
+            return False
+        self.queued.add((server_id, book_id))
+        return True
+
+    def mark_opened(self, server_id: int, book_id: int):
+        self.opened.add((server_id, book_id))
+
+    def settle(self, server_id: int, book_id: int):
+        # The crossing was handled; unless a thread was saved, the next reader may queue it again
+        self.queued.discard((server_id, book_id))
+
+    def discard(self, server_id: int, user_id: int, book_id: int):
+        books = self.readers.get(server_id)
+        if books is None or book_id not in books:
+            return
+        books[book_id].discard(user_id)
+        if not books[book_id]:
+            del books[book_id]
+
+    def remove_member(self, server_id: int, user_id: int):
+        for book_id in list(self.readers.get(server_id, ())):
+            self.discard(server_id, user_id, book_id)
+
+    def count(self, server_id: int, book_id: int) -> int:
+        return len(self.readers.get(server_id, {}).get(book_id, ()))
+
+    def apply(self, members, changes: list[ShelfChange]) -> list[tuple[int, int]]:
+        """
+        Applies one account's reading-shelf changes to each of its guild
+        memberships. Returns the (server_id, book_id) pairs that crossed the threshold.
+        """
+        crossed = []
+        for change in changes:
+            reading = change.entry is not None and change.entry.shelf == READING_SHELF
+            for member in members:
+                if not reading:
+                    self.discard(member.server_id, member.user_id, change.book_id)
+                elif self.add(member.server_id, member.user_id, change.book_id):
+                    crossed.append((member.server_id, change.book_id))
+        return crossed
+
+    async def load(self) -> list[tuple[int, int]]:
+        async with AsyncSessionLocal() as session:
+            # Threads first: nothing may trigger before they're known
+            self.opened.update((row.server_id, row.book_id) for row in await crud.get_discussion_threads(session))
+            rows = await crud.get_current_readers(session, READING_SHELF)
+        for row in rows:
+            self.readers.setdefault(row.server_id, {}).setdefault(row.book_id, set()).add(row.user_id)
+        self.loaded = True
+        logging.info(f"Indexed {len(rows)} current readers across {len(self.readers)} servers.")
+        # Books already over the threshold, whether stored that way or crossed by a change during the load
+        return [
+            (server_id, book_id)
+            for server_id, books in self.readers.items()
+            for book_id, readers in books.items()
+            if len(readers) >= DISCUSSION_THREAD_READERS and self.queue(server_id, book_id)
+        ]
+
+    def start_loading(self):
+        if self.loader is None:
+            self.loader = asyncio.create_task(load_reader_index(self))
+
+reader_index = ReaderIndex()
+
+async def load_reader_index(index: ReaderIndex):
+    for crossing in await index.load():
+        _crossings.put_nowait(crossing)
+
+def record_changes(members, changes: list[ShelfChange]):
+    # Called by the feed cycle with an account's memberships and its reading-shelf changes
+    for crossing in reader_index.apply(members, changes):
+        _crossings.put_nowait(crossing)
+
+def record_member(server_id: int, user_id: int, book_ids):
+    # A newly registered member's reading shelf
+    for book_id in book_ids:
+        if reader_index.add(server_id, user_id, int(book_id)):
+            _crossings.put_nowait((server_id, int(book_id)))
+
+class DiscussionThreads(commands.Cog):
+    """
+    Opens a discussion thread in a guild's forum channel for each book the reader
+    index reports as crossing the threshold.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.task: asyncio.Task | None = None
+
+    async def cog_load(self):
+        reader_index.start_loading()
+        self.task = asyncio.create_task(self.run())
+
+    async def cog_unload(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            server_id, book_id = await _crossings.get()
+            try:
+                await self.open_thread(server_id, book_id)
+            except Exception as e:
+                logging.error(f"Failed to open a discussion thread for book {book_id} on server {server_id}: {e}")
+            finally:
+                reader_index.settle(server_id, book_id)
+
+    async def open_thread(self, server_id: int, book_id: int):
+        # Readers may have moved on while the crossing waited in the queue
+        if self.bot.get_guild(server_id) is None or reader_index.count(server_id, book_id) < DISCUSSION_THREAD_READERS:
+            return
+        config = await server_config_cache.get(server_id)
+        forum = self.bot.get_channel(config.channel_id) if config.channel_type == "forum" and config.channel_id else None
+        if not isinstance(forum, discord.ForumChannel):
+            logging.info(f"Book {book_id} has {reader_index.count(server_id, book_id)} readers on server {server_id}, but there is no forum channel to discuss it in.")
+            return
+
+        async with AsyncSessionLocal() as session:
+            if await crud.get_discussion_thread(session, server_id, book_id):
+                # Opened by another worker since the index loaded
+                reader_index.mark_opened(server_id, book_id)
+                return
+            book = await crud.get_book(session, book_id)
+            if book is None:
+                return
+            created = await forum.create_thread(
+                name=truncate(book.title, 100),
+                embed=build_discussion_thread_embed(book.title, book.author, book.goodreads_url, book.cover_image_url),
+            )
+            await crud.save_discussion_thread(session, server_id, book_id, created.thread.id)
+        reader_index.mark_opened(server_id, book_id)
+        logging.info(f"Opened discussion thread for {book.title} on server {server_id} ({reader_index.count(server_id, book_id)} readers).")
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(DiscussionThreads(bot))
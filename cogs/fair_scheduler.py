@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Member syncs in flight per feed cycle, overall and per guild
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", 4))
+FEED_GUILD_CONCURRENCY = int(os.getenv("FEED_GUILD_CONCURRENCY", 2))
+
+def parse_weights(value: str) -> dict[int, float]:
+    # "server_id:weight,server_id:weight"; unlisted guilds weigh 1
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            server_id, weight = item.split(":")
+            weights[int(server_id)] = max(float(weight), 0.01)
+        except ValueError:
+            logging.warning(f"Ignoring malformed FEED_GUILD_WEIGHTS entry '{item}'")
+    return weights
+
+FEED_GUILD_WEIGHTS = parse_weights(os.getenv("FEED_GUILD_WEIGHTS", ""))
+
+@dataclass
+class GuildLane:
+    server_id: int
+    weight: float
+    items: deque
+    # Virtual time at which the lane's next item starts
+    start: float = 0.0
+    running: int = 0
+    results: list = field(default_factory=list)
+
+class FairScheduler:
+    """
+    Start-time fair queueing of member syncs across guilds.
+
+    Every dispatched member advances its guild's virtual clock by 1/weight, and the
+    next member always comes from the guild with the earliest clock that is below
+    its concurrency cap. Guilds therefore take turns in proportion to their weights:
+    a 500-member guild gets no more turns per round than a 5-member one, and every
+    guild's first member is dispatched within the first round of the cycle.
+    """
+
+    def __init__(self, concurrency: int = FEED_CONCURRENCY, guild_concurrency: int = FEED_GUILD_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.guild_concurrency = max(1, guild_concurrency)
+        self.lanes: dict[int, GuildLane] = {}
+        self.clock = 0.0
+
+    def add(self, server_id: int, items: list, weight: float | None = None):
+        if weight is None:
+            weight = FEED_GUILD_WEIGHTS.get(server_id, 1.0)
+        lane = self.lanes.get(server_id)
+        if lane is None:
+            # A guild joining mid-cycle starts at the current virtual time instead of catching up
+            self.lanes[server_id] = GuildLane(server_id, weight, deque(items), start=self.clock)
+        else:
+            lane.items.extend(items)
+
+    def next_item(self) -> tuple[GuildLane, Any] | None:
+        eligible = [lane for lane in self.lanes.values() if lane.items and lane.running < self.guild_concurrency]
+        if not eligible:
+            return None
+        lane = min(eligible, key=lambda lane: (lane.start, lane.server_id))
+        self.clock = max(self.clock, lane.start)
+        lane.start += 1 / lane.weight
+        lane.running += 1
+        return lane, lane.items.popleft()
+
+    async def run(self, work: Callable[[int, Any], Awaitable[Any]]) -> dict[int, list]:
+        """
+        Runs `work(server_id, item)` for every queued item and returns each guild's
+        results (exceptions included, in completion order).
+        """
+        running: dict[asyncio.Task, GuildLane] = {}
+        while True:
+            while len(running) < self.concurrency and (picked := self.next_item()):
+                lane, item = picked
+                running[asyncio.create_task(work(lane.server_id, item))] = lane
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                lane = running.pop(task)
+                lane.running -= 1
+                if task.exception() is not None:
+                    logging.error(f"Feed sync for server {lane.server_id} failed: {task.exception()}")
+                    lane.results.append(task.exception())
+                else:
+                    lane.results.append(task.result())
+        return {server_id: lane.results for server_id, lane in self.lanes.items()}
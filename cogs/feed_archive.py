@@ -0,0 +1,185 @@
+import base64
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+
+from dotenv import load_dotenv
+
+from cogs.feed_health import FeedUnavailableError
+
+load_dotenv()
+
+# FEED_ARCHIVE_MODE: unset (live), "record" or "replay"
+FEED_ARCHIVE_MODE = os.getenv("FEED_ARCHIVE_MODE", "").lower()
+FEED_ARCHIVE_PATH = os.getenv("FEED_ARCHIVE_PATH", "feed_archive.jsonl.gz")
+# FEED_REPLAY_TIMING: "original" serves each response at its recorded offset from the start of the run, "fast" serves immediately
+FEED_REPLAY_TIMING = os.getenv("FEED_REPLAY_TIMING", "original").lower()
+
+USER_AGENT = "ReadzBot (+https://github.com/marcintomala/ReadzBot)"
+
+
+class FeedRecorder:
+    """
+    Appends raw feed responses to a gzip-compressed JSON-lines archive.
+    Each record holds the URL, the offset from the start of the recording at
+    which the response arrived, the time the fetch took and the base64-encoded
+    body. Failed fetches are recorded too: HTTP errors with their status code
+    (and error body), requests that got no response at all with their error.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, url: str, body: bytes, elapsed: float, status: int | None = None, error: str | None = None):
+        record = {
+            "url": url,
+            "offset": round(time.monotonic() - self.started, 4),
+            "elapsed": round(elapsed, 4),
+            "body": base64.b64encode(body).decode("ascii"),
+        }
+        if status is not None:
+            record["status"] = status
+        if error is not None:
+            record["error"] = error
+        with self.lock, gzip.open(self.path, "at", encoding="utf-8") as archive:
+            archive.write(json.dumps(record) + "\n")
+
+
+class FeedReplayer:
+    """
+    Serves feed bodies from an archive written by FeedRecorder.
+    Responses for the same URL are served in recorded order; once exhausted,
+    the last one keeps being served so repeated cycles stay reproducible.
+    With "original" timing a response isn't served before its recorded offset
+    from the start of the run (the replayer's creation), so the run keeps
+    the recording's pacing and the overlap between concurrent fetches.
+    """
+
+    def __init__(self, path: str, timing: str = "original"):
+        self.timing = timing
+        self.started = time.monotonic()
+        self.responses: dict[str, deque] = defaultdict(deque)
+        self.last: dict[str, dict] = {}
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record["url"]].append(record)
+        logging.info(f"Loaded {sum(len(r) for r in self.responses.values())} recorded feed responses from {path}")
+
+    def urls(self) -> list[str]:
+        return list(self.responses.keys())
+
+    def replay(self, url: str) -> tuple[bytes, int | None]:
+        """
+        Returns the body and, for a recorded HTTP error, the status of the next
+        response for url. Raises FeedUnavailableError for a recorded fetch that
+        got no response, KeyError for a URL that was never recorded.
+        """
+        if self.responses[url]:
+            record = self.responses[url].popleft()
+            self.last[url] = record
+        elif url in self.last:
+            record = self.last[url]
+        else:
+            raise KeyError(f"No recorded response for {url}")
+        if self.timing == "original":
+            time.sleep(max(record["offset"] - (time.monotonic() - self.started), 0))
+        if "error" in record:
+            raise FeedUnavailableError(record["error"])
+        return base64.b64decode(record["body"]), record.get("status")
+
+
+_recorder: FeedRecorder | None = None
+_replayer: FeedReplayer | None = None
+
+
+def _download(url: str) -> bytes:
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def fetch_feed(url: str):
+    """
+    Fetch and parse a feed, honouring FEED_ARCHIVE_MODE.
+    Live mode leaves fetching to feedparser, record mode downloads the raw bytes
+    and appends them to the archive, replay mode never touches the network.
+    Raises FeedUnavailableError when there is no response at all to parse.
+    """
+    global _recorder, _replayer
+    import feedparser as fp  # imported on first fetch to keep startup light
+
+    if FEED_ARCHIVE_MODE == "replay":
+        if _replayer is None:
+            _replayer = FeedReplayer(FEED_ARCHIVE_PATH, FEED_REPLAY_TIMING)
+        try:
+            body, status = _replayer.replay(url)
+        except KeyError as e:
+            raise FeedUnavailableError(e.args[0]) from e
+        feed = fp.parse(body)
+        if status is not None:
+            feed["status"] = status
+        return feed
+
+    if FEED_ARCHIVE_MODE == "record":
+        if _recorder is None:
+            _recorder = FeedRecorder(FEED_ARCHIVE_PATH)
+        started = time.monotonic()
+        try:
+            body = _download(url)
+        except urllib.error.HTTPError as e:
+            # Parse the error response already in hand rather than fetching the URL again
+            logging.error(f"Failed to fetch {url} for recording: HTTP {e.code}")
+            body = e.read()
+            _recorder.record(url, body, time.monotonic() - started, status=e.code)
+            feed = fp.parse(body)
+            feed["status"] = e.code
+            return feed
+        except Exception as e:
+            error = f"Failed to fetch {url}: {e}"
+            _recorder.record(url, b"", time.monotonic() - started, error=error)
+            raise FeedUnavailableError(error) from e
+        _recorder.record(url, body, time.monotonic() - started)
+        return fp.parse(body)
+
+    return fp.parse(url)
+
+
+if __name__ == "__main__":
+    # Replay a recorded archive through the feed readers and report timings:
+    #   FEED_ARCHIVE_MODE=replay FEED_REPLAY_TIMING=fast python -m cogs.feed_archive
+    import re
+    from cogs.feed_read import read_feed, read_progress_update_feed
+
+    if FEED_ARCHIVE_MODE != "replay":
+        raise SystemExit("Set FEED_ARCHIVE_MODE=replay to run a replay.")
+
+    recorded_urls = FeedReplayer(FEED_ARCHIVE_PATH, "fast").urls()
+    total_started = time.perf_counter()
+    for url in recorded_urls:
+        if re.search(r"[?&]page=(?!1\b)", url):
+            # Later shelf pages are replayed as part of their first page
+            continue
+        goodreads_user_id = re.search(r"/(\d+)", url).group(1)
+        started = time.perf_counter()
+        try:
+            if "user_status" in url:
+                result = read_progress_update_feed(goodreads_user_id)
+                count = 1 if result else 0
+            else:
+                count = sum(1 for _ in read_feed(goodreads_user_id))
+        except FeedUnavailableError as e:
+            # Recorded failures are replayed as failures
+            print(f"{time.perf_counter() - started:8.3f}s  failed         {url}: {e}")
+            continue
+        print(f"{time.perf_counter() - started:8.3f}s  {count:5d} entries  {url}")
+    print(f"Replayed {len(recorded_urls)} feeds in {time.perf_counter() - total_started:.3f}s")
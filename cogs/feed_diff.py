@@ -0,0 +1,86 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+from cogs.FeedEntry import FeedEntry
+
+ADDED = "added"
+MOVED = "moved"
+RATED = "rated"
+RERATED = "rerated"
+REVIEWED = "reviewed"
+REMOVED = "removed"
+
+MISSING = object()
+
+# Rating changes alone are only announced for books that have been read
+ANNOUNCED_RATING_SHELVES = {"read"}
+
+def review_hash(review: str | None) -> str | None:
+    # Matches md5(review) in the database, so stored reviews are compared without loading their text
+    return hashlib.md5(review.encode()).hexdigest() if review else None
+
+@dataclass(slots=True)
+class ShelfChange:
+    """
+    One changed book. `events` holds its typed events; it is empty for edits that
+    only need to be stored (a cleared review, a new shelving date).
+    """
+    book_id: int
+    events: tuple[str, ...]
+    # The book as it is in the feed now; None for removals
+    entry: FeedEntry | None = None
+    # The stored (book_id, shelf, rating, review_hash, review_date) row; None for additions
+    previous: Any = None
+
+    @property
+    def announced(self) -> bool:
+        for event in self.events:
+            if event in (ADDED, MOVED, REVIEWED):
+                return True
+            if event in (RATED, RERATED) and self.entry.rating and self.entry.shelf in ANNOUNCED_RATING_SHELVES:
+                return True
+        return False
+
+def diff_shelf(stored: dict[int, Any], feed_entries: Iterable[FeedEntry]) -> Iterator[ShelfChange]:
+    """
+    Streams the changes between the stored shelf snapshot (book_id -> row, as
+    returned by `crud.get_account_shelf`) and the feed, comparing by book_id.
+    Unchanged entries are dropped as soon as they've been compared, so beyond the
+    snapshot only the changes are held. The snapshot is consumed: compared books
+    are marked in place, and the rest are yielded as removals at the end.
+    A book listed twice in the feed is compared once, on its first entry: the feed
+    lists the newest shelvings first, and a repeat only comes from the pages
+    shifting between requests, so later listings are stale.
+    """
+    added = set()
+    for entry in feed_entries:
+        book_id = int(entry.book_id)
+        previous = stored.get(book_id, MISSING)
+        if previous is None or book_id in added:
+            # Already compared
+            continue
+        if previous is MISSING:
+            added.add(book_id)
+            yield ShelfChange(book_id, (ADDED,), entry)
+            continue
+        stored[book_id] = None
+
+        events = []
+        rating = entry.rating or 0
+        previous_rating = previous.rating or 0
+        entry_review_hash = review_hash(entry.review)
+        if entry.shelf != previous.shelf:
+            events.append(MOVED)
+        if rating != previous_rating:
+            events.append(RATED if not previous_rating else RERATED)
+        if entry_review_hash and entry_review_hash != previous.review_hash:
+            events.append(REVIEWED)
+
+        published = entry.published.replace(tzinfo=None) if entry.published and entry.published.tzinfo else entry.published
+        if events or entry_review_hash != previous.review_hash or published != previous.review_date:
+            yield ShelfChange(book_id, tuple(events), entry, previous)
+
+    for book_id, previous in stored.items():
+        if previous is not None:
+            yield ShelfChange(book_id, (REMOVED,), previous=previous)
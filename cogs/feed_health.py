@@ -0,0 +1,79 @@
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FEED_FAILURE_THRESHOLD = int(os.getenv("FEED_FAILURE_THRESHOLD", 3))
+FEED_BACKOFF_BASE_MINUTES = int(os.getenv("FEED_BACKOFF_BASE_MINUTES", 30))
+FEED_BACKOFF_MAX_HOURS = int(os.getenv("FEED_BACKOFF_MAX_HOURS", 24))
+
+class FeedUnavailableError(Exception):
+    """Raised when a Goodreads feed can't be fetched or parsed (private, deleted or malformed)."""
+
+@dataclass
+class FeedState:
+    failures: int = 0
+    last_error: str | None = None
+    last_failure_at: datetime | None = None
+    next_attempt_at: datetime | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= FEED_FAILURE_THRESHOLD
+
+class FeedHealth:
+    """
+    Per-feed circuit breaker.
+
+    Failures below FEED_FAILURE_THRESHOLD are retried on the next cycle as usual.
+    Past the threshold the circuit opens and the feed is only probed after an
+    exponentially growing delay (capped at FEED_BACKOFF_MAX_HOURS); a successful
+    probe closes it again.
+    """
+
+    def __init__(self):
+        self.states: dict[tuple[str, str], FeedState] = {}
+
+    def should_fetch(self, goodreads_user_id: str, feed: str) -> bool:
+        state = self.states.get((goodreads_user_id, feed))
+        if state is None or not state.is_open:
+            return True
+        return datetime.now(timezone.utc) >= state.next_attempt_at
+
+    def record_success(self, goodreads_user_id: str, feed: str):
+        state = self.states.pop((goodreads_user_id, feed), None)
+        if state and state.is_open:
+            logging.info(f"{feed} feed for Goodreads user {goodreads_user_id} recovered after {state.failures} failures.")
+
+    def record_failure(self, goodreads_user_id: str, feed: str, error: str):
+        state = self.states.setdefault((goodreads_user_id, feed), FeedState())
+        now = datetime.now(timezone.utc)
+        state.failures += 1
+        state.last_error = error
+        state.last_failure_at = now
+        if state.is_open:
+            delay = timedelta(minutes=FEED_BACKOFF_BASE_MINUTES * 2 ** (state.failures - FEED_FAILURE_THRESHOLD))
+            state.next_attempt_at = now + min(delay, timedelta(hours=FEED_BACKOFF_MAX_HOURS))
+            logging.warning(f"{feed} feed for Goodreads user {goodreads_user_id} failed {state.failures} times, next probe at {state.next_attempt_at}: {error}")
+        else:
+            logging.warning(f"{feed} feed for Goodreads user {goodreads_user_id} failed ({state.failures}/{FEED_FAILURE_THRESHOLD}): {error}")
+
+    def tripped(self) -> list[dict]:
+        return [
+            {
+                "goodreads_user_id": goodreads_user_id,
+                "feed": feed,
+                "failures": state.failures,
+                "last_error": state.last_error,
+                "last_failure_at": state.last_failure_at.isoformat(),
+                "next_attempt_at": state.next_attempt_at.isoformat(),
+            }
+            for (goodreads_user_id, feed), state in sorted(self.states.items())
+            if state.is_open
+        ]
+
+feed_health = FeedHealth()
@@ -0,0 +1,64 @@
+import logging
+import os
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# A guild whose 95th percentile exceeds this is logged as over budget
+FEED_LATENCY_BUDGET_SECONDS = int(os.getenv("FEED_LATENCY_BUDGET_SECONDS", 300))
+FEED_LATENCY_SAMPLES = int(os.getenv("FEED_LATENCY_SAMPLES", 200))
+
+WAIT = "wait"
+DELIVERY = "delivery"
+
+def percentile(samples, q: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class FeedLatency:
+    """
+    Per-guild latency from a feed change to its Discord post, in two legs:
+    `wait`, from the start of a feed cycle until a member's sync has queued its
+    notifications, and `delivery`, from the queued outbox message until it's posted.
+    Keeps the last FEED_LATENCY_SAMPLES samples of each.
+    """
+
+    def __init__(self):
+        self.samples: dict[tuple[int, str], deque] = {}
+
+    def record(self, server_id: int, leg: str, seconds: float):
+        samples = self.samples.setdefault((server_id, leg), deque(maxlen=FEED_LATENCY_SAMPLES))
+        samples.append(max(0.0, seconds))
+
+    def p95(self, server_id: int, leg: str) -> float | None:
+        return percentile(self.samples.get((server_id, leg)), 0.95)
+
+    def summary(self, server_id: int) -> dict:
+        wait = self.p95(server_id, WAIT)
+        delivery = self.p95(server_id, DELIVERY)
+        total = (wait or 0.0) + (delivery or 0.0) if wait is not None or delivery is not None else None
+        return {
+            "server_id": server_id,
+            "wait_p95": wait,
+            "delivery_p95": delivery,
+            "total_p95": total,
+            "over_budget": total is not None and total > FEED_LATENCY_BUDGET_SECONDS,
+        }
+
+    def summaries(self) -> list[dict]:
+        return [self.summary(server_id) for server_id in sorted({server_id for server_id, _ in self.samples})]
+
+    def check_budget(self, server_id: int):
+        summary = self.summary(server_id)
+        if summary["over_budget"]:
+            logging.warning(
+                f"Feed latency for server {server_id} is over budget: p95 {summary['total_p95']:.0f}s "
+                f"(wait {summary['wait_p95'] or 0:.0f}s, delivery {summary['delivery_p95'] or 0:.0f}s) "
+                f"> {FEED_LATENCY_BUDGET_SECONDS}s"
+            )
+
+feed_latency = FeedLatency()
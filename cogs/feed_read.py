@@ -1,17 +1,52 @@
-import feedparser as fp
 from database.connection import AsyncSessionLocal
 import database.crud as crud
-from database.models import UserBook
+from database.server_config import server_config_cache
+from database import stats
+from database.stats import StatsDelta
+from database.book_index import book_index
 from datetime import datetime
-from cogs.message_sender import send_update_message, send_progress_update_message
+from typing import Awaitable, Callable, Collection, Iterator
+from dotenv import load_dotenv
+from cogs import outbox, discussions
 from cogs.FeedEntry import FeedEntry
+from cogs.feed_diff import ShelfChange, diff_shelf
+from cogs.feed_archive import fetch_feed
+from cogs.coordinator import coordinator, SCHEDULED_PRIORITY
+from cogs.fair_scheduler import FairScheduler
+from cogs.feed_latency import feed_latency, WAIT
+from cogs.feed_health import feed_health, FeedUnavailableError
+from cogs.progress import parse_progress
+from collections import Counter
+import asyncio
 import logging
-from dateutil import parser as date_parser
-import re
+import os
+import time
+
+load_dotenv()
+
+# One fetch and diff per Goodreads account per cycle, however many guilds it's registered in
+ACCOUNT_SYNC_MIN_SECONDS = int(os.getenv("ACCOUNT_SYNC_MIN_SECONDS", 120))
+# Onboarding and resyncs page through the whole shelf; the periodic sync only reads
+# the newest FEED_SYNC_PAGES pages, which is where new shelf activity appears
+FEED_MAX_PAGES = int(os.getenv("FEED_MAX_PAGES", 200))
+FEED_SYNC_PAGES = int(os.getenv("FEED_SYNC_PAGES", 1))
+_account_syncs: dict[str, asyncio.Task] = {}
+_account_last_synced: dict[str, float] = {}
+_account_locks: dict[str, asyncio.Lock] = {}
+
+def check_feed(feed, url: str):
+    # Private profiles, deleted accounts and broken responses come back as HTTP errors or unparseable documents
+    status = feed.get("status")
+    if status is not None and status >= 400:
+        raise FeedUnavailableError(f"HTTP {status} for {url}")
+    if feed.get("bozo") and not feed.entries:
+        raise FeedUnavailableError(f"Malformed feed at {url}: {feed.get('bozo_exception')}")
 
 def read_progress_update_feed(goodreads_user_id: str) -> list[dict]:
+    from dateutil import parser as date_parser
     RSS_URL = f'https://www.goodreads.com/user_status/list/{goodreads_user_id}?format=rss'
-    feed = fp.parse(RSS_URL)
+    feed = fetch_feed(RSS_URL)
+    check_feed(feed, RSS_URL)
     entries = []
     
     for entry in feed.entries:
@@ -31,23 +66,31 @@ def read_progress_update_feed(goodreads_user_id: str) -> list[dict]:
     return get_latest_progress_updates(entries[0])
 
 def get_latest_progress_updates(entry: dict) -> dict:
-    # Patterns for percentage and page-based updates
-    percent_pattern = re.compile(r"(.+?) is (\d+)% done with (.+)")
-    page_pattern = re.compile(r"(.+?) is on page (\d+) of (\d+) of (.+)")
-    
-    if percent_match := percent_pattern.match(entry['value']):
-        user_name, percent, book_title = percent_match.groups()
-    elif page_match := page_pattern.match(entry['value']):
-        user_name, page, total, book_title = page_match.groups()
+    progress = parse_progress(entry['value'])
+    if progress is None:
+        logging.info(f"Latest status is not a progress update: {entry['value']}")
+        return None
 
-    logging.info(f"Processing progress update for book: {book_title}")
-    entry['book_title'] = book_title
+    logging.info(f"Processing progress update for book: {progress['book_title']}")
+    entry['book_title'] = progress['book_title']
+    entry['percent'] = progress['percent']
+    entry['page'] = progress['page']
+    entry['total_pages'] = progress['total_pages']
     return entry
 
-def read_feed(goodreads_user_id: str) -> list[FeedEntry]:
-    RSS_URL = f'https://www.goodreads.com/review/list_rss/{goodreads_user_id}?shelf=all'
-    feed = fp.parse(RSS_URL)
-    entries = []
+def read_feed_page(goodreads_user_id: str, page: int = 1) -> tuple[list[FeedEntry], str | None]:
+    """
+    Fetches and parses one page of an account's shelf feed.
+    Returns the tracked entries and the id of the page's first item (None for an empty page).
+    """
+    url = f'https://www.goodreads.com/review/list_rss/{goodreads_user_id}?shelf=all&page={page}'
+    feed = fetch_feed(url)
+    check_feed(feed, url)
+    first_item = feed.entries[0].get("book_id") if feed.entries else None
+    return list(parse_feed_entries(goodreads_user_id, feed, url)), first_item
+
+def parse_feed_entries(goodreads_user_id: str, feed, url: str) -> Iterator[FeedEntry]:
+    parse_errors = 0
 
     for entry in feed.entries:
         raw_shelves = entry.get("user_shelves", "").strip().lower()
@@ -67,7 +110,7 @@ def read_feed(goodreads_user_id: str) -> list[FeedEntry]:
             continue
         
         try:
-            feed_entry = FeedEntry(
+            yield FeedEntry(
                 book_id=int(entry.book_id),
                 title=entry.title,
                 author=entry.get("author_name"),
@@ -79,67 +122,136 @@ def read_feed(goodreads_user_id: str) -> list[FeedEntry]:
                 review=raw_review if raw_review else None,
                 published=datetime.strptime(entry.published, "%a, %d %b %Y %H:%M:%S %z")
             )
-            entries.append(feed_entry)
         except Exception as e:
-            print(f"⚠️ Skipping entry due to parse error: {e}")
-    return entries
+            parse_errors += 1
+            logging.warning(f"Skipping entry in feed of Goodreads user {goodreads_user_id} due to parse error: {e}")
+    if parse_errors and parse_errors == len(feed.entries):
+        raise FeedUnavailableError(f"None of the {parse_errors} entries at {url} could be parsed")
 
-async def cleanup(server_id, user_id, user_books: list[UserBook], feed_entries: list[FeedEntry]):
-    # Check for books that are no longer in the feed
-    # and remove them from the user's list
-    current_feed_book_ids = {entry.book_id for entry in feed_entries}
+def read_feed(goodreads_user_id: str, status: dict | None = None, max_pages: int = FEED_MAX_PAGES) -> Iterator[FeedEntry]:
+    """
+    Yields the tracked entries of an account's shelf, newest first, page by page
+    up to `max_pages`, so callers can diff a huge shelf without holding all of it.
+    Records the oldest entry's date in status["oldest"], and sets status["complete"]
+    once the end of the shelf has been reached.
+    """
+    previous_first = None
+    for page in range(1, max_pages + 1):
+        entries, first_item = read_feed_page(goodreads_user_id, page)
+        # Past the last page Goodreads returns an empty page (or repeats the last one)
+        if first_item is None or first_item == previous_first:
+            if status is not None:
+                status["complete"] = True
+            return
+        previous_first = first_item
+        if status is not None and entries:
+            oldest = min(entry.published for entry in entries).replace(tzinfo=None)
+            status["oldest"] = min(status.get("oldest", oldest), oldest)
+        yield from entries
+    if max_pages == FEED_MAX_PAGES:
+        logging.warning(f"Shelf feed of Goodreads user {goodreads_user_id} has more than {FEED_MAX_PAGES} pages; the rest is ignored.")
 
-    async with AsyncSessionLocal() as session:
-        for user_book in user_books:
-            if user_book.book_id not in current_feed_book_ids:
-                await crud.delete_user_book(session, server_id, user_id, user_book.book_id)
-    return user_books
-                
-async def resolve_feed_updates(user_books: list[UserBook], feed_entries: list[FeedEntry]) -> list[FeedEntry]:
-    # Create a mapping of (book_id, shelf) -> rating for books in the database
-    db_book_info = {(user_book.book_id, user_book.shelf): user_book.rating for user_book in user_books}
-    # Find entries in the feed that are new, have a different shelf, or rating has changed
-    new_or_updated_books = []
-    for entry in feed_entries:
-        key = (int(entry.book_id), entry.shelf)
-        entry_rating = entry.rating if entry.rating is not None else 0
-        db_rating = db_book_info.get(key)
-        if key not in db_book_info:
-            new_or_updated_books.append(entry)
-        elif entry.shelf not in ["to-read", "currently-reading"] and db_rating != entry_rating:
-            new_or_updated_books.append(entry)
-    return new_or_updated_books
-        
-async def save_entries(server_id, user_id, feed_entries: list[FeedEntry]):
-    async with AsyncSessionLocal() as session:
-        for entry in feed_entries:
-            logging.info(f"Processing entry: {entry.title} by {entry.author} for user: {user_id} on shelf: {entry.shelf}")
+def read_shelf_changes(stored: dict, max_pages: int = FEED_MAX_PAGES) -> Callable[[str], list[ShelfChange]]:
+    # Streams the feed through the diff inside the reader thread; only the changes come back
+    def read(goodreads_user_id: str) -> list[ShelfChange]:
+        status = {}
+        changes = list(diff_shelf(stored, read_feed(goodreads_user_id, status, max_pages)))
+        if status.get("complete"):
+            return changes
+        # A book older than anything the pages read returned (past the pages read, or imported
+        # from a library export beyond the feed's reach) isn't gone, just out of view
+        oldest = status.get("oldest")
+        return [
+            change for change in changes
+            if change.entry is not None or (oldest is not None and change.previous.review_date is not None and change.previous.review_date >= oldest)
+        ]
+    return read
+
+def account_lock(goodreads_user_id: str) -> asyncio.Lock:
+    # Serializes everything that diffs against or writes an account's stored shelf
+    return _account_locks.setdefault(goodreads_user_id, asyncio.Lock())
+
+async def cleanup(session, goodreads_user_id: str, changes: list[ShelfChange]):
+    # Remove the books that are no longer in the feed from the account's shelves
+    await crud.delete_account_books(session, goodreads_user_id, [change.book_id for change in changes if change.entry is None], commit=False)
         
-            await crud.save_book(session, entry.book_id, entry.title, entry.author, entry.cover_image_url, entry.goodreads_url, entry.average_rating)
-            await crud.save_user_book(session, server_id, user_id, entry.book_id, entry.shelf, entry.rating, entry.review, entry.published)
-    
-async def process_feed(server_id, user_id, feed_entries: list[FeedEntry]) -> list[FeedEntry]:
-    # First get all the books for the user
-    async with AsyncSessionLocal() as session:
-        user_books = await crud.get_all_user_books(session, server_id, user_id)
-    
-    # Then clean up the database by removing books that are no longer in the feed
-    await cleanup(server_id, user_id, user_books, feed_entries)
+async def save_entries(session, goodreads_user_id: str, changes: list[ShelfChange]):
+    # Only books whose stored row changed are written
+    for change in changes:
+        entry = change.entry
+        if entry is None:
+            continue
+        logging.info(f"Processing entry: {entry.title} by {entry.author} for Goodreads user: {goodreads_user_id} on shelf: {entry.shelf}")
     
-    # Then save the feed entries
-    await save_entries(server_id, user_id, feed_entries)
+        await crud.save_book(session, entry.book_id, entry.title, entry.author, entry.cover_image_url, entry.goodreads_url, entry.average_rating)
+        await crud.save_account_book(session, goodreads_user_id, entry.book_id, entry.shelf, entry.rating, entry.review, entry.published, commit=False)
+
+def build_stats_delta(changes: list[ShelfChange]) -> StatsDelta:
+    delta = StatsDelta()
+    for change in changes:
+        if previous := change.previous:
+            delta.remove(previous.book_id, previous.shelf, previous.review_date, previous.rating)
+        if entry := change.entry:
+            delta.add(entry.book_id, entry.shelf, entry.published, entry.rating)
+    return delta
     
-    # Then resolve and return feed updates
-    return await resolve_feed_updates(user_books, feed_entries)
+async def process_feed(goodreads_user_id: str, changes: list[ShelfChange], silent_books: Collection[int] = ()) -> list[FeedEntry]:
+    """
+    Persists an account's shelf changes and queues a notification for every guild
+    the account is registered in, all in one transaction. Changes to `silent_books`
+    are stored without being announced. Returns the announced feed entries.
+    """
+    updates = [change.entry for change in changes if change.announced and change.book_id not in silent_books]
+    if not changes:
+        return updates
+    reading = [change for change in changes if discussions.touches_reading(change)]
+    logging.info(f"Shelf changes for Goodreads user {goodreads_user_id}: {dict(Counter(event for change in changes for event in change.events))}")
+    async with AsyncSessionLocal() as session:
+        # First clean up the database by removing books that are no longer in the feed
+        await cleanup(session, goodreads_user_id, changes)
+
+        # Then save the changed feed entries
+        await save_entries(session, goodreads_user_id, changes)
+
+        # Keep the reading-stats rollups in step with the shelf
+        await stats.apply_stats_delta(session, goodreads_user_id, build_stats_delta(changes))
 
-async def process_progress_update_feed(server_id, user_id, new_update_feed_entry) -> dict:
+        members = await crud.get_users_by_goodreads_id(session, goodreads_user_id) if updates or reading else []
+        # Queue the notifications alongside the shelf changes they announce
+        if updates:
+            payload = {"entries": [entry.to_dict() for entry in updates]}
+            for member in members:
+                await crud.enqueue_outbox_message(
+                    session,
+                    outbox.feed_update_key(member.server_id, member.user_id, updates),
+                    member.server_id,
+                    member.user_id,
+                    "feed_update",
+                    payload,
+                )
+        await session.commit()
+
+    book_index.add_many((change.entry.book_id, change.entry.title, change.entry.author) for change in changes if change.entry is not None)
+    if updates:
+        outbox.notify()
+    if reading:
+        discussions.record_changes(members, reading)
+    return updates
+
+async def process_progress_update_feed(goodreads_user_id: str, new_update_feed_entry: dict) -> dict | None:
+    """
+    Stores the latest progress update for every guild membership that hasn't seen
+    it yet and queues the notifications. Returns None if there is nothing to send.
+    """
+    published = new_update_feed_entry['published']
     async with AsyncSessionLocal() as session:
-        already_sent = await crud.check_sent_update(session, server_id, user_id, new_update_feed_entry['published'])
-        logging.info(f"Checking if progress update for user {user_id} on server {server_id} at {new_update_feed_entry['published']} has already been sent: {already_sent}")
-        if already_sent:
-            logging.info(f"Progress update for user {user_id} on server {server_id} at {new_update_feed_entry['published']} has already been sent. Skipping.")
+        members = []
+        for member in await crud.get_users_by_goodreads_id(session, goodreads_user_id):
+            if not await crud.check_sent_update(session, member.server_id, member.user_id, published):
+                members.append(member)
+        if not members:
+            logging.info(f"Progress update for Goodreads user {goodreads_user_id} at {published} has already been sent. Skipping.")
             return None
-        # await crud.save_new_update(session, server_id, user_id, update['value'], update['published'])
         book = await crud.get_book_by_title(session, new_update_feed_entry['book_title'])
         if not book:
             logging.warning(f"Failed to get book with title '{new_update_feed_entry['book_title']}', trying fuzzy match.")
@@ -149,60 +261,286 @@ async def process_progress_update_feed(server_id, user_id, new_update_feed_entry
             return None
         logging.info(f"Found book '{book}' for progress update.")
         new_update_feed_entry['book'] = book
-        last_update = await crud.get_last_progress_update(session, server_id, user_id, book.book_id)
-        new_update_feed_entry['last_update_message_id'] = last_update.message_id if last_update else None
-        return new_update_feed_entry
+
+        # The progress rows and their notifications are committed together; the dispatcher fills in message_id
+        for member in members:
+            progress_update = await crud.save_new_update(
+                session, None, member.server_id, member.user_id, book.book_id, new_update_feed_entry['value'], published,
+                percent=new_update_feed_entry['percent'],
+                page=new_update_feed_entry['page'],
+                total_pages=new_update_feed_entry['total_pages'],
+                commit=False,
+            )
+            await crud.enqueue_outbox_message(
+                session,
+                outbox.progress_update_key(member.server_id, member.user_id, published),
+                member.server_id,
+                member.user_id,
+                "progress_update",
+                {
+                    "progress_update_id": progress_update.id,
+                    "book_id": book.book_id,
+                    "value": new_update_feed_entry['value'],
+                    "published": published.isoformat(),
+                },
+            )
+        await session.commit()
+    outbox.notify()
+    return new_update_feed_entry
                 
-async def process(bot, server_id = None):
-    logging.info("Processing feeds started...")
+def handled_by_shard(bot, server_id: int, shard_id: int | None) -> bool:
+    # Only guilds connected to this process (and to the given shard, if any) are processed here
+    guild = bot.get_guild(server_id)
+    return guild is not None and (shard_id is None or guild.shard_id == shard_id)
+
+async def fetch_tracked(read, goodreads_user_id: str, feed: str):
+    """
+    Runs a blocking feed reader in a thread behind the per-feed circuit breaker.
+    Returns None when the feed is skipped (circuit open) or fails.
+    """
+    if not feed_health.should_fetch(goodreads_user_id, feed):
+        logging.info(f"Skipping {feed} feed for Goodreads user {goodreads_user_id}: circuit open.")
+        return None
+    try:
+        result = await asyncio.to_thread(read, goodreads_user_id)
+    except FeedUnavailableError as e:
+        feed_health.record_failure(goodreads_user_id, feed, str(e))
+        return None
+    feed_health.record_success(goodreads_user_id, feed)
+    return result
+
+async def fetch_shelf_changes(goodreads_user_id: str, max_pages: int = FEED_MAX_PAGES) -> list[ShelfChange] | None:
+    """
+    Diffs an account's stored shelf against the first `max_pages` pages of its
+    feed. The stored snapshot is only loaded when the feed is going to be fetched,
+    not while its circuit is open. Returns None when the feed is skipped or fails.
+    """
+    if not feed_health.should_fetch(goodreads_user_id, "shelf"):
+        logging.info(f"Skipping shelf feed for Goodreads user {goodreads_user_id}: circuit open.")
+        return None
     async with AsyncSessionLocal() as session:
-        if server_id:
-            server = await crud.get_server_by_server_id(session=session, server_id=server_id)
-            if not server:
-                logging.error(f"Server {server_id} not found in the database.")
-                return
-            servers = [server]
+        stored = await crud.get_account_shelf(session, goodreads_user_id)
+    return await fetch_tracked(read_shelf_changes(stored, max_pages), goodreads_user_id, "shelf")
+
+async def save_progress_baseline(session, server_id: int, user_id: int, goodreads_user_id: str):
+    # Records the member's latest progress update as already sent, so joining doesn't announce it
+    try:
+        latest = await asyncio.to_thread(read_progress_update_feed, goodreads_user_id)
+    except FeedUnavailableError as e:
+        logging.info(f"No progress baseline for Goodreads user {goodreads_user_id}: {e}")
+        return
+    if not latest or await crud.check_sent_update(session, server_id, user_id, latest['published']):
+        return
+    book = await crud.get_book_by_title(session, latest['book_title'])
+    if book:
+        await crud.save_new_update(
+            session, None, server_id, user_id, book.book_id, latest['value'], latest['published'],
+            percent=latest['percent'], page=latest['page'], total_pages=latest['total_pages'], commit=False,
+        )
+
+async def onboard_account(server_id: int, user_id: int, discord_username: str, goodreads_user_id: str, goodreads_display_name: str,
+                          on_progress: Callable[[int, int], Awaitable[None]] | None = None) -> Counter:
+    """
+    Registers a member and imports their whole library as a silent baseline: the
+    feed pages are bulk-inserted in the same transaction as the registration, so
+    the next cycle finds nothing new to announce. Fetching the first page also
+    validates the profile; FeedUnavailableError means nothing was registered.
+    Returns the number of books per shelf.
+    """
+    shelves = Counter()
+    reading = []
+    books = []
+    async with account_lock(goodreads_user_id), AsyncSessionLocal() as session:
+        if await crud.get_users_by_goodreads_id(session, goodreads_user_id):
+            # Already tracked through another guild, so the shelf is stored and current
+            await crud.create_user(session, server_id, user_id, discord_username, goodreads_user_id, goodreads_display_name, commit=False)
+            for row in (await crud.get_account_shelf(session, goodreads_user_id)).values():
+                shelves[row.shelf] += 1
+                if row.shelf == discussions.READING_SHELF:
+                    reading.append(row.book_id)
         else:
-            servers = await crud.get_all_servers(session=session)
-            if len(servers) == 0:
-                logging.warning("No servers found in the database.")
-                return
-        for server in servers:
-            logging.info(f"Processing feeds for server {server.server_name} ({server.server_id})")
-            users = await crud.get_all_users(session=session, server_id=server.server_id)
-            update_thread_id = await crud.get_forum_thread(session, server.server_id, "update")
-            if not update_thread_id:
-                logging.warning(f"No update thread found for server {server.server_id}. Cannot send updates.")
-                continue
-            if len(users) == 0:
-                logging.warning(f"No shelves found for server {server.server_id}.")
-                return
-            for user in users:
-                logging.info(f"Processing user: {user.user_id} from server: {server.server_id}")
-                feed_entries = read_feed(user.goodreads_user_id)
-                updates = await process_feed(server.server_id, user.user_id, feed_entries)
-                logging.info(f"Processed {len(feed_entries)} entries for user: {user.user_id} from server: {server.server_id}")
-                # Send updates to Discord
-                if len(updates) > 0:
-                    await send_update_message(bot, update_thread_id, user, updates)
-                else:
-                    logging.warning(f"No update thread found for server {server.server_id}. Cannot send updates.")
-                    
-                # Process progress updates
-                new_progress_update = read_progress_update_feed(user.goodreads_user_id)
-                if new_progress_update:
-                    new_update_enhanced = await process_progress_update_feed(server.server_id, user.user_id, new_progress_update)
-                    if not new_update_enhanced:
-                        logging.warning(f"Not able to process progress update for user {user.user_id} on server {server.server_id} or it's already been sent.")
-                        continue
-                    logging.info(f"Processed new progress update for user: {user.user_id} from server: {server.server_id}:")
-                    logging.info(f"  - {new_update_enhanced['value']} for book: {new_update_enhanced['book'] if 'book' in new_update_enhanced else None} at {new_update_enhanced['published']}")
-                    msg = await send_progress_update_message(bot, update_thread_id, user, new_update_enhanced)
-                    if msg:
-                        async with AsyncSessionLocal() as session:
-                            await crud.save_new_update(session, msg.id, server.server_id, user.user_id, new_update_enhanced['book'].book_id, new_update_enhanced['value'], new_update_enhanced['published'])
-                    else:
-                        logging.error(f"Failed to send progress update message for user {user.user_id} on server {server.server_id}.")
-            
-    logging.info(f'Processing feeds for all users for server {server.server_id} completed. Sending updates to Discord...')
-    
\ No newline at end of file
+            delta = StatsDelta()
+            imported = set()
+            previous_first = None
+            for page in range(1, FEED_MAX_PAGES + 1):
+                entries, first_item = await asyncio.to_thread(read_feed_page, goodreads_user_id, page)
+                if first_item is None or first_item == previous_first:
+                    break
+                previous_first = first_item
+                entries = [entry for entry in entries if entry.book_id not in imported]
+                imported.update(entry.book_id for entry in entries)
+                await crud.bulk_save_account_books(session, goodreads_user_id, entries)
+                books.extend((entry.book_id, entry.title, entry.author) for entry in entries)
+                for entry in entries:
+                    delta.add(entry.book_id, entry.shelf, entry.published, entry.rating)
+                    shelves[entry.shelf] += 1
+                    if entry.shelf == discussions.READING_SHELF:
+                        reading.append(entry.book_id)
+                if on_progress:
+                    await on_progress(page, sum(shelves.values()))
+            # Registered before the rollups are updated, so they count this guild too
+            await crud.create_user(session, server_id, user_id, discord_username, goodreads_user_id, goodreads_display_name, commit=False)
+            await stats.apply_stats_delta(session, goodreads_user_id, delta)
+        await save_progress_baseline(session, server_id, user_id, goodreads_user_id)
+        await session.commit()
+    book_index.add_many(books)
+    _account_last_synced[goodreads_user_id] = time.monotonic()
+    discussions.record_member(server_id, user_id, reading)
+    logging.info(f"Onboarded Goodreads user {goodreads_user_id} on server {server_id} with {dict(shelves)}")
+    return shelves
+
+async def resync_after_import(goodreads_user_id: str, imported: Collection[int]):
+    """
+    Brings the stored shelf in line with the whole feed after a library import.
+    The export's dates and review markup differ from the feed's, so the books the
+    import just added are settled quietly; any other change since the last cycle is
+    real and announced as usual. The caller holds the account's lock.
+    """
+    changes = await fetch_shelf_changes(goodreads_user_id)
+    if changes:
+        await process_feed(goodreads_user_id, changes, silent_books=imported)
+
+async def process_account(goodreads_user_id: str) -> dict:
+    """
+    Runs one Goodreads account's feed fetch and diff, and queues the resulting
+    notifications for each of its guild memberships.
+    Returns a summary of what changed: {"updates": [FeedEntry, ...], "progress": str | None}.
+    """
+    summary = {"updates": [], "progress": None}
+    logging.info(f"Processing Goodreads user: {goodreads_user_id}")
+    async with account_lock(goodreads_user_id):
+        changes = await fetch_shelf_changes(goodreads_user_id, FEED_SYNC_PAGES)
+        if changes is not None:
+            updates = await process_feed(goodreads_user_id, changes)
+            logging.info(f"Processed {len(changes)} shelf changes for Goodreads user: {goodreads_user_id}")
+            summary["updates"] = updates
+            if len(updates) == 0:
+                logging.info(f"No shelf updates for Goodreads user {goodreads_user_id}.")
+        
+    # Process progress updates
+    new_progress_update = await fetch_tracked(read_progress_update_feed, goodreads_user_id, "progress")
+    if new_progress_update:
+        new_update_enhanced = await process_progress_update_feed(goodreads_user_id, new_progress_update)
+        if not new_update_enhanced:
+            logging.warning(f"Not able to process progress update for Goodreads user {goodreads_user_id} or it's already been sent.")
+            return summary
+        logging.info(f"Processed new progress update for Goodreads user: {goodreads_user_id}:")
+        logging.info(f"  - {new_update_enhanced['value']} for book: {new_update_enhanced['book']} at {new_update_enhanced['published']}")
+        summary["progress"] = new_update_enhanced['value']
+    return summary
+
+async def sync_account(goodreads_user_id: str, force: bool = False) -> dict | None:
+    """
+    Processes an account at most once per ACCOUNT_SYNC_MIN_SECONDS, however many
+    guilds it's registered in; concurrent calls share the same run.
+    Returns the run's summary, or None if the account was synced recently.
+    """
+    task = _account_syncs.get(goodreads_user_id)
+    if task is None:
+        last_synced = _account_last_synced.get(goodreads_user_id)
+        if not force and last_synced is not None and time.monotonic() - last_synced < ACCOUNT_SYNC_MIN_SECONDS:
+            logging.info(f"Goodreads user {goodreads_user_id} was synced recently, skipping.")
+            return None
+        task = asyncio.create_task(process_account(goodreads_user_id))
+        _account_syncs[goodreads_user_id] = task
+        task.add_done_callback(lambda _: finish_account_sync(goodreads_user_id))
+    return await asyncio.shield(task)
+
+def finish_account_sync(goodreads_user_id: str):
+    _account_syncs.pop(goodreads_user_id, None)
+    _account_last_synced[goodreads_user_id] = time.monotonic()
+
+async def process_user(server_id: int, user) -> dict | None:
+    return await sync_account(user.goodreads_user_id)
+
+async def process_single_user(bot, server_id: int, user_id: int) -> dict | None:
+    async with AsyncSessionLocal() as session:
+        user = await crud.get_user(session=session, server_id=server_id, user_id=user_id)
+    update_thread_id = await server_config_cache.get_thread(server_id, "update")
+    if not user:
+        raise LookupError(f"User {user_id} is not registered on server {server_id}.")
+    if not update_thread_id:
+        logging.warning(f"No update thread found for server {server_id}. Cannot send updates.")
+        return None
+    return await sync_account(user.goodreads_user_id, force=True)
+
+async def get_server_members(server_id: int) -> list | None:
+    # The members to poll for a server, or None if it can't receive updates
+    async with AsyncSessionLocal() as session:
+        server = await crud.get_server_by_server_id(session=session, server_id=server_id)
+        if not server:
+            logging.error(f"Server {server_id} not found in the database.")
+            return None
+        logging.info(f"Processing feeds for server {server.server_name} ({server.server_id})")
+        users = await crud.get_all_users(session=session, server_id=server.server_id)
+    update_thread_id = await server_config_cache.get_thread(server_id, "update")
+    if not update_thread_id:
+        logging.warning(f"No update thread found for server {server_id}. Cannot send updates.")
+        return None
+    if len(users) == 0:
+        logging.warning(f"No shelves found for server {server_id}.")
+        return None
+    return users
+
+async def process_servers(bot, server_ids: list[int]):
+    """
+    Polls the members of several servers in one cycle, interleaved across servers
+    by the fair scheduler so no server waits for another one's whole membership.
+    """
+    scheduler = FairScheduler()
+    for server_id in server_ids:
+        users = await get_server_members(server_id)
+        if users:
+            scheduler.add(server_id, users)
+    cycle_started = time.monotonic()
+
+    async def sync(server_id: int, user):
+        if coordinator.is_pending(("user", server_id, user.user_id)):
+            # A targeted refresh for this user is already queued or running
+            return None
+        result = await process_user(server_id, user)
+        feed_latency.record(server_id, WAIT, time.monotonic() - cycle_started)
+        return result
+
+    for server_id in await scheduler.run(sync):
+        feed_latency.check_budget(server_id)
+        logging.info(f"Processing feeds for all users for server {server_id} completed.")
+
+async def process_server(bot, server_id: int):
+    await process_servers(bot, [server_id])
+
+def request_server_refresh(bot, server_id: int, priority: int = SCHEDULED_PRIORITY) -> tuple[asyncio.Future, int]:
+    """
+    Queues a feed cycle for one server, coalescing with a run that is already
+    queued or in flight for it. Returns the shared future and the queue position.
+    """
+    return coordinator.submit(("server", server_id), lambda: process_server(bot, server_id), priority)
+
+def request_user_refresh(bot, server_id: int, user_id: int, priority: int = SCHEDULED_PRIORITY) -> tuple[asyncio.Future, int]:
+    """
+    Queues a feed refresh for a single user. If a full refresh of their server is
+    already pending, that run covers the user and its future is returned instead
+    (it resolves to None rather than a per-user summary).
+    """
+    server_key = ("server", server_id)
+    if coordinator.is_pending(server_key):
+        return coordinator.submit(server_key, lambda: process_server(bot, server_id), priority)
+    return coordinator.submit(("user", server_id, user_id), lambda: process_single_user(bot, server_id, user_id), priority)
+
+async def process(bot, server_id = None, shard_id = None, priority: int = SCHEDULED_PRIORITY):
+    logging.info(f"Processing feeds started{f' for shard {shard_id}' if shard_id is not None else ''}...")
+    if server_id:
+        future, _ = request_server_refresh(bot, server_id, priority)
+    else:
+        async with AsyncSessionLocal() as session:
+            server_ids = [server.server_id for server in await crud.get_all_servers(session=session) if handled_by_shard(bot, server.server_id, shard_id)]
+        if len(server_ids) == 0:
+            logging.warning("No servers found in the database.")
+            return
+        # One cycle for all of them, so their members are interleaved rather than served server by server
+        future, _ = coordinator.submit(("cycle", shard_id), lambda: process_servers(bot, server_ids), priority)
+    try:
+        await asyncio.shield(future)
+    except Exception as e:
+        logging.error(f"Processing feeds{f' for shard {shard_id}' if shard_id is not None else ''} failed: {e}")
+    logging.info("Processing feeds completed.")
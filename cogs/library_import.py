@@ -0,0 +1,92 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+import database.crud as crud
+from database import stats
+from database.book_index import book_index
+from database.connection import AsyncSessionLocal
+from database.stats import StatsDelta
+from cogs.feed_read import account_lock, resync_after_import
+
+load_dotenv()
+
+LIBRARY_IMPORT_MAX_BYTES = int(os.getenv("LIBRARY_IMPORT_MAX_BYTES", 10 * 1024 * 1024))
+TRACKED_SHELVES = {"read", "currently-reading", "to-read"}
+REQUIRED_COLUMNS = {"Book Id", "Title", "My Rating", "Exclusive Shelf", "Date Added"}
+
+class LibraryImportError(Exception):
+    """Raised when an upload isn't a readable Goodreads library export."""
+
+def parse_date(value: str) -> datetime | None:
+    # Exports use 2024/01/31
+    value = (value or "").strip()
+    return datetime.strptime(value, "%Y/%m/%d") if value else None
+
+def iter_library_export(data: bytes) -> Iterator[tuple]:
+    """
+    Streams a Goodreads library export CSV into staging records
+    (see crud.LIBRARY_IMPORT_COLUMNS), applying the same shelf rules as the feed.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    missing = REQUIRED_COLUMNS - set(reader.fieldnames or [])
+    if missing:
+        raise LibraryImportError(f"Not a Goodreads library export (missing {', '.join(sorted(missing))})")
+    for row in reader:
+        try:
+            rating = int(row["My Rating"] or 0)
+            review = (row.get("My Review") or "").strip() or None
+            shelf = row["Exclusive Shelf"].strip().lower()
+            if shelf not in TRACKED_SHELVES:
+                if not (review or rating):
+                    continue
+                shelf = "read"
+            average_rating = row.get("Average Rating")
+            yield (
+                int(row["Book Id"]),
+                row["Title"],
+                row.get("Author") or None,
+                float(average_rating) if average_rating else None,
+                shelf,
+                rating,
+                review,
+                parse_date(row["Date Added"]),
+            )
+        except (KeyError, ValueError) as e:
+            logging.warning(f"Skipping library export row {reader.line_num}: {e}")
+
+async def import_library(goodreads_user_id: str, data: bytes) -> tuple[Counter, int]:
+    """
+    Imports a library export into the account's shelves as a silent baseline.
+    Parsing runs in a worker thread and the rows are loaded with COPY, so the event
+    loop (and the feed cycle for other accounts) keeps running meanwhile.
+    Returns the added books per shelf and the number of rows in the export.
+    """
+    if len(data) > LIBRARY_IMPORT_MAX_BYTES:
+        raise LibraryImportError(f"The export is larger than {LIBRARY_IMPORT_MAX_BYTES // (1024 * 1024)} MB")
+    records = await asyncio.to_thread(lambda: list(iter_library_export(data)))
+
+    added = Counter()
+    imported = set()
+    async with account_lock(goodreads_user_id):
+        async with AsyncSessionLocal() as session:
+            delta = StatsDelta()
+            for row in await crud.copy_library_import(session, goodreads_user_id, records):
+                delta.add(row.book_id, row.shelf, row.review_date, row.rating)
+                added[row.shelf] += 1
+                imported.add(row.book_id)
+            await stats.apply_stats_delta(session, goodreads_user_id, delta)
+            await session.commit()
+        book_index.add_many((book_id, title, author) for book_id, title, author, *_ in records)
+        # The export's dates and review markup differ from the feed's; settle the imported
+        # books now rather than have the next cycle announce them as edits
+        await resync_after_import(goodreads_user_id, imported)
+    logging.info(f"Imported library export for Goodreads user {goodreads_user_id}: {len(records)} rows, added {dict(added)}")
+    return added, len(records)
@@ -4,117 +4,260 @@ import datetime as dt
 from database.models import User
 from collections import defaultdict
 from cogs.FeedEntry import FeedEntry
-import re
+from cogs.progress import PERCENT_PATTERN, PAGE_PATTERN
+from typing import Callable
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 GOODREADS_BOOK_URL_STUB = 'https://www.goodreads.com/book/show/'
 GOODREADS_USER_URL_STUB = 'https://www.goodreads.com/user/show/'
 MASS_UPDATE_THRESHOLD = 2
-
-async def send_update_message(bot: commands.Bot, thread_id: int, user: User, entries: list[FeedEntry]):
+# Edit the previous progress message for the same book in place instead of reposting it
+LIVE_PROGRESS_MESSAGES = os.getenv("LIVE_PROGRESS_MESSAGES", "true").lower() == "true"
+
+# Discord API limits
+EMBED_TOTAL_LIMIT = 6000
+EMBED_FIELD_LIMIT = 25
+EMBED_FIELD_VALUE_LIMIT = 1024
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_EMBED_LIMIT = 10
+
+SHELF_ORDER = ['to-read', 'currently-reading', 'read']
+PRETTY_SHELVES = {
+    "to-read": "📚 To Read",
+    "currently-reading": "📘 Currently Reading",
+    "read": "✅ Read"
+}
+
+async def send_update_message(bot: commands.Bot, thread_id: int, user: User, entries: list[FeedEntry], sent: "SentMessages | None" = None):
     """
     Sends a feed update message to the appropriate 'update' thread for a given server.
-    Requires the bot instance, server ID, and a parsed feed entry.
+    Requires the bot instance, server ID, and a parsed feed entry. Messages found
+    in `sent` (posted by an earlier attempt) are not posted again.
     """
     
     thread = bot.get_channel(thread_id)
-    emojis = thread.guild.emojis
-        
-    discord_user = await bot.fetch_user(user.user_id)
 
     if thread is None:
         print(f"⚠️ Thread ID {thread_id} not found in bot cache.")
         return
+
+    emojis = thread.guild.emojis
+    discord_user = bot.get_user(user.user_id) or await bot.fetch_user(user.user_id)
     
     to_read = [entry for entry in entries if entry.shelf == "to-read"]
     rest = [entry for entry in entries if entry.shelf != "to-read"]
     
     if len(rest) > MASS_UPDATE_THRESHOLD:
-        embed = build_batch_feed_update_embed(entries, emojis, user, discord_user)
-        await thread.send(embed=embed)
+        embeds = build_batch_feed_update_embeds(entries, emojis, user, discord_user)
+        await send_embeds(thread, embeds, sent)
         return
     elif len(to_read) > 0:
-        to_read_embed = build_batch_feed_update_embed(to_read, emojis, user, discord_user)
-        await thread.send(embed=to_read_embed)
+        to_read_embeds = build_batch_feed_update_embeds(to_read, emojis, user, discord_user)
+        await send_embeds(thread, to_read_embeds, sent)
     
     for entry in rest:
         if entry is None:
             continue
         if entry.shelf == "read":
             embed = build_finished_book_embed(entry, emojis, user, discord_user)
-            await thread.send(embed=embed)
+            await send_once(thread, [embed], sent)
         elif entry.shelf == "currently-reading":
             embed = build_current_book_embed(entry, emojis, user, discord_user)
-            await thread.send(embed=embed)
+            await send_once(thread, [embed], sent)
+
+def embeds_key(embeds: list[discord.Embed]) -> tuple:
+    # The text of a message's embeds; timestamps and resolved image URLs differ between what was sent and what Discord returns
+    def clean(text: str | None) -> str:
+        return (text or "").strip()
+    return tuple(
+        (clean(embed.title), clean(embed.description), tuple((clean(field.name), clean(field.value)) for field in embed.fields))
+        for embed in embeds
+    )
 
-def build_batch_feed_update_embed(entries: list[FeedEntry], emojis: tuple, user: User, discord_user: discord.User) -> discord.Embed:
+class SentMessages:
     """
-    Build a single embed for multiple book updates.
-    `entries` is a list of dicts with keys like:
-        - title, author, link, user_shelves, rating
+    The bot's messages in a channel since a point in time, by content. A retried
+    delivery takes its messages from here instead of reposting what an earlier,
+    interrupted attempt already got out.
     """
 
-    embed = discord.Embed(
-        title=f'{discord.utils.get(emojis, name="applecat")} Goodreads Update',
-        description=f'{discord.utils.get(emojis, name="RonaldoPog")} {discord_user.mention} ([{user.goodreads_display_name}]({GOODREADS_USER_URL_STUB}{user.goodreads_user_id})) updated their shelves!',
-        color=discord.Colour.blue(),
-        timestamp=dt.datetime.now(dt.timezone.utc)
-    )
+    def __init__(self, messages: list[discord.Message]):
+        self.by_key: dict[tuple, list[discord.Message]] = defaultdict(list)
+        for message in messages:
+            self.by_key[embeds_key(message.embeds)].append(message)
+
+    @classmethod
+    async def fetch(cls, channel: discord.abc.Messageable, author_id: int, after: dt.datetime, limit: int) -> "SentMessages":
+        # Stored times are naive UTC; discord.py would read a naive datetime as local time
+        after = after.replace(tzinfo=dt.timezone.utc) if after.tzinfo is None else after
+        return cls([message async for message in channel.history(limit=limit, after=after) if message.author.id == author_id])
+
+    def take(self, embeds: list[discord.Embed]) -> discord.Message | None:
+        messages = self.by_key.get(embeds_key(embeds))
+        return messages.pop(0) if messages else None
+
+async def send_once(channel: discord.abc.Messageable, embeds: list[discord.Embed], sent: SentMessages | None = None) -> discord.Message:
+    return (sent and sent.take(embeds)) or await channel.send(embeds=embeds)
+
+async def send_embeds(channel: discord.abc.Messageable, embeds: list[discord.Embed], sent: SentMessages | None = None) -> list[discord.Message]:
+    """
+    Sends embeds packed into as few messages as Discord allows:
+    at most 10 embeds and 6000 characters across all embeds per message.
+    Messages found in `sent` are not posted again.
+    """
+    messages = []
+    batch = []
+    batch_len = 0
+    for embed in embeds:
+        embed_len = len(embed)
+        if batch and (len(batch) == MESSAGE_EMBED_LIMIT or batch_len + embed_len > EMBED_TOTAL_LIMIT):
+            messages.append(await send_once(channel, batch, sent))
+            batch = []
+            batch_len = 0
+        batch.append(embed)
+        batch_len += embed_len
+    if batch:
+        messages.append(await send_once(channel, batch, sent))
+    return messages
+
+def truncate(text: str, max_len: int) -> str:
+    """
+    Shortens text to max_len characters, marking the cut with an ellipsis.
+    """
+    if len(text) <= max_len:
+        return text
+    return text[:max_len - 1] + "…"
+
+def chunk_lines(lines: list[str], max_len: int = EMBED_FIELD_VALUE_LIMIT) -> list[str]:
+    """
+    Joins lines into newline-separated chunks that each fit into one embed field.
+    Lines longer than a whole field are truncated.
+    """
+    chunks = []
+    current = []
+    current_len = 0
+    for line in lines:
+        if len(line) > max_len:
+            line = truncate(line, max_len)
+        line_len = len(line) + 1  # +1 for newline
+        if current and current_len + line_len > max_len + 1:
+            chunks.append("\n".join(current))
+            current = [line]
+            current_len = line_len
+        else:
+            current.append(line)
+            current_len += line_len
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def build_batch_feed_update_embeds(entries: list[FeedEntry], emojis: tuple, user: User, discord_user: discord.User) -> list[discord.Embed]:
+    """
+    Build embeds for multiple book updates, grouped by shelf.
+    Splits across as many embeds as Discord's limits require (see pack_sections).
+    """
+
+    applecat = discord.utils.get(emojis, name="applecat")
+    ronaldo_pog = discord.utils.get(emojis, name="RonaldoPog")
+    title = f'{applecat} Goodreads Update'
+    description = f'{ronaldo_pog} {discord_user.mention} ([{user.goodreads_display_name}]({GOODREADS_USER_URL_STUB}{user.goodreads_user_id})) updated their shelves!'
+    timestamp = dt.datetime.now(dt.timezone.utc)
+
+    def new_embed(first: bool) -> discord.Embed:
+        embed = discord.Embed(
+            title=title if first else f"{title} (continued)",
+            description=description if first else None,
+            color=discord.Colour.blue(),
+            timestamp=timestamp
+        )
+        embed.set_author(name=user.discord_username, icon_url=discord_user.avatar)
+        return embed
 
     # Group by shelf
     grouped = defaultdict(list)
-    
     for e in entries:
         grouped[e.shelf].append(e)
-        print(f"Grouped {e.title} under shelf {e.shelf}")
-        
-    SHELF_ORDER = ['to-read', 'currently-reading', 'read']
 
+    sections = []
     for shelf in SHELF_ORDER:
         if shelf not in grouped:
             continue
-        books = grouped[shelf]
-        lines = []
-        for b in books:
-            line = f"• [{b.title}]({GOODREADS_BOOK_URL_STUB}{b.book_id}) by {b.author}"
-            if int(b.rating) > 0 and shelf == "read":
-                stars = render_stars(int(b.rating))
-                line += f" – {stars}"
-            if b.review:
-                line += f"\n> {b.review}"
-            lines.append(line)
-
-        pretty_shelf = {
-            "to-read": "📚 To Read",
-            "currently-reading": "📘 Currently Reading",
-            "read": "✅ Read"
-        }.get(shelf, shelf.capitalize())
-
-        MAX_FIELD_LEN = 1024
-
-        def chunk_lines(lines: list[str], max_len: int = MAX_FIELD_LEN) -> list[str]:
-            chunks = []
-            current = []
-            current_len = 0
-            for line in lines:
-                line_len = len(line) + 1  # +1 for newline
-                if current_len + line_len > max_len:
-                    chunks.append("\n".join(current))
-                    current = [line]
-                    current_len = line_len
-                else:
-                    current.append(line)
-                    current_len += line_len
-            if current:
-                chunks.append("\n".join(current))
-            return chunks
+        sections.append((PRETTY_SHELVES.get(shelf, shelf.capitalize()), [format_entry_line(b) for b in grouped[shelf]]))
 
+    return pack_sections(sections, new_embed)
+
+def format_entry_line(b: FeedEntry, suffix: str = "") -> str:
+    line = f"• [{b.title}]({GOODREADS_BOOK_URL_STUB}{b.book_id}) by {b.author}{suffix}"
+    if b.rating and int(b.rating) > 0 and b.shelf == "read":
+        line += f" – {render_stars(int(b.rating))}"
+    if b.review:
+        line += f"\n> {truncate(b.review, max(EMBED_FIELD_VALUE_LIMIT - len(line) - 3, 1))}"
+    return line
+
+def pack_sections(sections: list[tuple[str, list[str]]], new_embed: Callable[[bool], discord.Embed]) -> list[discord.Embed]:
+    """
+    Lays out titled sections of lines as embed fields in a single pass.
+    A new embed (from `new_embed(first=False)`) is started whenever the next
+    field would break Discord's 25-field or 6000-character embed limits.
+    """
+    embed = new_embed(True)
+    embeds = [embed]
+    embed_len = len(embed)
+
+    for section_name, lines in sections:
         chunks = chunk_lines(lines)
         for i, chunk in enumerate(chunks):
-            suffix = f" ({i+1}/{len(chunks)})" if len(chunks) > 1 else ""
-            embed.add_field(name=pretty_shelf + suffix, value=chunk, inline=False)
-    embed.set_author(name=user.discord_username, icon_url=discord_user.avatar)
+            name = section_name + (f" ({i+1}/{len(chunks)})" if len(chunks) > 1 else "")
+            field_len = len(name) + len(chunk)
+            if len(embed.fields) == EMBED_FIELD_LIMIT or embed_len + field_len > EMBED_TOTAL_LIMIT:
+                embed = new_embed(False)
+                embeds.append(embed)
+                embed_len = len(embed)
+            embed.add_field(name=name, value=chunk, inline=False)
+            embed_len += field_len
+
+    return embeds
+
+def build_digest_embeds(feed_updates: list[tuple[User, FeedEntry]], progress_updates: list[tuple[User, str]], digest_mode: str, emojis: tuple) -> list[discord.Embed]:
+    """
+    Build embeds for a server-wide digest of one cycle's updates.
+    `digest_mode` is 'shelf' (one section per shelf, members named per line)
+    or 'member' (one section per member).
+    """
+    applecat = discord.utils.get(emojis, name="applecat")
+    title = f'{applecat} Goodreads Digest'
+    members = {user.user_id for user, _ in feed_updates} | {user.user_id for user, _ in progress_updates}
+    description = f"{len(feed_updates)} shelf updates and {len(progress_updates)} progress updates from {len(members)} members."
+    timestamp = dt.datetime.now(dt.timezone.utc)
+
+    def new_embed(first: bool) -> discord.Embed:
+        return discord.Embed(
+            title=title if first else f"{title} (continued)",
+            description=description if first else None,
+            color=discord.Colour.blue(),
+            timestamp=timestamp
+        )
+
+    sections = []
+    if digest_mode == "member":
+        lines_by_member = defaultdict(list)
+        for user, entry in feed_updates:
+            lines_by_member[user.discord_username].append(format_entry_line(entry, suffix=f" ({PRETTY_SHELVES.get(entry.shelf, entry.shelf)})"))
+        for user, value in progress_updates:
+            lines_by_member[user.discord_username].append(f"• 📈 {value}")
+        sections = [(f"👤 {member}", lines) for member, lines in lines_by_member.items()]
+    else:
+        lines_by_shelf = defaultdict(list)
+        for user, entry in feed_updates:
+            lines_by_shelf[entry.shelf].append(format_entry_line(entry, suffix=f" — {user.discord_username}"))
+        sections = [(PRETTY_SHELVES.get(shelf, shelf.capitalize()), lines_by_shelf[shelf]) for shelf in SHELF_ORDER if shelf in lines_by_shelf]
+        if progress_updates:
+            sections.append(("📈 Reading Progress", [f"• {value}" for _, value in progress_updates]))
 
-    return embed
+    return pack_sections(sections, new_embed)
 
 def render_stars(rating: int | float, max_stars: int = 5) -> str:
     """
@@ -135,7 +278,7 @@ def build_finished_book_embed(book: FeedEntry, emojis: tuple, user: User, discor
     applecat = discord.utils.get(emojis, name="applecat")
     user_line = f"[{user.goodreads_display_name}]({GOODREADS_USER_URL_STUB}{user.goodreads_user_id})"
     finished_line = f"{duck_ass} {user_line} just **finished reading**:"
-    review_section = f"\n\n> {book.review}" if book.review else ""
+    review_section = f"\n\n> {truncate(book.review, EMBED_DESCRIPTION_LIMIT - 512)}" if book.review else ""
     description = (
         f"{finished_line}\n"
         f"**[{book.title}]({GOODREADS_BOOK_URL_STUB}{book.book_id})** by *{book.author}* {nyanod}\n"
@@ -183,16 +326,52 @@ def build_current_book_embed(book: FeedEntry, emojis: tuple, user: User, discord
 
     return embed
 
-def build_poll_embed(book_titles: list[str], deadline: str = None) -> discord.Embed:
+def build_book_embed(book, shelvers: list) -> discord.Embed:
     """
-    Creates an embed listing candidate books for a poll.
+    Embed for /book: the book, and who in the server has it on which shelf.
     """
-    description = "\n".join(f"{i+1}️⃣ {title}" for i, title in enumerate(book_titles))
+    embed = discord.Embed(
+        title=truncate(book.title, 256),
+        url=book.goodreads_url or f"{GOODREADS_BOOK_URL_STUB}{book.book_id}",
+        description=f"by *{book.author}*" if book.author else None,
+        color=discord.Colour.teal(),
+    )
+    if book.cover_image_url:
+        embed.set_thumbnail(url=book.cover_image_url)
+    if book.average_rating:
+        embed.add_field(name="Goodreads rating", value=f"{book.average_rating:.2f}", inline=True)
+    ratings = [row.rating for row in shelvers if row.rating]
+    if ratings:
+        average = sum(ratings) / len(ratings)
+        embed.add_field(name="Server rating", value=f"{render_stars(round(average))} {average:.1f} ({len(ratings)} ratings)", inline=True)
+    for shelf in SHELF_ORDER:
+        members = [f"<@{row.user_id}>" for row in shelvers if row.shelf == shelf]
+        if members:
+            embed.add_field(name=PRETTY_SHELVES[shelf], value=truncate(", ".join(members), EMBED_FIELD_VALUE_LIMIT), inline=False)
+    if not shelvers:
+        embed.set_footer(text="Nobody in this server has shelved it yet.")
+    return embed
+
+def build_poll_embed(book_titles: list[str], deadline: str = None, votes: list[int] = None, question: str = None, closed: bool = False) -> discord.Embed:
+    """
+    Creates an embed listing candidate books for a poll, with vote bars when `votes` is given.
+    """
+    total = sum(votes) if votes else 0
+    lines = []
+    for i, title in enumerate(book_titles):
+        line = f"{i+1}️⃣ {title}"
+        if votes is not None:
+            bar = "█" * round(12 * votes[i] / total) if total else ""
+            line += f"\n`{bar:<12}` {votes[i]} vote{'' if votes[i] == 1 else 's'}"
+        lines.append(line)
+    description = "\n".join(lines)
+    if question:
+        description = f"**{question}**\n\n{description}"
 
     embed = discord.Embed(
-        title="📊 Book Club Poll",
-        description=description,
-        color=discord.Colour.gold(),
+        title="📊 Book Club Poll (closed)" if closed else "📊 Book Club Poll",
+        description=truncate(description, EMBED_DESCRIPTION_LIMIT),
+        color=discord.Colour.dark_grey() if closed else discord.Colour.gold(),
         timestamp=dt.datetime.now(dt.timezone.utc)
     )
 
@@ -220,28 +399,34 @@ def build_discussion_thread_embed(book_title: str, author: str, book_url: str, i
 
     return embed
 
-async def send_progress_update_message(bot: commands.Bot, thread_id: int, user: User, update: dict):
+async def send_progress_update_message(bot: commands.Bot, thread_id: int, user: User, update: dict, sent: SentMessages | None = None):
     """
     Sends a reading progress update message to the appropriate 'update' thread for a given server.
-    Requires the bot instance, server ID, and a parsed feed entry.
+    Requires the bot instance, server ID, and a parsed feed entry. A message found
+    in `sent` (posted by an earlier attempt) is returned instead of posting it again.
     """
     
     thread = bot.get_channel(thread_id)
-    emojis = thread.guild.emojis
-        
-    discord_user = await bot.fetch_user(user.user_id)
 
     if thread is None:
         print(f"⚠️ Thread ID {thread_id} not found in bot cache.")
         return
+
+    emojis = thread.guild.emojis
+    discord_user = bot.get_user(user.user_id) or await bot.fetch_user(user.user_id)
     
-    if 'message_id' in update and update['message_id']:
-        # The key exists and has a non-falsy value
-        last_update_message = await thread.fetch_message(update['message_id'])
-        if last_update_message:
-            await last_update_message.delete()
     embed = build_progress_update_embed(update, user, discord_user, emojis)
-    return await thread.send(embed=embed)
+    last_message_id = update.get('last_update_message_id')
+    if last_message_id:
+        # PartialMessage skips the fetch: one REST call to edit or delete the previous post
+        last_update_message = thread.get_partial_message(last_message_id)
+        try:
+            if LIVE_PROGRESS_MESSAGES:
+                return await last_update_message.edit(embed=embed)
+            await last_update_message.delete()
+        except discord.NotFound:
+            pass
+    return await send_once(thread, [embed], sent)
 
 def build_progress_update_embed(update, user: User, discord_user: discord.User, emojis: tuple = ()) -> discord.Embed:
     """
@@ -254,22 +439,18 @@ def build_progress_update_embed(update, user: User, discord_user: discord.User,
     book_title = None
     progress_text = None
 
-    # Patterns for percentage and page-based updates
-    percent_pattern = re.compile(r"(.+?) is (\d+)% done with (.+)")
-    page_pattern = re.compile(r"(.+?) is on page (\d+) of (\d+) of (.+)")
-    
-        # Optionally, get a book cover if available
+    # Optionally, get a book cover if available
     book = update['book'] if 'book' in update else None
     cover_url = book.cover_image_url if book else None
     
     # Optionally, add a link to the book if available
     book_url = book.goodreads_url if book else None
 
-    if percent_match := percent_pattern.match(title):
+    if percent_match := PERCENT_PATTERN.match(title):
         user_name, percent, book_title = percent_match.groups()
         progress_text = f"**{user.goodreads_display_name}** is **{percent}%** done with **[{book_title}]({book_url})**!"
         progress_emoji = "📈"
-    elif page_match := page_pattern.match(title):
+    elif page_match := PAGE_PATTERN.match(title):
         user_name, page, total, book_title = page_match.groups()
         progress_text = f"**{user.goodreads_display_name}** is on page **{page}** of **{total}** of **[{book_title}]({book_url})**!"
         progress_emoji = "📖"
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+
+from discord.ext import commands
+from dotenv import load_dotenv
+
+import database.crud as crud
+from cogs.FeedEntry import FeedEntry
+from cogs.feed_latency import feed_latency, DELIVERY
+from cogs.message_sender import send_update_message, send_progress_update_message, send_embeds, build_digest_embeds, SentMessages
+from database.connection import AsyncSessionLocal
+from database.models import OutboxMessage
+from database.server_config import server_config_cache
+
+load_dotenv()
+
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", 30))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+OUTBOX_STALE_CLAIM = timedelta(minutes=5)
+# How far back into the thread a retry looks for the messages an earlier attempt already posted
+OUTBOX_RETRY_HISTORY = int(os.getenv("OUTBOX_RETRY_HISTORY", 100))
+
+_wakeup = asyncio.Event()
+
+def record_delivery(message: OutboxMessage):
+    # created_at is when the feed cycle queued the message, so this includes retries and digest windows
+    if message.created_at:
+        feed_latency.record(message.server_id, DELIVERY, (datetime.utcnow() - message.created_at).total_seconds())
+
+def notify():
+    """
+    Wakes the dispatcher after new messages were committed.
+    """
+    _wakeup.set()
+
+def next_retry_at(attempts: int) -> datetime | None:
+    # Exponential backoff capped at an hour; None once the message is out of attempts
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        return None
+    return datetime.utcnow() + min(timedelta(seconds=30 * 2 ** (attempts - 1)), timedelta(hours=1))
+
+def feed_update_key(server_id: int, user_id: int, entries: list[FeedEntry]) -> str:
+    digest = hashlib.sha1(
+        "|".join(sorted(f"{e.book_id}:{e.shelf}:{e.rating}:{e.published.isoformat() if e.published else ''}:{e.review or ''}" for e in entries)).encode()
+    ).hexdigest()
+    return f"feed_update:{server_id}:{user_id}:{digest}"
+
+def progress_update_key(server_id: int, user_id: int, published: datetime) -> str:
+    return f"progress_update:{server_id}:{user_id}:{published.isoformat()}"
+
+class OutboxDispatcher(commands.Cog):
+    """
+    Delivers Discord notifications written to the outbox table by the feed cycle.
+
+    Messages are claimed in batches, sent, and marked 'sent' afterwards; failures
+    are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS. Discord has no
+    idempotent send, so an attempt that fails or dies partway may already have
+    posted some of its messages. A retry (attempts > 0, which includes a claim
+    reclaimed after a crash) therefore first reads the bot's messages in the thread
+    since the outbox message was queued, and skips every message whose content is
+    already there. Only a thread that got more than OUTBOX_RETRY_HISTORY messages in
+    the meantime can still see a repeat.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.task: asyncio.Task | None = None
+
+    async def cog_load(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def cog_unload(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await self.drain()
+            except Exception as e:
+                logging.error(f"Outbox dispatch failed: {e}")
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self):
+        server_ids = []
+        digest_servers = {}
+        for guild in self.bot.guilds:
+            config = await server_config_cache.get(guild.id)
+            if config.digest_mode == "off":
+                server_ids.append(guild.id)
+            else:
+                digest_servers[guild.id] = config
+
+        while server_ids:
+            async with AsyncSessionLocal() as session:
+                messages = await crud.claim_outbox_messages(session, server_ids, OUTBOX_BATCH_SIZE, OUTBOX_STALE_CLAIM)
+            if not messages:
+                break
+            for message in messages:
+                await self.deliver(message)
+
+        for server_id, config in digest_servers.items():
+            async with AsyncSessionLocal() as session:
+                messages = await crud.claim_outbox_digest(session, server_id, timedelta(minutes=config.digest_window_minutes))
+            if messages:
+                await self.deliver_digest(server_id, config.digest_mode, messages)
+        async with AsyncSessionLocal() as session:
+            await crud.prune_outbox(session, datetime.utcnow() - timedelta(days=OUTBOX_RETENTION_DAYS))
+
+    async def already_sent(self, thread, messages: list[OutboxMessage]) -> SentMessages | None:
+        # Only a retry can find its own messages in the thread
+        if not any(message.attempts for message in messages):
+            return None
+        return await SentMessages.fetch(thread, self.bot.user.id, min(message.created_at for message in messages), OUTBOX_RETRY_HISTORY)
+
+    async def deliver(self, message: OutboxMessage):
+        try:
+            async with AsyncSessionLocal() as session:
+                user = await crud.get_user(session=session, server_id=message.server_id, user_id=message.user_id)
+                thread_id = await server_config_cache.get_thread(message.server_id, "update")
+                if user is None:
+                    # The member unregistered in the meantime; nothing to announce
+                    logging.info(f"Dropping outbox message {message.idempotency_key}: user no longer registered.")
+                    await crud.mark_outbox_sent(session, message.id)
+                    return
+                thread = self.bot.get_channel(thread_id) if thread_id else None
+                if thread is None:
+                    raise LookupError(f"Update thread for server {message.server_id} is not available")
+                sent = await self.already_sent(thread, [message])
+
+                if message.kind == "feed_update":
+                    entries = [FeedEntry.from_dict(entry) for entry in message.payload["entries"]]
+                    await send_update_message(self.bot, thread_id, user, entries, sent)
+                    await crud.mark_outbox_sent(session, message.id)
+                    record_delivery(message)
+                elif message.kind == "progress_update":
+                    payload = message.payload
+                    book = await crud.get_book(session, payload["book_id"])
+                    last_update = await crud.get_last_progress_update(session, message.server_id, message.user_id, payload["book_id"])
+                    update = {
+                        'value': payload["value"],
+                        'published': datetime.fromisoformat(payload["published"]),
+                        'book': book,
+                        'last_update_message_id': last_update.message_id if last_update else None,
+                    }
+                    msg = await send_progress_update_message(self.bot, thread_id, user, update, sent)
+                    if not msg:
+                        raise RuntimeError("Progress update message was not sent")
+                    # Record the message id and the delivery together
+                    await crud.set_progress_update_message(session, payload["progress_update_id"], msg.id, commit=False)
+                    await crud.mark_outbox_sent(session, message.id)
+                    record_delivery(message)
+        except Exception as e:
+            attempts = message.attempts + 1
+            retry_at = next_retry_at(attempts)
+            logging.error(f"Failed to deliver outbox message {message.idempotency_key} (attempt {attempts}): {e}")
+            async with AsyncSessionLocal() as session:
+                await crud.mark_outbox_failed(session, message.id, attempts, str(e), retry_at)
+
+    async def deliver_digest(self, server_id: int, digest_mode: str, messages: list[OutboxMessage]):
+        """
+        Posts every claimed message of a digest-mode server as a few grouped embeds.
+
+        Progress rows announced this way keep message_id NULL: the digest carries
+        other members' updates too, so it must never become the message a later
+        live progress update edits in place. get_last_progress_update and the
+        compaction's "keep the last announced row" rule therefore find nothing
+        announced for these series, which are compacted by age and count alone.
+        """
+        try:
+            thread_id = await server_config_cache.get_thread(server_id, "update")
+            thread = self.bot.get_channel(thread_id) if thread_id else None
+            if thread is None:
+                raise LookupError(f"Update thread for server {server_id} is not available")
+
+            async with AsyncSessionLocal() as session:
+                users = {user.user_id: user for user in await crud.get_all_users(session=session, server_id=server_id)}
+            feed_updates = []
+            progress_updates = []
+            for message in messages:
+                user = users.get(message.user_id)
+                if user is None:
+                    continue
+                if message.kind == "feed_update":
+                    feed_updates.extend((user, FeedEntry.from_dict(entry)) for entry in message.payload["entries"])
+                elif message.kind == "progress_update":
+                    progress_updates.append((user, message.payload["value"]))
+
+            if feed_updates or progress_updates:
+                embeds = build_digest_embeds(feed_updates, progress_updates, digest_mode, thread.guild.emojis)
+                await send_embeds(thread, embeds, await self.already_sent(thread, messages))
+            async with AsyncSessionLocal() as session:
+                await crud.mark_outbox_sent_many(session, [message.id for message in messages])
+            for message in messages:
+                record_delivery(message)
+            logging.info(f"Posted digest of {len(messages)} outbox messages for server {server_id}.")
+        except Exception as e:
+            logging.error(f"Failed to deliver digest for server {server_id}: {e}")
+            for message in messages:
+                attempts = message.attempts + 1
+                retry_at = next_retry_at(attempts)
+                async with AsyncSessionLocal() as session:
+                    await crud.mark_outbox_failed(session, message.id, attempts, str(e), retry_at)
+
+async def setup(bot: commands.Bot):
+    logging.info("Starting outbox dispatcher...")
+    await bot.add_cog(OutboxDispatcher(bot))
@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from dotenv import load_dotenv
+
+import database.crud as crud
+from cogs.message_sender import build_poll_embed, truncate
+from database.connection import AsyncSessionLocal
+from database.models import Poll
+from database.server_config import server_config_cache
+
+load_dotenv()
+
+# Votes are written at most this long after they're cast, or sooner once this many are waiting
+POLL_FLUSH_SECONDS = int(os.getenv("POLL_FLUSH_SECONDS", 10))
+POLL_FLUSH_BATCH = int(os.getenv("POLL_FLUSH_BATCH", 200))
+# One keycap emoji per option
+POLL_MAX_OPTIONS = 9
+
+_flush_wakeup = asyncio.Event()
+
+class PollTally:
+    """
+    Vote counts of the open polls, kept in memory so casting a vote never waits on
+    the database. Changed votes queue up in `pending` and are written in batches by
+    PollCog.flush; on startup the tallies are rebuilt from the stored votes.
+    """
+
+    def __init__(self):
+        # poll_id -> user_id -> option
+        self.choices: dict[int, dict[int, int]] = {}
+        self.counts: dict[int, list[int]] = {}
+        # (poll_id, user_id) -> option, or None for a withdrawn vote
+        self.pending: dict[tuple[int, int], int | None] = {}
+
+    def open(self, poll_id: int, options: int, votes=()):
+        self.choices[poll_id] = {}
+        self.counts[poll_id] = [0] * options
+        for user_id, option in votes:
+            if 0 <= option < options:
+                self.choices[poll_id][user_id] = option
+                self.counts[poll_id][option] += 1
+
+    def vote(self, poll_id: int, user_id: int, option: int) -> int | None:
+        """
+        Records a vote and returns the member's choice now: voting for the option
+        they already chose withdraws it (None).
+        """
+        choices = self.choices[poll_id]
+        counts = self.counts[poll_id]
+        previous = choices.pop(user_id, None)
+        if previous is not None:
+            counts[previous] -= 1
+        if previous == option:
+            option = None
+        else:
+            choices[user_id] = option
+            counts[option] += 1
+        self.pending[(poll_id, user_id)] = option
+        if len(self.pending) >= POLL_FLUSH_BATCH:
+            _flush_wakeup.set()
+        return option
+
+    def drain(self) -> dict[tuple[int, int], int | None]:
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def requeue(self, votes: dict[tuple[int, int], int | None]):
+        # After a failed write; votes cast since then are newer and win
+        for key, option in votes.items():
+            self.pending.setdefault(key, option)
+
+    def close(self, poll_id: int) -> list[int]:
+        self.choices.pop(poll_id, None)
+        return self.counts.pop(poll_id, [])
+
+poll_tally = PollTally()
+
+def option_label(option: dict) -> str:
+    label = f"{option['title']} by {option['author']}" if option.get("author") else option["title"]
+    if option.get("members"):
+        label += f" ({option['members']} want to read)"
+    return label
+
+def poll_embed(poll: Poll, closed: bool = False) -> discord.Embed:
+    return build_poll_embed(
+        [option_label(option) for option in poll.options],
+        deadline=f"{poll.closes_at:%Y-%m-%d %H:%M} UTC" if poll.closes_at and not closed else None,
+        votes=poll_tally.counts.get(poll.id, [0] * len(poll.options)) if not closed else None,
+        question=poll.question,
+        closed=closed,
+    )
+
+class PollView(discord.ui.View):
+    """
+    One button per option. Custom ids are stable, so the view is re-attached to
+    its message after a restart.
+    """
+
+    def __init__(self, cog: "PollCog", poll: Poll):
+        super().__init__(timeout=None)
+        for index, option in enumerate(poll.options):
+            button = discord.ui.Button(
+                label=truncate(option["title"], 80),
+                emoji=f"{index + 1}️⃣",
+                style=discord.ButtonStyle.secondary,
+                custom_id=f"poll:{poll.id}:{index}",
+                row=index // 5,
+            )
+            button.callback = self.vote_callback(cog, poll.id, index)
+            self.add_item(button)
+
+    @staticmethod
+    def vote_callback(cog: "PollCog", poll_id: int, index: int):
+        async def callback(interaction: discord.Interaction):
+            await cog.vote(interaction, poll_id, index)
+        return callback
+
+class PollCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        # Open polls by id
+        self.polls: dict[int, Poll] = {}
+        self.task: asyncio.Task | None = None
+
+    async def cog_load(self):
+        await self.restore()
+        self.task = asyncio.create_task(self.run())
+
+    async def cog_unload(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+    async def restore(self):
+        async with AsyncSessionLocal() as session:
+            polls = await crud.get_open_polls(session)
+            votes = await crud.get_poll_votes(session, [poll.id for poll in polls])
+        by_poll: dict[int, list] = {}
+        for vote in votes:
+            by_poll.setdefault(vote.poll_id, []).append((vote.user_id, vote.option))
+        for poll in polls:
+            self.polls[poll.id] = poll
+            poll_tally.open(poll.id, len(poll.options), by_poll.get(poll.id, ()))
+            self.bot.add_view(PollView(self, poll), message_id=poll.message_id)
+        if polls:
+            logging.info(f"Restored {len(polls)} open polls with {len(votes)} votes.")
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await asyncio.wait_for(_flush_wakeup.wait(), timeout=POLL_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _flush_wakeup.clear()
+            try:
+                await self.flush()
+                await self.close_expired()
+            except Exception as e:
+                logging.error(f"Poll maintenance failed: {e}")
+
+    async def flush(self):
+        votes = poll_tally.drain()
+        if not votes:
+            return
+        try:
+            async with AsyncSessionLocal() as session:
+                await crud.save_poll_votes(session, votes)
+        except Exception:
+            poll_tally.requeue(votes)
+            raise
+
+    async def close_expired(self):
+        now = datetime.utcnow()
+        for poll in list(self.polls.values()):
+            # Each guild's polls are closed by the process connected to it
+            if poll.closes_at and poll.closes_at <= now and self.bot.get_guild(poll.server_id):
+                await self.close(poll)
+
+    async def vote(self, interaction: discord.Interaction, poll_id: int, index: int):
+        poll = self.polls.get(poll_id)
+        if poll is None:
+            await interaction.response.send_message("This poll is closed.", ephemeral=True)
+            return
+        poll_tally.vote(poll_id, interaction.user.id, index)
+        # Answering the click with the updated counts is the live update; the vote is written later
+        await interaction.response.edit_message(embed=poll_embed(poll))
+
+    async def close(self, poll: Poll) -> list[int]:
+        await self.flush()
+        async with AsyncSessionLocal() as session:
+            await crud.close_poll(session, poll.id)
+        self.polls.pop(poll.id, None)
+        counts = poll_tally.close(poll.id)
+
+        channel = self.bot.get_channel(poll.channel_id)
+        if channel is None:
+            logging.warning(f"Poll {poll.id} closed, but its channel {poll.channel_id} is not available.")
+            return counts
+        try:
+            message = await channel.fetch_message(poll.message_id)
+            await message.edit(embed=build_poll_embed(
+                [option_label(option) for option in poll.options], votes=counts, question=poll.question, closed=True
+            ), view=None)
+        except discord.HTTPException as e:
+            logging.warning(f"Could not update the message of poll {poll.id}: {e}")
+        await channel.send(format_results(poll, counts))
+        logging.info(f"Closed poll {poll.id} on server {poll.server_id}: {counts}")
+        return counts
+
+    @app_commands.command(name="poll", description="Start a book-club poll in the poll thread")
+    @app_commands.describe(
+        question="What members are voting on",
+        options="Candidates separated by ';' (leave empty to use members' to-read shelves)",
+        candidates="How many books to take from members' to-read shelves",
+        hours="Close the poll automatically after this many hours"
+    )
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def poll(self, interaction: discord.Interaction, question: str = "What should we read next?", options: str = None,
+                   candidates: app_commands.Range[int, 2, POLL_MAX_OPTIONS] = 5, hours: app_commands.Range[int, 1, 720] = None):
+        await interaction.response.defer(ephemeral=True)
+
+        server_id = interaction.guild.id
+        thread_id = await server_config_cache.get_thread(server_id, "poll")
+        thread = self.bot.get_channel(thread_id) if thread_id else None
+        if thread is None:
+            await interaction.followup.send("❌ No poll thread is set up. Run `/setup_forum` first.", ephemeral=True)
+            return
+
+        if options:
+            choices = [{"title": truncate(title.strip(), 200)} for title in options.split(";") if title.strip()][:POLL_MAX_OPTIONS]
+        else:
+            # The books most members already want to read
+            async with AsyncSessionLocal() as session:
+                rows = await crud.get_to_read_overlap(session, server_id, candidates)
+            choices = [
+                {"title": truncate(row.title, 200), "author": row.author, "book_id": row.book_id, "members": row.members}
+                for row in rows
+            ]
+        if len(choices) < 2:
+            await interaction.followup.send("❌ A poll needs at least two options.", ephemeral=True)
+            return
+
+        closes_at = datetime.utcnow() + timedelta(hours=hours) if hours else None
+        async with AsyncSessionLocal() as session:
+            poll = await crud.create_poll(session, server_id, thread.id, question, choices, interaction.user.id, closes_at)
+            poll_tally.open(poll.id, len(choices))
+            message = await thread.send(embed=poll_embed(poll), view=PollView(self, poll))
+            await crud.set_poll_message(session, poll.id, message.id)
+        poll.message_id = message.id
+        self.polls[poll.id] = poll
+        await interaction.followup.send(f"📊 Poll posted in {thread.mention}.", ephemeral=True)
+
+    @app_commands.command(name="poll_close", description="Close the server's most recent open poll and post the results")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def poll_close(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        open_polls = [poll for poll in self.polls.values() if poll.server_id == interaction.guild.id]
+        if not open_polls:
+            await interaction.followup.send("There is no open poll.", ephemeral=True)
+            return
+        poll = max(open_polls, key=lambda poll: poll.id)
+        await self.close(poll)
+        await interaction.followup.send("🏁 Poll closed.", ephemeral=True)
+
+def format_results(poll: Poll, counts: list[int]) -> str:
+    total = sum(counts)
+    if not total:
+        return f"🏁 **{poll.question}**: the poll closed without votes."
+    best = max(counts)
+    winners = [option_label(option) for option, count in zip(poll.options, counts) if count == best]
+    if len(winners) > 1:
+        return f"🏁 **{poll.question}**: a tie at {best} votes between " + ", ".join(f"**{winner}**" for winner in winners)
+    return f"🏁 **{poll.question}**: **{winners[0]}** wins with {best} of {total} votes!"
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(PollCog(bot))
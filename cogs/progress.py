@@ -0,0 +1,107 @@
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PERCENT_PATTERN = re.compile(r"(.+?) is (\d+)% done with (.+)")
+PAGE_PATTERN = re.compile(r"(.+?) is on page (\d+) of (\d+) of (.+)")
+
+# Only progress points this recent are used to estimate a pace
+PACE_WINDOW_DAYS = int(os.getenv("PACE_WINDOW_DAYS", 30))
+
+# Retention: progress rows older than this are folded into progress_summaries, except
+# the latest PROGRESS_KEEP_PER_BOOK of each member's book. Never shorter than the pace
+# window, so /pace always sees every point it asks for.
+PROGRESS_RETENTION_DAYS = max(PACE_WINDOW_DAYS, int(os.getenv("PROGRESS_RETENTION_DAYS", 90)))
+PROGRESS_KEEP_PER_BOOK = max(1, int(os.getenv("PROGRESS_KEEP_PER_BOOK", 10)))
+PROGRESS_COMPACTION_HOUR = int(os.getenv("PROGRESS_COMPACTION_HOUR", 5))
+
+def parse_progress(value: str) -> dict | None:
+    """
+    Parses a Goodreads status like "X is 42% done with Y" or "X is on page 10 of 300 of Y"
+    into numeric columns. Returns None if the status isn't a progress update.
+    """
+    if percent_match := PERCENT_PATTERN.match(value):
+        user_name, percent, book_title = percent_match.groups()
+        return {"user_name": user_name, "book_title": book_title, "percent": float(percent), "page": None, "total_pages": None}
+    if page_match := PAGE_PATTERN.match(value):
+        user_name, page, total, book_title = page_match.groups()
+        page, total = int(page), int(total)
+        percent = min(100.0, 100.0 * page / total) if total else None
+        return {"user_name": user_name, "book_title": book_title, "percent": percent, "page": page, "total_pages": total}
+    return None
+
+@dataclass
+class Pace:
+    user_id: int
+    book_id: int
+    title: str
+    percent: float
+    percent_per_day: float
+    pages_per_day: float | None
+    estimated_finish: datetime | None
+
+def series_pace(points: list) -> tuple[float, float] | None:
+    """
+    Least-squares slope (percent per day) of one reading series, using only the
+    current read-through: a drop in percent means the book was restarted.
+    Returns (slope, latest percent), or None with fewer than two points.
+    """
+    n = sx = sy = sxy = sxx = 0.0
+    origin = points[0].published
+    previous = None
+    for point in points:
+        if previous is not None and point.percent < previous:
+            n = sx = sy = sxy = sxx = 0.0
+            origin = point.published
+        x = (point.published - origin).total_seconds() / 86400
+        y = point.percent
+        n += 1
+        sx += x
+        sy += y
+        sxy += x * y
+        sxx += x * x
+        previous = y
+    denominator = n * sxx - sx * sx
+    if n < 2 or denominator <= 0:
+        return None
+    return (n * sxy - sx * sy) / denominator, previous
+
+def compute_pace(rows: list) -> list[Pace]:
+    """
+    Computes reading velocity and an estimated finish date for every book in progress.
+
+    `rows` are (user_id, book_id, title, published, percent, page, total_pages) tuples
+    ordered by user, book and publish date, as returned by `crud.get_progress_points`.
+    The whole batch is a single pass with running sums per series, so a server's
+    worth of points stays well within an interaction's response deadline.
+    """
+    paces = []
+    for (user_id, book_id), series in groupby(rows, key=lambda row: (row.user_id, row.book_id)):
+        points = list(series)
+        latest = points[-1]
+        if latest.percent >= 100:
+            continue
+        result = series_pace(points)
+        if result is None:
+            continue
+        percent_per_day, percent = result
+        total_pages = next((point.total_pages for point in reversed(points) if point.total_pages), None)
+        estimated_finish = None
+        if percent_per_day > 0:
+            estimated_finish = latest.published + timedelta(days=(100 - percent) / percent_per_day)
+        paces.append(Pace(
+            user_id=user_id,
+            book_id=book_id,
+            title=latest.title,
+            percent=percent,
+            percent_per_day=percent_per_day,
+            pages_per_day=percent_per_day * total_pages / 100 if total_pages else None,
+            estimated_finish=estimated_finish,
+        ))
+    return paces
@@ -1,7 +1,12 @@
+import asyncio
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from cogs.feed_read import process
+from cogs.progress import PROGRESS_RETENTION_DAYS, PROGRESS_KEEP_PER_BOOK, PROGRESS_COMPACTION_HOUR
+from database.connection import AsyncSessionLocal
+from database import crud, stats
 from discord.ext import commands
 import logging
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
 
@@ -12,13 +17,37 @@ class SchedulerCog(commands.Cog):
         self.bot = bot
         self.scheduler = AsyncIOScheduler()
         self.scheduler.add_job(self.update_feed, 'interval', minutes=int(os.getenv("SCHEDULER_INTERVAL_MINUTES", 15)))
+        # Recompute the stats rollups daily to verify (and correct) the incremental updates,
+        # and once right away if they have never been built
+        self.scheduler.add_job(self.rebuild_stats, 'cron', hour=int(os.getenv("STATS_REBUILD_HOUR", 4)))
+        self.scheduler.add_job(self.rebuild_stats, kwargs={"only_if_missing": True})
+        self.scheduler.add_job(self.compact_progress, 'cron', hour=PROGRESS_COMPACTION_HOUR)
         self.scheduler.start()
 
     async def update_feed(self):
         logging.info("Updating feeds for all servers...")
-        await process(self.bot)
+        # Each shard polls only the users of its own guilds, independently of the others
+        shard_ids = sorted(self.bot.shards.keys()) if getattr(self.bot, "shards", None) else [None]
+        results = await asyncio.gather(*(process(self.bot, shard_id=shard_id) for shard_id in shard_ids), return_exceptions=True)
+        for shard_id, result in zip(shard_ids, results):
+            if isinstance(result, Exception):
+                logging.error(f"Feed processing failed for shard {shard_id}: {result}")
         logging.info("All feeds updated.")
 
+    async def rebuild_stats(self, only_if_missing: bool = False):
+        async with AsyncSessionLocal() as session:
+            if only_if_missing and await crud.get_bot_state(session, "stats_rebuilt_at"):
+                return
+            logging.info("Rebuilding reading-stats rollups...")
+            await stats.rebuild_stats(session)
+            await crud.set_bot_state(session, "stats_rebuilt_at", datetime.utcnow().isoformat())
+
+    async def compact_progress(self):
+        cutoff = datetime.utcnow() - timedelta(days=PROGRESS_RETENTION_DAYS)
+        async with AsyncSessionLocal() as session:
+            archived = await crud.compact_progress_updates(session, PROGRESS_KEEP_PER_BOOK, cutoff)
+        logging.info(f"Archived {archived} progress updates older than {cutoff:%Y-%m-%d} into progress_summaries")
+
 async def setup(bot):
     logging.info("Starting scheduler...")
     await bot.add_cog(SchedulerCog(bot))
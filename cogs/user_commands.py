@@ -3,56 +3,88 @@ from discord import app_commands
 from discord.ext import commands
 from database.connection import AsyncSessionLocal
 from database import crud
-from cogs.feed_read import process
-import logging
-
+from cogs.feed_read import request_server_refresh, request_user_refresh, onboard_account
+from cogs.coordinator import MANUAL_PRIORITY
+from cogs.feed_health import feed_health, FeedUnavailableError
+from cogs.feed_latency import feed_latency
+from cogs.discussions import reader_index
+from cogs.library_import import import_library, LibraryImportError
+from cogs.progress import compute_pace, PACE_WINDOW_DAYS
+from database.server_config import server_config_cache
+from database.book_index import book_index
+from cogs.message_sender import build_book_embed, truncate
+from database import stats
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+import asyncio
+import logging
 import os
+import re
+import time
 
 load_dotenv()
 
-SERVER_ID = int(os.getenv("SERVER_ID"))
+LEADERBOARD_MIN_RATINGS = int(os.getenv("LEADERBOARD_MIN_RATINGS", 2))
+# Discord shows at most 25 autocomplete choices
+BOOK_AUTOCOMPLETE_LIMIT = 25
+# Autocomplete choices carry the book id behind this prefix, so a typed title such as "1984" is still searched as text
+BOOK_CHOICE_PATTERN = re.compile(r"id:(\d{1,18})")
+PROFILE_URL_PATTERN = re.compile(r"goodreads\.com/user/show/(\d+)(?:-([\w-]+))?")
 
 class UserCommands(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         
     @app_commands.command(name="readzme", description="Register yourself with the bot")
-    @app_commands.guilds(discord.Object(id=SERVER_ID))
+    @app_commands.guild_only()
     async def readzme(self, interaction: discord.Interaction, goodreads_profile_url: str):
         server_id = interaction.guild.id
         user_id = interaction.user.id
         username = interaction.user.name
-        goodreads_user_data = goodreads_profile_url.split("/")[-1]
-        goodreads_id = goodreads_user_data.split("-")[0]
-        goodreads_display_name = goodreads_user_data.split("-")[1]
+        profile = PROFILE_URL_PATTERN.search(goodreads_profile_url)
+        if not profile:
+            await interaction.response.send_message("That doesn't look like a Goodreads profile URL (https://www.goodreads.com/user/show/12345-name).", ephemeral=True)
+            return
+        goodreads_id, slug = profile.groups()
+        goodreads_display_name = slug.split("-")[0] if slug else interaction.user.display_name
         logging.info(f"Registering user: {username} with ID: {user_id} from server: {server_id} and Goodreads id: {goodreads_id} and display name: {goodreads_display_name}")
-        
+
+        # Importing a large library takes longer than the interaction deadline
+        await interaction.response.defer(thinking=True)
         async with AsyncSessionLocal() as session:
-            try:
-                server = await crud.get_server_by_server_id(session=session, server_id=server_id)
-                if not server:
-                    await interaction.response.send_message("Server not found in the database. Please contact an admin.", ephemeral=True)
-                    return
-                user = await crud.get_user(session=session, server_id=server.server_id, user_id=user_id)
-                if user:
-                    await interaction.response.send_message(f"{username}, you're already registered!")
-                    return
-                await crud.create_user(
-                    session=session,
-                    server_id=server.server_id,
-                    user_id=user_id,
-                    discord_username=username,
-                    goodreads_user_id=goodreads_id,
-                    goodreads_display_name=goodreads_display_name
-                )
-                await interaction.response.send_message(f"{username} ({goodreads_display_name}), you've been registered!")
-            except Exception as e:
-                logging.info(f"Error creating user in DB: {e}")
-                await interaction.response.send_message("There was an error registering you. Please try again.", ephemeral=True)
+            server = await crud.get_server_by_server_id(session=session, server_id=server_id)
+            user = await crud.get_user(session=session, server_id=server_id, user_id=user_id) if server else None
+        if not server:
+            await interaction.followup.send("Server not found in the database. Please contact an admin.", ephemeral=True)
+            return
+        if user:
+            await interaction.followup.send(f"{username}, you're already registered!")
+            return
+
+        last_report = 0.0
+        async def report_progress(page: int, books: int):
+            nonlocal last_report
+            if time.monotonic() - last_report >= 1.5:
+                last_report = time.monotonic()
+                await interaction.edit_original_response(content=f"📥 Importing your Goodreads library… {books} books so far (page {page})")
+
+        try:
+            shelves = await onboard_account(server_id, user_id, username, goodreads_id, goodreads_display_name, on_progress=report_progress)
+        except FeedUnavailableError as e:
+            logging.info(f"Goodreads profile {goodreads_id} of {username} could not be read: {e}")
+            await interaction.edit_original_response(content="⚠️ Couldn't read that Goodreads profile. Make sure it exists and is public, then try again.")
+            return
+        except Exception as e:
+            logging.error(f"Error registering user {username} on server {server_id}: {e}")
+            await interaction.edit_original_response(content="There was an error registering you. Please try again.")
+            return
+
+        counts = ", ".join(f"{shelves[shelf]} {label}" for shelf, label in [("read", "read"), ("currently-reading", "currently reading"), ("to-read", "to read")] if shelves[shelf])
+        total = sum(shelves.values())
+        await interaction.edit_original_response(content=f"📚 **{username}** ({goodreads_display_name}) joined with {total} books{f' ({counts})' if counts else ''}!")
 
     @app_commands.command(name="readznotme", description="Unregister yourself from the bot")
-    @app_commands.guilds(discord.Object(id=SERVER_ID))
+    @app_commands.guild_only()
     async def readznotme(self, interaction: discord.Interaction):
         server_id = interaction.guild.id
         user_id = interaction.user.id
@@ -69,23 +101,67 @@ class UserCommands(commands.Cog):
                     await interaction.response.send_message(f"{username}, you're not registered!")
                     return
                 await crud.delete_user(session=session, server_id=server.server_id, user_id=user_id)
+                reader_index.remove_member(server.server_id, user_id)
                 await interaction.response.send_message(f"{username}, you've been removed!")
             except Exception as e:
                 logging.info(f"Error fetching user from DB: {e}")
                 await interaction.response.send_message("There was an error unregistering you. Please try again.", ephemeral=True)
                 return
             
+    @app_commands.command(name="import_library", description="Import your full Goodreads library export (CSV)")
+    @app_commands.describe(export="The CSV from Goodreads → My Books → Import and export → Export Library")
+    @app_commands.guild_only()
+    async def import_library(self, interaction: discord.Interaction, export: discord.Attachment):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        async with AsyncSessionLocal() as session:
+            user = await crud.get_user(session=session, server_id=interaction.guild.id, user_id=interaction.user.id)
+        if not user:
+            await interaction.followup.send("You need to register with `/readzme` first.", ephemeral=True)
+            return
+        if not export.filename.lower().endswith(".csv"):
+            await interaction.followup.send("Please attach the `.csv` file from Goodreads' library export.", ephemeral=True)
+            return
+        try:
+            added, rows = await import_library(user.goodreads_user_id, await export.read())
+        except LibraryImportError as e:
+            await interaction.followup.send(f"⚠️ {e}.", ephemeral=True)
+            return
+        except Exception as e:
+            logging.error(f"Library import for {interaction.user.name} failed: {e}")
+            await interaction.followup.send("There was an error importing your library. Please try again.", ephemeral=True)
+            return
+        counts = ", ".join(f"{added[shelf]} {shelf}" for shelf in ["read", "currently-reading", "to-read"] if added[shelf])
+        await interaction.followup.send(
+            f"✅ Imported {sum(added.values())} new books{f' ({counts})' if counts else ''} from {rows} rows in your export.",
+            ephemeral=True
+        )
+
     @app_commands.command(name="updatereadz", description="Update feeds")
-    @app_commands.guilds(discord.Object(id=SERVER_ID))
-    async def updatereadz(self, interaction: discord.Interaction):
-        logging.info(f"Updating feeds for user: {interaction.user.name}")
+    @app_commands.describe(member="Only refresh this member's shelves")
+    @app_commands.guild_only()
+    async def updatereadz(self, interaction: discord.Interaction, member: discord.Member = None):
+        logging.info(f"Updating feeds for user: {interaction.user.name}{f' (only {member.name})' if member else ''}")
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # Concurrent requests for the same server or user share one run, queued ahead of scheduled work
+        if member:
+            run, position = request_user_refresh(self.bot, interaction.guild.id, member.id, priority=MANUAL_PRIORITY)
+        else:
+            run, position = request_server_refresh(self.bot, interaction.guild.id, priority=MANUAL_PRIORITY)
+        if position > 0:
+            await interaction.followup.send(f"⏳ Feed update queued at position {position}.", ephemeral=True)
         try:
-            await interaction.response.defer(ephemeral=True, thinking=True)
-            await process(self.bot, server_id=interaction.guild.id)
+            # Shielded: an abandoned interaction mustn't cancel the run other callers share
+            summary = await asyncio.shield(run)
+        except LookupError:
+            await interaction.followup.send(f"{member.name} is not registered with the bot.", ephemeral=True)
+            return
         except Exception as e:
             logging.info(f"Error updating feeds: {e}")
-            await interaction.response.send_message("There was an error updating feeds. Please try again.", ephemeral=True)
-        finally:
+            await interaction.followup.send("There was an error updating feeds. Please try again.", ephemeral=True)
+            return
+        if member and summary is not None:
+            await interaction.followup.send(format_refresh_summary(member, summary), ephemeral=True)
+        else:
             await interaction.followup.send("Feed update request completed.", ephemeral=True)
        
     # 🛑 This command is currently deprecated in favor of `/setup_forum`
@@ -117,10 +193,10 @@ class UserCommands(commands.Cog):
     #     )
     
     @app_commands.command(name="setup_forum", description="Create and register bot threads in a forum channel.")
+    @app_commands.guild_only()
     @app_commands.describe(
         forum_channel="The forum channel to set up with Polls and Updates threads"
     )
-    @app_commands.guilds(discord.Object(id=SERVER_ID))
     async def setup_forum(
         self,
         interaction: discord.Interaction,
@@ -165,22 +241,21 @@ class UserCommands(commands.Cog):
         )
         
     @app_commands.command(name="current_setup", description="Show the bot's current channel and thread configuration")
-    @app_commands.guilds(discord.Object(id=SERVER_ID))
+    @app_commands.guild_only()
     async def current_setup(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
         server_id = interaction.guild.id
         bot = self.bot
 
-        async with AsyncSessionLocal() as session:
-            settings = await crud.get_notification_channel(session, server_id)
-            threads = await crud.get_all_forum_threads(session, server_id)
+        config = await server_config_cache.get(server_id)
+        threads = config.threads
 
         embed = discord.Embed(title="📋 Current Bot Setup", color=discord.Color.blurple())
 
         # Forum-based config
-        if settings and settings.channel_type == "forum":
-            forum_channel = bot.get_channel(settings.channel_id)
+        if config.channel_type == "forum":
+            forum_channel = bot.get_channel(config.channel_id)
             embed.add_field(name="Forum Channel", value=forum_channel.mention if forum_channel else "⚠️ Not found", inline=False)
 
             if threads:
@@ -200,16 +275,191 @@ class UserCommands(commands.Cog):
                 embed.add_field(name="Forum Threads", value="⚠️ No threads registered.\nUse `/setup_forum` or `/setthread`.", inline=False)
 
         # Text-channel fallback config
-        elif settings and settings.channel_type == "text":
-            channel = bot.get_channel(settings.notification_channel_id)
+        elif config.channel_type == "text":
+            channel = bot.get_channel(config.channel_id)
             embed.add_field(name="Text Channel", value=channel.mention if channel else "⚠️ Not found", inline=False)
 
         else:
             embed.description = "⚠️ No notification channel is currently configured.\nUse `/setup_forum` or `/setchannel` to configure one."
 
+        if config.channel_type:
+            digest = "Off" if config.digest_mode == "off" else f"By {config.digest_mode}, collected over {config.digest_window_minutes} min"
+            embed.add_field(name="🗞️ Digest", value=digest, inline=False)
+
         await interaction.followup.send(embed=embed, ephemeral=True)
         
 
+    @app_commands.command(name="digest", description="Group each cycle's updates into a server-wide digest")
+    @app_commands.describe(
+        mode="How to group updates, or off to post every member's updates separately",
+        window_minutes="How long to collect updates before posting the digest"
+    )
+    @app_commands.choices(mode=[
+        app_commands.Choice(name="Off", value="off"),
+        app_commands.Choice(name="By shelf", value="shelf"),
+        app_commands.Choice(name="By member", value="member"),
+    ])
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def digest(self, interaction: discord.Interaction, mode: app_commands.Choice[str], window_minutes: app_commands.Range[int, 1, 120] = 5):
+        async with AsyncSessionLocal() as session:
+            updated = await crud.set_digest_mode(session, interaction.guild.id, mode.value, window_minutes)
+        if not updated:
+            await interaction.response.send_message("⚠️ No notification channel is configured yet. Run `/setup_forum` first.", ephemeral=True)
+            return
+        if mode.value == "off":
+            await interaction.response.send_message("✅ Digest mode disabled; updates will be posted as they come.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"✅ Updates will be posted as a digest {mode.name.lower()}, collected over {window_minutes} minutes.", ephemeral=True)
+
+    @app_commands.command(name="feed_status", description="Show failing Goodreads feeds and how quickly updates are posted")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def feed_status(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        async with AsyncSessionLocal() as session:
+            users = await crud.get_all_users(session=session, server_id=interaction.guild.id)
+        users_by_goodreads_id = {user.goodreads_user_id: user for user in users}
+
+        lines = []
+        for state in feed_health.tripped():
+            user = users_by_goodreads_id.get(state["goodreads_user_id"])
+            if not user:
+                continue
+            lines.append(
+                f"• **{user.discord_username}** ({state['feed']} feed): {state['failures']} failures, "
+                f"next check <t:{int(datetime.fromisoformat(state['next_attempt_at']).timestamp())}:R>\n"
+                f"  `{state['last_error'][:150]}`"
+            )
+
+        embed = discord.Embed(title="🩺 Feed Status", color=discord.Color.orange() if lines else discord.Color.green())
+        embed.description = "\n".join(lines)[:4096] if lines else "✅ All registered feeds are healthy."
+        latency = feed_latency.summary(interaction.guild.id)
+        if latency["total_p95"] is not None:
+            embed.add_field(
+                name="Update latency (p95)",
+                value=f"{'⚠️ ' if latency['over_budget'] else ''}{latency['total_p95']:.0f}s "
+                      f"(polling {latency['wait_p95'] or 0:.0f}s, posting {latency['delivery_p95'] or 0:.0f}s)",
+            )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="pace", description="Show reading pace and estimated finish dates")
+    @app_commands.describe(member="Only show this member's books (defaults to the whole server)")
+    @app_commands.guild_only()
+    async def pace(self, interaction: discord.Interaction, member: discord.Member = None):
+        await interaction.response.defer(thinking=True)
+
+        server_id = interaction.guild.id
+        since = datetime.utcnow() - timedelta(days=PACE_WINDOW_DAYS)
+        async with AsyncSessionLocal() as session:
+            users = {user.user_id: user for user in await crud.get_all_users(session=session, server_id=server_id)}
+            if member and member.id not in users:
+                await interaction.followup.send(f"{member.name} is not registered with the bot.")
+                return
+            rows = await crud.get_progress_points(session, server_id, since, user_id=member.id if member else None)
+        paces = compute_pace(rows)
+
+        title = f"⏱️ Reading pace for {member.display_name}" if member else "⏱️ Reading pace"
+        embed = discord.Embed(title=title, color=discord.Color.teal())
+        if not paces:
+            embed.description = f"Not enough progress updates in the last {PACE_WINDOW_DAYS} days to estimate a pace."
+            await interaction.followup.send(embed=embed)
+            return
+
+        # Closest finish first; books that have stalled go last
+        paces.sort(key=lambda pace: (pace.estimated_finish is None, pace.estimated_finish or datetime.max))
+        lines = []
+        for pace in paces:
+            user = users.get(pace.user_id)
+            who = "" if member or not user else f"**{user.goodreads_display_name or user.discord_username}** · "
+            speed = f"{pace.pages_per_day:.0f} pages/day" if pace.pages_per_day is not None else f"{pace.percent_per_day:.1f}%/day"
+            finish = f"finishes <t:{int(pace.estimated_finish.replace(tzinfo=timezone.utc).timestamp())}:R>" if pace.estimated_finish else "stalled"
+            lines.append(f"• {who}*{pace.title}*: {pace.percent:.0f}% · {speed} · {finish}")
+        description = ""
+        for shown, line in enumerate(lines):
+            if len(description) + len(line) + 40 > 4096:
+                description += f"…and {len(lines) - shown} more"
+                break
+            description += line + "\n"
+        embed.description = description
+        embed.set_footer(text=f"Based on progress updates from the last {PACE_WINDOW_DAYS} days")
+        await interaction.followup.send(embed=embed)
+        
+
+    @app_commands.command(name="leaderboard", description="Show the server's reading leaderboards")
+    @app_commands.describe(
+        board="Which leaderboard to show",
+        year="Year for the readers leaderboard (defaults to this year)"
+    )
+    @app_commands.choices(board=[
+        app_commands.Choice(name="Most books read", value="readers"),
+        app_commands.Choice(name="Top rated books", value="rated"),
+        app_commands.Choice(name="Most read books", value="popular"),
+    ])
+    @app_commands.guild_only()
+    async def leaderboard(self, interaction: discord.Interaction, board: app_commands.Choice[str], year: app_commands.Range[int, 1900, 2100] = None):
+        await interaction.response.defer()
+
+        server_id = interaction.guild.id
+        year = year or datetime.utcnow().year
+        medals = ["🥇", "🥈", "🥉"]
+        async with AsyncSessionLocal() as session:
+            if board.value == "readers":
+                rows = await stats.get_top_readers(session, server_id, year)
+                totals = await stats.get_server_shelf_totals(session, server_id, year)
+                title = f"🏆 Most books read in {year}"
+                lines = [f"**{row.goodreads_display_name or row.discord_username}**: {row.books} books" for row in rows]
+                footer = f"{totals.get('read', 0)} books read on this server in {year}"
+            elif board.value == "rated":
+                rows = await stats.get_top_rated_books(session, server_id, min_ratings=LEADERBOARD_MIN_RATINGS)
+                title = "⭐ Top rated books"
+                lines = [f"[{row.title}]({row.goodreads_url}): {row.average_rating:.2f}⭐ from {row.rating_count} ratings" for row in rows]
+                footer = f"Books with at least {LEADERBOARD_MIN_RATINGS} ratings from members"
+            else:
+                rows = await stats.get_most_read_books(session, server_id)
+                title = "📚 Most read books"
+                lines = [f"[{row.title}]({row.goodreads_url}): {row.readers} readers" for row in rows]
+                footer = "Books on members' read shelves"
+
+        embed = discord.Embed(title=title, color=discord.Color.gold())
+        if lines:
+            embed.description = "\n".join(
+                f"{medals[rank] if rank < len(medals) else f'`{rank + 1}.`'} {line}" for rank, line in enumerate(lines)
+            )[:4096]
+        else:
+            embed.description = "Nothing to show yet."
+        embed.set_footer(text=footer)
+        await interaction.followup.send(embed=embed)
+
+    @app_commands.command(name="book", description="Look up a book and who in this server has shelved it")
+    @app_commands.describe(query="Title or author")
+    @app_commands.guild_only()
+    async def book(self, interaction: discord.Interaction, query: str):
+        await interaction.response.defer()
+
+        async with AsyncSessionLocal() as session:
+            choice = BOOK_CHOICE_PATTERN.fullmatch(query)
+            book = await crud.get_book(session, int(choice.group(1))) if choice else None
+            if book is None and choice is None:
+                matches = await find_books(query, limit=1)
+                book = await crud.get_book(session, matches[0][0]) if matches else None
+            if book is None:
+                await interaction.followup.send(f"No book matches '{query}'.")
+                return
+            shelvers = await crud.get_book_shelvers(session, interaction.guild.id, book.book_id)
+        await interaction.followup.send(embed=build_book_embed(book, shelvers))
+
+    @book.autocomplete("query")
+    async def book_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        if not current.strip():
+            return []
+        return [
+            app_commands.Choice(name=truncate(f"{title} — {author}" if author else title, 100), value=f"id:{book_id}")
+            for book_id, title, author in await find_books(current, limit=BOOK_AUTOCOMPLETE_LIMIT)
+        ]
+
+
 async def setup(bot: commands.Bot):
     logging.info("Loading commands from cogs.user_commands.py")
     await bot.add_cog(UserCommands(bot))
@@ -220,4 +470,30 @@ async def find_existing_thread(guild: discord.Guild, forum_channel: discord.Foru
         if thread.parent_id == forum_channel.id and thread.name.strip().lower() == name.strip().lower():
             return thread
     return None
-    
\ No newline at end of file
+
+async def find_books(query: str, limit: int) -> list:
+    """
+    Searches the in-memory book index, falling back to the database before the index
+    has loaded and for books it doesn't know (added by another worker, or typos it
+    can't place). Returns (book_id, title, author) tuples, best first.
+    """
+    if book_index.loaded:
+        matches = book_index.search(query, limit)
+        if matches:
+            return matches
+    async with AsyncSessionLocal() as session:
+        return [tuple(row) for row in await crud.search_books(session, query, limit)]
+
+def format_refresh_summary(member: discord.Member, summary: dict, max_lines: int = 15) -> str:
+    updates = summary["updates"]
+    if not updates and not summary["progress"]:
+        return f"No changes found for {member.name}."
+    lines = [f"Changes for {member.name}:"]
+    for entry in updates[:max_lines]:
+        rating = f" ({entry.rating}⭐)" if entry.rating else ""
+        lines.append(f"• {entry.title} → {entry.shelf}{rating}")
+    if len(updates) > max_lines:
+        lines.append(f"…and {len(updates) - max_lines} more")
+    if summary["progress"]:
+        lines.append(f"• Progress: {summary['progress']}")
+    return "\n".join(lines)[:2000]
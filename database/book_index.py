@@ -0,0 +1,182 @@
+# database/book_index.py
+import asyncio
+import heapq
+import logging
+import re
+import sys
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from sqlalchemy import select
+
+from database.connection import AsyncSessionLocal
+from database.models import Book
+
+WORD_PATTERN = re.compile(r"\w+")
+# Word similarity (shared trigrams over all trigrams, like pg_trgm) needed to count as a typo
+FUZZY_THRESHOLD = 0.4
+FUZZY_MAX_WORDS = 20
+
+def normalize(text: str | None) -> list[str]:
+    # Casefolded words without accents, so "Brontë" is found by "bronte"
+    text = unicodedata.normalize("NFKD", text or "").casefold()
+    return WORD_PATTERN.findall("".join(char for char in text if not unicodedata.combining(char)))
+
+def trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class BookIndex:
+    """
+    In-memory search index over book titles and authors, for autocomplete.
+
+    Every book is indexed by the words of its title and author. Query words match
+    as prefixes (bisect over the sorted vocabulary), and a word with no prefix
+    match falls back to the vocabulary words sharing most of its trigrams, to
+    forgive typos. The trigram index covers distinct words rather than books, so it
+    stays small however many books share them.
+
+    Titles starting with the query are found by bisecting the sorted titles, which
+    is all a short query needs. Loaded once at startup; after that, whoever inserts
+    books adds them once their transaction has committed.
+    """
+
+    def __init__(self):
+        # book_id -> (title, author, normalized title, words, how many of the words are the title's)
+        self.books: dict[int, tuple[str, str, str, tuple, int]] = {}
+        # Posting and trigram lists are append-only lists: far smaller than sets, and only read through set unions
+        self.postings: dict[str, list[int]] = {}
+        # Sorted (normalized title, book_id) pairs: titles starting with the query are a bisect away
+        self.titles: list[tuple[str, int]] = []
+        self.vocabulary: list[str] = []
+        self.word_trigrams: dict[str, list[str]] = {}
+        self.loaded = False
+        self.loader: asyncio.Task | None = None
+
+    def add(self, book_id: int, title: str, author: str | None):
+        self._add(int(book_id), title, author, keep_sorted=self.loaded)
+
+    def add_many(self, books):
+        # Appends a batch of (book_id, title, author) and sorts once, rather than inserting each in place
+        for book_id, title, author in books:
+            self._add(int(book_id), title, author, keep_sorted=False)
+        if self.loaded:
+            self.sort()
+
+    def _add(self, book_id: int, title: str, author: str | None, keep_sorted: bool):
+        if book_id in self.books:
+            return
+        # Interned: every book's words point at one copy of each word
+        title_words = [sys.intern(word) for word in normalize(title)]
+        title_key = " ".join(title_words)
+        # Deduplicated in order, so the title's words come first
+        words = tuple(dict.fromkeys(title_words + [sys.intern(word) for word in normalize(author)]))
+        self.books[book_id] = (title, author or "", title_key, words, len(set(title_words)))
+        self._insert(self.titles, (title_key, book_id), keep_sorted)
+        for word in words:
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = []
+                self._insert(self.vocabulary, word, keep_sorted)
+                for trigram in trigrams(word):
+                    self.word_trigrams.setdefault(trigram, []).append(word)
+            postings.append(book_id)
+
+    @staticmethod
+    def _insert(items: list, item, keep_sorted: bool):
+        if keep_sorted:
+            insort(items, item)
+        else:
+            items.append(item)
+
+    def sort(self):
+        self.titles.sort()
+        self.vocabulary.sort()
+
+    def remove(self, book_id: int):
+        book = self.books.pop(int(book_id), None)
+        if book is None:
+            return
+        self.titles.remove((book[2], int(book_id)))
+        for word in book[3]:
+            postings = self.postings[word]
+            postings.remove(int(book_id))
+            if not postings:
+                del self.postings[word]
+                self.vocabulary.remove(word)
+                for trigram in trigrams(word):
+                    self.word_trigrams[trigram].remove(word)
+
+    def expand(self, token: str) -> set[str]:
+        start = bisect_left(self.vocabulary, token)
+        end = bisect_left(self.vocabulary, token + "\uffff", start)
+        if start < end:
+            return set(self.vocabulary[start:end])
+        if len(token) < 3:
+            return set()
+        query = trigrams(token)
+        shared = Counter(word for trigram in query for word in self.word_trigrams.get(trigram, ()))
+        similar = [
+            (count / (len(query) + len(trigrams(word)) - count), word)
+            for word, count in shared.items()
+        ]
+        return {word for similarity, word in sorted(similar, reverse=True)[:FUZZY_MAX_WORDS] if similarity >= FUZZY_THRESHOLD}
+
+    def search(self, query: str, limit: int = 25) -> list[tuple[int, str, str]]:
+        """
+        Returns up to `limit` (book_id, title, author) matches for a typed query:
+        every query word has to match a title or author word. Titles starting with
+        the query come first, then titles matching more of its words, then shorter ones.
+        """
+        tokens = normalize(query)
+        if not tokens:
+            return []
+        prefix = " ".join(tokens)
+        start = bisect_left(self.titles, (prefix,))
+        end = bisect_left(self.titles, (prefix + "\uffff",), start)
+        leading = heapq.nsmallest(limit, (book_id for _, book_id in self.titles[start:end]), key=self._title_order)
+        if len(leading) == limit:
+            # Short queries match thousands of books by word; the title prefix already fills the list
+            return [(book_id, *self.books[book_id][:2]) for book_id in leading]
+        return [(book_id, *self.books[book_id][:2]) for book_id in leading + self._search_words(tokens, prefix, limit - len(leading))]
+
+    def _title_order(self, book_id: int) -> tuple[int, str]:
+        title = self.books[book_id][0]
+        return len(title), title
+
+    def _search_words(self, tokens: list[str], prefix: str, limit: int) -> list[int]:
+        # Books whose title doesn't start with the query but matches all of its words
+        expansions = [self.expand(token) for token in tokens]
+        if not all(expansions):
+            return []
+        # Every word has to match: intersect their postings as set operations, smallest first
+        matches = sorted((set().union(*(self.postings[word] for word in words)) for words in expansions), key=len)
+
+        ranked = []
+        for book_id in matches[0].intersection(*matches[1:]):
+            title, author, title_key, words, title_word_count = self.books[book_id]
+            if title_key.startswith(prefix):
+                continue
+            title_words = words[:title_word_count]
+            title_matches = sum(1 for expansion in expansions if any(word in expansion for word in title_words))
+            ranked.append(((-title_matches, len(title), title), book_id))
+        return [book_id for _, book_id in heapq.nsmallest(limit, ranked)]
+
+    async def load(self):
+        started = asyncio.get_running_loop().time()
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(select(Book.book_id, Book.title, Book.author))
+            async for rows in result.partitions(1000):
+                self.add_many(rows)
+                # Let interactions through between batches
+                await asyncio.sleep(0)
+        self.sort()
+        self.loaded = True
+        logging.info(f"Indexed {len(self.books)} books ({len(self.vocabulary)} words) in {asyncio.get_running_loop().time() - started:.2f}s.")
+
+    def start_loading(self):
+        if self.loader is None:
+            self.loader = asyncio.create_task(self.load())
+
+book_index = BookIndex()
@@ -1,14 +1,57 @@
 # database/connection.py
 import os
+import hashlib
+import logging
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("PG_CONNECTION_STRING") if os.getenv("ENV") == "dev" else os.getenv("PG_CONNECTION_STRING").replace("localhost", os.getenv("PG_HOST"))
+# "postgresql" (default) or "sqlite" for an embedded database file at SQLITE_PATH
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "postgresql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "readz.db")
 
-print(f"Connecting to database at {DATABASE_URL}")
+_engine: AsyncEngine | None = None
+_session_factory: sessionmaker | None = None
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+def is_sqlite() -> bool:
+    return DATABASE_BACKEND == "sqlite"
+
+def get_database_url() -> str:
+    if is_sqlite():
+        return f"sqlite+aiosqlite:///{SQLITE_PATH}"
+    if os.getenv("ENV") == "dev":
+        return os.getenv("PG_CONNECTION_STRING")
+    return os.getenv("PG_CONNECTION_STRING").replace("localhost", os.getenv("PG_HOST"))
+
+def md5(value: str | None) -> str | None:
+    return hashlib.md5(value.encode()).hexdigest() if value is not None else None
+
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    # WAL lets readers (web health checks, commands) run alongside the feed cycle's writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+    # Postgres built-ins the queries rely on
+    dbapi_connection.create_function("md5", 1, md5, deterministic=True)
+
+def get_engine() -> AsyncEngine:
+    # The engine is created on first use so importing the package stays cheap
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(get_database_url(), echo=os.getenv("DB_ECHO", "false").lower() == "true")
+        if is_sqlite():
+            event.listen(_engine.sync_engine, "connect", configure_sqlite_connection)
+        logging.info(f"Connecting to database at {_engine.url.render_as_string(hide_password=True)}")
+    return _engine
+
+def AsyncSessionLocal() -> AsyncSession:
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _session_factory()
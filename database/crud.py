@@ -1,18 +1,28 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
-from database.models import Server, User, Book, UserBook, ServerSettings, ForumThread, ProgressUpdate
+from sqlalchemy import select, update, delete, or_, and_, func, text, literal_column, tuple_, bindparam, BigInteger, Integer, String, DateTime
+from database.connection import is_sqlite
+from database.dialect import insert, least, greatest
+from database.server_config import server_config_cache, NOTIFY_CHANNEL
+from database.book_index import book_index
+from database import stats
+from database.models import Server, User, Book, AccountBook, ServerSettings, ForumThread, ProgressUpdate, BotState, OutboxMessage, Poll, PollVote, DiscussionThread
 from discord import Guild
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import re
 
 # -----------------------
 # User Functions
 # -----------------------
-async def create_user(session: AsyncSession, server_id: int, user_id: int, discord_username: str, goodreads_user_id: str, goodreads_display_name: str) -> User:
+async def create_user(session: AsyncSession, server_id: int, user_id: int, discord_username: str, goodreads_user_id: str, goodreads_display_name: str, commit: bool = True) -> User:
     db_user = User(server_id=server_id, user_id=user_id, discord_username=discord_username, goodreads_user_id=goodreads_user_id, goodreads_display_name=goodreads_display_name)
     session.add(db_user)
+    await session.flush()
+    if goodreads_user_id:
+        # The account may already be tracked in another guild; count its shelf here too
+        await stats.apply_membership(session, server_id, goodreads_user_id, 1)
+    if not commit:
+        return db_user
     await session.commit()
     await session.refresh(db_user)
     return db_user
@@ -21,7 +31,15 @@ async def delete_user(session: AsyncSession, user_id: int, server_id: int) -> No
     result = await session.execute(select(User).where(User.user_id == user_id, User.server_id == server_id))
     db_user = result.scalar_one_or_none()
     if db_user:
+        goodreads_user_id = db_user.goodreads_user_id
+        if goodreads_user_id:
+            await stats.apply_membership(session, server_id, goodreads_user_id, -1)
         await session.delete(db_user)
+        await session.flush()
+        # Drop the account's shelf once no guild tracks it anymore
+        if goodreads_user_id and not await get_users_by_goodreads_id(session, goodreads_user_id):
+            await session.execute(delete(AccountBook).where(AccountBook.goodreads_user_id == goodreads_user_id))
+            await stats.delete_account_stats(session, goodreads_user_id)
         await session.commit()
 
 async def get_user(session: AsyncSession, server_id: int, user_id: int) -> User | None:
@@ -32,6 +50,11 @@ async def get_all_users(session: AsyncSession, server_id: int) -> list[User]:
     result = await session.execute(select(User).where(User.server_id == server_id))
     return result.scalars().all()
 
+async def get_users_by_goodreads_id(session: AsyncSession, goodreads_user_id: str) -> list[User]:
+    # Every guild membership of one Goodreads account
+    result = await session.execute(select(User).where(User.goodreads_user_id == goodreads_user_id))
+    return result.scalars().all()
+
 # -----------------------
 # Book Functions
 # -----------------------
@@ -55,12 +78,17 @@ async def save_book(session: AsyncSession, book_id: str, title: str, author: str
     await session.flush()
     return book
 
+async def get_book(session: AsyncSession, book_id: int) -> Book | None:
+    result = await session.execute(select(Book).where(Book.book_id == book_id))
+    return result.scalar_one_or_none()
+
 async def delete_book(session: AsyncSession, book_id: str) -> None:
     result = await session.execute(select(Book).where(Book.book_id == book_id))
     db_book = result.scalar_one_or_none()
     if db_book:
         await session.delete(db_book)
         await session.commit()
+        book_index.remove(db_book.book_id)
         
 async def get_all_books(session: AsyncSession) -> list[Book]:
     result = await session.execute(select(Book))
@@ -77,49 +105,190 @@ async def get_book_by_title_fuzzy(session: AsyncSession, title: str) -> Book | N
     )
     return result.scalar_one_or_none()
 
+# Matches the ix_books_search expression index
+BOOK_SEARCH_DOCUMENT = literal_column("to_tsvector('simple', books.title || ' ' || coalesce(books.author, ''))")
+
+async def search_books(session: AsyncSession, query: str, limit: int = 25) -> list:
+    """
+    Database-side book search, for when the in-memory index can't answer: every
+    query word has to prefix-match a title or author word. Returns (book_id, title,
+    author) rows, best first. Postgres uses full-text search; SQLite uses LIKE.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return []
+    stmt = select(Book.book_id, Book.title, Book.author).limit(limit)
+    if is_sqlite():
+        stmt = stmt.where(*(
+            or_(func.lower(Book.title).like(f"%{word}%"), func.lower(Book.author).like(f"%{word}%"))
+            for word in words
+        )).order_by(func.length(Book.title))
+    else:
+        tsquery = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{word}:*" for word in words))
+        stmt = stmt.where(BOOK_SEARCH_DOCUMENT.op("@@")(tsquery)).order_by(func.ts_rank(BOOK_SEARCH_DOCUMENT, tsquery).desc(), func.length(Book.title))
+    result = await session.execute(stmt)
+    return result.fetchall()
+
+async def get_book_shelvers(session: AsyncSession, server_id: int, book_id: int) -> list:
+    # The server's members with this book on a shelf, as (user_id, discord_username, shelf, rating) rows
+    result = await session.execute(
+        select(User.user_id, User.discord_username, AccountBook.shelf, AccountBook.rating)
+        .join(AccountBook, AccountBook.goodreads_user_id == User.goodreads_user_id)
+        .where(User.server_id == server_id, AccountBook.book_id == book_id)
+        .order_by(User.discord_username)
+    )
+    return result.fetchall()
+
 # -----------------------
-# UserBook Functions
+# AccountBook Functions
 # -----------------------
-async def save_user_book(session: AsyncSession, server_id: int, user_id: int, book_id: int, shelf: str, rating: int = None, review: str = None, review_date: datetime = None) -> UserBook:
+async def save_account_book(session: AsyncSession, goodreads_user_id: str, book_id: int, shelf: str, rating: int = None, review: str = None, review_date: datetime = None, commit: bool = True) -> None:
+    review_date = review_date.replace(tzinfo=None) if review_date and review_date.tzinfo else review_date
     stmt = (
-        insert(UserBook)
+        insert(AccountBook)
         .values(
-            server_id=server_id,
-            user_id=user_id,
+            goodreads_user_id=goodreads_user_id,
             book_id=book_id,
             shelf=shelf,
             rating=rating,
             review=review,
-            review_date=review_date.replace(tzinfo=None) if review_date and review_date.tzinfo else review_date,
+            review_date=review_date,
         )
         .on_conflict_do_update(
-            index_elements=["server_id", "user_id", "book_id"],
+            index_elements=["goodreads_user_id", "book_id"],
             set_={
                 "shelf": shelf,
                 "rating": rating,
                 "review": review,
-                "review_date": review_date.replace(tzinfo=None) if review_date and review_date.tzinfo else review_date,
+                "review_date": review_date,
             }
         )
     )
+    if not commit:
+        # Part of a larger transaction; let the caller decide what to do on failure
+        await session.execute(stmt)
+        return
     try:
         await session.execute(stmt)
         await session.commit()
     except Exception as e:
         await session.rollback()
-        logging.error(f"Error saving user book: {e}")
+        logging.error(f"Error saving account book: {e}")
 
-async def delete_user_book(session: AsyncSession, server_id: int, user_id: int, book_id: int) -> None:
-    result = await session.execute(select(UserBook).where(UserBook.server_id == server_id, UserBook.user_id == user_id, UserBook.book_id == book_id))
-    db_user_book = result.scalar_one_or_none()
-    if db_user_book:
-        await session.delete(db_user_book)
+async def bulk_save_account_books(session: AsyncSession, goodreads_user_id: str, entries: list, batch_size: int = 1000) -> None:
+    """
+    Inserts a batch of feed entries (and any books not stored yet) with one multi-row
+    statement per table and batch. Doesn't commit; entries must have unique book ids.
+    """
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        await session.execute(insert(Book).values([
+            {
+                "book_id": entry.book_id,
+                "title": entry.title,
+                "author": entry.author or "",
+                "cover_image_url": entry.cover_image_url,
+                "goodreads_url": entry.goodreads_url,
+                "average_rating": entry.average_rating,
+            }
+            for entry in batch
+        ]).on_conflict_do_nothing(index_elements=["book_id"]))
+        stmt = insert(AccountBook).values([
+            {
+                "goodreads_user_id": goodreads_user_id,
+                "book_id": entry.book_id,
+                "shelf": entry.shelf,
+                "rating": entry.rating,
+                "review": entry.review,
+                "review_date": entry.published.replace(tzinfo=None) if entry.published and entry.published.tzinfo else entry.published,
+            }
+            for entry in batch
+        ])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["goodreads_user_id", "book_id"],
+            set_={column: stmt.excluded[column] for column in ["shelf", "rating", "review", "review_date"]},
+        ))
+
+LIBRARY_IMPORT_COLUMNS = ["book_id", "title", "author", "average_rating", "shelf", "rating", "review", "review_date"]
+LIBRARY_IMPORT_SCHEMA = """
+    book_id BIGINT, title TEXT, author TEXT, average_rating DOUBLE PRECISION,
+    shelf TEXT, rating INTEGER, review TEXT, review_date TIMESTAMP
+"""
+
+async def stage_library_import(session: AsyncSession, records: list[tuple]) -> None:
+    if is_sqlite():
+        # No COPY; an executemany into the embedded database is just as local
+        await session.execute(text("DROP TABLE IF EXISTS temp.library_import"))
+        await session.execute(text(f"CREATE TEMP TABLE library_import ({LIBRARY_IMPORT_SCHEMA})"))
+        if records:
+            await session.execute(
+                text(f"INSERT INTO library_import VALUES ({', '.join(':' + column for column in LIBRARY_IMPORT_COLUMNS)})")
+                .bindparams(bindparam("review_date", type_=DateTime)),
+                [dict(zip(LIBRARY_IMPORT_COLUMNS, record)) for record in records],
+            )
+        return
+    await session.execute(text(f"CREATE TEMP TABLE library_import ({LIBRARY_IMPORT_SCHEMA}) ON COMMIT DROP"))
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table("library_import", records=records, columns=LIBRARY_IMPORT_COLUMNS)
+
+def select_first_per_book(columns: str) -> str:
+    # SQLite has no DISTINCT ON; its bare columns in a GROUP BY come from one row of the group
+    if is_sqlite():
+        return f"SELECT {columns} FROM library_import WHERE true GROUP BY book_id"
+    return f"SELECT DISTINCT ON (book_id) {columns} FROM library_import ORDER BY book_id"
+
+async def copy_library_import(session: AsyncSession, goodreads_user_id: str, records: list[tuple]) -> list:
+    """
+    Loads library export records (in LIBRARY_IMPORT_COLUMNS order) with COPY into a
+    temporary staging table, then merges them into books and account_books with two
+    set-based statements. Books already on the account's shelves keep their feed state.
+    Returns the (book_id, shelf, rating, review_date) rows that were added. Doesn't commit.
+    """
+    await stage_library_import(session, records)
+    await session.execute(text(f"""
+        INSERT INTO books (book_id, title, author, goodreads_url, average_rating)
+        {select_first_per_book("book_id, title, COALESCE(author, ''), 'https://www.goodreads.com/book/show/' || book_id, average_rating")}
+        ON CONFLICT (book_id) DO NOTHING
+    """))
+    result = await session.execute(text(f"""
+        INSERT INTO account_books (goodreads_user_id, book_id, shelf, rating, review, review_date)
+        {select_first_per_book(":goodreads_user_id, book_id, shelf, rating, review, review_date")}
+        ON CONFLICT (goodreads_user_id, book_id) DO NOTHING
+        RETURNING book_id, shelf, rating, review_date
+    """).columns(book_id=BigInteger, shelf=String, rating=Integer, review_date=DateTime), {"goodreads_user_id": goodreads_user_id})
+    added = result.fetchall()
+    if is_sqlite():
+        await session.execute(text("DROP TABLE temp.library_import"))
+    return added
+
+async def delete_account_books(session: AsyncSession, goodreads_user_id: str, book_ids: list[int], commit: bool = True) -> None:
+    if not book_ids:
+        return
+    await session.execute(delete(AccountBook).where(AccountBook.goodreads_user_id == goodreads_user_id, AccountBook.book_id.in_(book_ids)))
+    if commit:
         await session.commit()
         
-async def get_all_user_books(session: AsyncSession, server_id: int, user_id: int) -> list[UserBook]:
-    result = await session.execute(select(UserBook).options(selectinload(UserBook.book), selectinload(UserBook.user)).where(UserBook.server_id == server_id, UserBook.user_id == user_id))
+async def get_account_books(session: AsyncSession, goodreads_user_id: str) -> list[AccountBook]:
+    result = await session.execute(select(AccountBook).where(AccountBook.goodreads_user_id == goodreads_user_id))
     return result.scalars().all()
 
+async def get_account_shelf(session: AsyncSession, goodreads_user_id: str) -> dict[int, tuple]:
+    """
+    Column-only snapshot of an account's shelf for diffing: book_id -> (book_id, shelf,
+    rating, review_hash, review_date) rows. Reviews are compared by hash, never loaded.
+    """
+    result = await session.execute(
+        select(
+            AccountBook.book_id,
+            AccountBook.shelf,
+            AccountBook.rating,
+            func.md5(AccountBook.review).label("review_hash"),
+            AccountBook.review_date,
+        ).where(AccountBook.goodreads_user_id == goodreads_user_id)
+    )
+    return {row.book_id: row for row in result}
+
 # -----------------------
 # Server Functions
 # -----------------------
@@ -130,6 +299,18 @@ async def save_server(session: AsyncSession, guild: Guild) -> Server:
     await session.refresh(db_server)
     return db_server
 
+async def save_servers(session: AsyncSession, guilds: list[Guild]) -> None:
+    # Bulk upsert: inserts missing servers and refreshes names of known ones in one statement
+    if not guilds:
+        return
+    stmt = insert(Server).values([{"server_id": guild.id, "server_name": guild.name} for guild in guilds])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["server_id"],
+        set_={"server_name": stmt.excluded.server_name}
+    )
+    await session.execute(stmt)
+    await session.commit()
+
 async def get_all_servers(session: AsyncSession) -> list[Server]:
     result = await session.execute(select(Server))
     return result.scalars().all()
@@ -142,6 +323,13 @@ async def get_server_by_server_id(session: AsyncSession, server_id: int) -> Serv
 # ServerSettings Functions
 # -----------------------
 
+async def notify_server_config_changed(session, server_id: int):
+    if is_sqlite():
+        # Single worker: the caller's own cache invalidation is all there is to do
+        return
+    # Delivered to every listening worker when the surrounding transaction commits
+    await session.execute(select(func.pg_notify(NOTIFY_CHANNEL, str(server_id))))
+
 # Set channel
 async def set_notification_channel(session, server_id: int, channel_id: int, channel_type: str):
     stmt = (
@@ -160,7 +348,24 @@ async def set_notification_channel(session, server_id: int, channel_id: int, cha
         )
     )
     await session.execute(stmt)
+    await notify_server_config_changed(session, server_id)
+    await session.commit()
+    server_config_cache.invalidate(server_id)
+
+async def set_digest_mode(session, server_id: int, digest_mode: str, digest_window_minutes: int) -> bool:
+    # Returns False when the server has no notification settings yet
+    result = await session.execute(
+        update(ServerSettings)
+        .where(ServerSettings.server_id == server_id)
+        .values(digest_mode=digest_mode, digest_window_minutes=digest_window_minutes)
+    )
+    if result.rowcount == 0:
+        await session.rollback()
+        return False
+    await notify_server_config_changed(session, server_id)
     await session.commit()
+    server_config_cache.invalidate(server_id)
+    return True
 
 # Get channel info
 async def get_notification_channel(session, server_id: int) -> ServerSettings | None:
@@ -175,7 +380,6 @@ async def get_notification_channel(session, server_id: int) -> ServerSettings |
 
 # Set or update a forum thread
 async def set_forum_thread(session, server_id: int, thread_type: str, thread_id: int):
-    from database.models import ForumThread  # adjust path if needed
     stmt = (
         insert(ForumThread)
         .values(
@@ -189,7 +393,9 @@ async def set_forum_thread(session, server_id: int, thread_type: str, thread_id:
         )
     )
     await session.execute(stmt)
+    await notify_server_config_changed(session, server_id)
     await session.commit()
+    server_config_cache.invalidate(server_id)
 
 # Get a specific thread
 async def get_forum_thread(session, server_id: int, thread_type: str):
@@ -215,34 +421,361 @@ async def get_all_forum_threads(session, server_id: int):
 # ------------------------
 # Progress Updates Functions
 # ------------------------
-async def save_new_update(session, message_id: int, server_id: int, user_id: int, book_id: int, update_value: str, published_at: datetime):
+async def save_new_update(session, message_id: int | None, server_id: int, user_id: int, book_id: int, update_value: str, published_at: datetime, percent: float | None = None, page: int | None = None, total_pages: int | None = None, commit: bool = True) -> ProgressUpdate:
     new_update = ProgressUpdate(
         message_id=message_id,
         server_id=server_id,
         user_id=user_id,
         book_id=book_id,
         value=update_value,
+        percent=percent,
+        page=page,
+        total_pages=total_pages,
         published=published_at.replace(tzinfo=None) if published_at and published_at.tzinfo else published_at,
     )
     session.add(new_update)
-    await session.commit()
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
+    return new_update
+
+async def set_progress_update_message(session, progress_update_id: int, message_id: int, commit: bool = True):
+    await session.execute(update(ProgressUpdate).where(ProgressUpdate.id == progress_update_id).values(message_id=message_id))
+    if commit:
+        await session.commit()
     
 async def check_sent_update(session, server_id: int, user_id: int, published_at: datetime) -> bool:
     result = await session.execute(
-        select(ProgressUpdate).where(
+        select(ProgressUpdate.id).where(
             ProgressUpdate.server_id == server_id,
             ProgressUpdate.user_id == user_id,
-            ProgressUpdate.published == published_at.replace(tzinfo=None) if published_at and published_at.tzinfo else published_at
-        )
+            ProgressUpdate.published == (published_at.replace(tzinfo=None) if published_at and published_at.tzinfo else published_at)
+        ).limit(1)
     )
-    return result.scalar_one_or_none() is not None
+    return result.first() is not None
 
 async def get_last_progress_update(session, server_id: int, user_id: int, book_id: int) -> ProgressUpdate | None:
     result = await session.execute(
         select(ProgressUpdate).where(
             ProgressUpdate.server_id == server_id,
             ProgressUpdate.user_id == user_id,
-            ProgressUpdate.book_id == book_id
-        ).order_by(ProgressUpdate.published.desc())
+            ProgressUpdate.book_id == book_id,
+            ProgressUpdate.message_id.is_not(None)
+        ).order_by(ProgressUpdate.published.desc()).limit(1)
+    )
+    return result.scalars().first()
+
+async def get_progress_points(session, server_id: int, since: datetime, user_id: int | None = None) -> list:
+    """
+    Returns the numeric progress time series of a server (or one member) since `since`,
+    as (user_id, book_id, title, published, percent, page, total_pages) rows ordered
+    by user, book and publish date.
+    """
+    query = select(
+        ProgressUpdate.user_id,
+        ProgressUpdate.book_id,
+        Book.title,
+        ProgressUpdate.published,
+        ProgressUpdate.percent,
+        ProgressUpdate.page,
+        ProgressUpdate.total_pages,
+    ).join(Book, Book.book_id == ProgressUpdate.book_id).where(
+        ProgressUpdate.server_id == server_id,
+        ProgressUpdate.published >= since,
+        ProgressUpdate.percent.is_not(None),
+    )
+    if user_id is not None:
+        query = query.where(ProgressUpdate.user_id == user_id)
+    result = await session.execute(query.order_by(ProgressUpdate.user_id, ProgressUpdate.book_id, ProgressUpdate.published))
+    return result.fetchall()
+
+ARCHIVABLE_PROGRESS_IDS = """
+    SELECT id FROM (
+        SELECT
+            id,
+            message_id,
+            published,
+            row_number() OVER (PARTITION BY server_id, user_id, book_id ORDER BY published DESC) AS position,
+            row_number() OVER (PARTITION BY server_id, user_id, book_id, message_id IS NULL ORDER BY published DESC) AS sent_position
+        FROM progress_updates
+    ) ranked
+    WHERE position > :keep_per_book AND published < :cutoff
+        -- The last announced update is what the next one replies to
+        AND NOT (message_id IS NOT NULL AND sent_position = 1)
+"""
+
+def summarize_progress(rows: str) -> str:
+    return f"""
+        INSERT INTO progress_summaries (server_id, user_id, book_id, archived_count, first_published, last_published, min_percent, max_percent)
+        SELECT server_id, user_id, book_id, count(*), min(published), max(published), min(percent), max(percent)
+        FROM {rows}
+        GROUP BY server_id, user_id, book_id
+        ON CONFLICT (server_id, user_id, book_id) DO UPDATE SET
+            archived_count = progress_summaries.archived_count + excluded.archived_count,
+            first_published = {least("progress_summaries.first_published", "excluded.first_published")},
+            last_published = {greatest("progress_summaries.last_published", "excluded.last_published")},
+            min_percent = {least("progress_summaries.min_percent", "excluded.min_percent")},
+            max_percent = {greatest("progress_summaries.max_percent", "excluded.max_percent")}
+    """
+
+async def compact_progress_updates(session, keep_per_book: int, cutoff: datetime) -> int:
+    """
+    Deletes progress rows older than `cutoff` beyond the latest `keep_per_book` of each
+    (server, user, book) series, folding them into progress_summaries in the same
+    transaction. The series' last announced row is always kept. Returns the number
+    of archived rows.
+    """
+    params = {"keep_per_book": keep_per_book, "cutoff": cutoff}
+    if is_sqlite():
+        # No data-modifying CTEs; the summary is written first, which takes SQLite's
+        # single write lock, so both statements see the same rows
+        await session.execute(
+            text(summarize_progress(f"progress_updates WHERE id IN ({ARCHIVABLE_PROGRESS_IDS})")).bindparams(bindparam("cutoff", type_=DateTime)),
+            params,
+        )
+        result = await session.execute(
+            text(f"DELETE FROM progress_updates WHERE id IN ({ARCHIVABLE_PROGRESS_IDS})").bindparams(bindparam("cutoff", type_=DateTime)),
+            params,
+        )
+        archived = result.rowcount
+    else:
+        result = await session.execute(text(f"""
+            WITH archived AS (
+                DELETE FROM progress_updates
+                WHERE id IN ({ARCHIVABLE_PROGRESS_IDS})
+                RETURNING server_id, user_id, book_id, published, percent
+            ), summarized AS ({summarize_progress("archived")})
+            SELECT count(*) FROM archived
+        """), params)
+        archived = result.scalar_one()
+    await session.commit()
+    return archived
+
+# ------------------------
+# Poll Functions
+# ------------------------
+async def get_to_read_overlap(session, server_id: int, limit: int) -> list:
+    # Books on the most members' to-read shelves, as (book_id, title, author, members) rows
+    members = func.count(User.user_id).label("members")
+    result = await session.execute(
+        select(Book.book_id, Book.title, Book.author, members)
+        .join(AccountBook, AccountBook.book_id == Book.book_id)
+        .join(User, User.goodreads_user_id == AccountBook.goodreads_user_id)
+        .where(User.server_id == server_id, AccountBook.shelf == "to-read")
+        .group_by(Book.book_id, Book.title, Book.author)
+        .order_by(members.desc(), Book.title)
+        .limit(limit)
+    )
+    return result.fetchall()
+
+async def create_poll(session, server_id: int, channel_id: int, question: str, options: list[dict], created_by: int, closes_at: datetime | None) -> Poll:
+    poll = Poll(server_id=server_id, channel_id=channel_id, question=question, options=options, created_by=created_by, closes_at=closes_at)
+    session.add(poll)
+    await session.commit()
+    return poll
+
+async def set_poll_message(session, poll_id: int, message_id: int):
+    await session.execute(update(Poll).where(Poll.id == poll_id).values(message_id=message_id))
+    await session.commit()
+
+async def get_open_polls(session, server_id: int | None = None) -> list[Poll]:
+    query = select(Poll).where(Poll.closed_at.is_(None), Poll.message_id.is_not(None))
+    if server_id is not None:
+        query = query.where(Poll.server_id == server_id)
+    result = await session.execute(query.order_by(Poll.id))
+    return result.scalars().all()
+
+async def get_poll_votes(session, poll_ids: list[int]) -> list:
+    if not poll_ids:
+        return []
+    result = await session.execute(select(PollVote.poll_id, PollVote.user_id, PollVote.option).where(PollVote.poll_id.in_(poll_ids)))
+    return result.fetchall()
+
+async def save_poll_votes(session, votes: dict[tuple[int, int], int | None]):
+    """
+    Writes a batch of (poll_id, user_id) -> option changes in one upsert; None
+    means the vote was withdrawn.
+    """
+    now = datetime.utcnow()
+    cast_votes = [
+        {"poll_id": poll_id, "user_id": user_id, "option": option, "voted_at": now}
+        for (poll_id, user_id), option in votes.items() if option is not None
+    ]
+    if cast_votes:
+        stmt = insert(PollVote).values(cast_votes)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["poll_id", "user_id"],
+            set_={"option": stmt.excluded.option, "voted_at": stmt.excluded.voted_at},
+        ))
+    withdrawn = [key for key, option in votes.items() if option is None]
+    if withdrawn:
+        await session.execute(delete(PollVote).where(tuple_(PollVote.poll_id, PollVote.user_id).in_(withdrawn)))
+    await session.commit()
+
+async def close_poll(session, poll_id: int):
+    await session.execute(update(Poll).where(Poll.id == poll_id).values(closed_at=datetime.utcnow()))
+    await session.commit()
+
+# ------------------------
+# Discussion Thread Functions
+# ------------------------
+async def get_current_readers(session, shelf: str = "currently-reading") -> list:
+    # (server_id, user_id, book_id) for every member and book on the shelf, across guilds
+    result = await session.execute(
+        select(User.server_id, User.user_id, AccountBook.book_id)
+        .join(AccountBook, AccountBook.goodreads_user_id == User.goodreads_user_id)
+        .where(AccountBook.shelf == shelf)
+    )
+    return result.fetchall()
+
+async def get_discussion_threads(session) -> list:
+    result = await session.execute(select(DiscussionThread.server_id, DiscussionThread.book_id))
+    return result.fetchall()
+
+async def get_discussion_thread(session, server_id: int, book_id: int) -> DiscussionThread | None:
+    result = await session.execute(
+        select(DiscussionThread).where(DiscussionThread.server_id == server_id, DiscussionThread.book_id == book_id)
+    )
+    return result.scalars().first()
+
+async def save_discussion_thread(session, server_id: int, book_id: int, thread_id: int):
+    session.add(DiscussionThread(server_id=server_id, book_id=book_id, thread_id=thread_id))
+    await session.commit()
+
+# ------------------------
+# Bot State Functions
+# ------------------------
+async def get_bot_state(session, key: str) -> str | None:
+    result = await session.execute(select(BotState.value).where(BotState.key == key))
+    row = result.first()
+    return row[0] if row else None
+
+async def set_bot_state(session, key: str, value: str):
+    stmt = (
+        insert(BotState)
+        .values(key=key, value=value, updated_at=datetime.utcnow())
+        .on_conflict_do_update(
+            index_elements=["key"],
+            set_={"value": value, "updated_at": datetime.utcnow()}
+        )
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+# ------------------------
+# Outbox Functions
+# ------------------------
+async def enqueue_outbox_message(session, idempotency_key: str, server_id: int, user_id: int, kind: str, payload: dict):
+    # Doesn't commit: meant to be written in the same transaction as the state change it announces
+    stmt = (
+        insert(OutboxMessage)
+        .values(
+            idempotency_key=idempotency_key,
+            server_id=server_id,
+            user_id=user_id,
+            kind=kind,
+            payload=payload,
+            status="pending",
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            created_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=["idempotency_key"])
+    )
+    await session.execute(stmt)
+
+async def claim_outbox_messages(session, server_ids: list[int], limit: int, stale_after: timedelta) -> list[OutboxMessage]:
+    """
+    Claims due messages for delivery by marking them 'sending'.
+    Messages stuck in 'sending' longer than `stale_after` (e.g. after a crash) are
+    reclaimed; the interrupted delivery counts as an attempt.
+    """
+    now = datetime.utcnow()
+    result = await session.execute(
+        select(OutboxMessage)
+        .where(
+            OutboxMessage.server_id.in_(server_ids),
+            or_(
+                and_(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now),
+                and_(OutboxMessage.status == "sending", OutboxMessage.claimed_at < now - stale_after),
+            )
+        )
+        .order_by(OutboxMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    messages = result.scalars().all()
+    mark_claimed(messages, now)
+    await session.commit()
+    return messages
+
+def mark_claimed(messages: list[OutboxMessage], now: datetime):
+    for message in messages:
+        if message.status == "sending":
+            # Reclaimed: the previous delivery may have posted part of it, which the retry looks for
+            message.attempts += 1
+        message.status = "sending"
+        message.claimed_at = now
+
+async def claim_outbox_digest(session, server_id: int, window: timedelta) -> list[OutboxMessage]:
+    """
+    Claims every pending message of a digest-mode server once its oldest pending
+    message has waited for the flush window; returns an empty list before that.
+    """
+    now = datetime.utcnow()
+    result = await session.execute(
+        select(OutboxMessage)
+        .where(
+            OutboxMessage.server_id == server_id,
+            or_(
+                and_(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now),
+                and_(OutboxMessage.status == "sending", OutboxMessage.claimed_at < now - window - timedelta(minutes=5)),
+            )
+        )
+        .order_by(OutboxMessage.id)
+        .with_for_update(skip_locked=True)
     )
-    return result.scalars.first()
\ No newline at end of file
+    messages = result.scalars().all()
+    if not messages or min(message.created_at for message in messages) > now - window:
+        await session.rollback()
+        return []
+    mark_claimed(messages, now)
+    await session.commit()
+    return messages
+
+async def mark_outbox_sent(session, outbox_id: int, commit: bool = True):
+    await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id == outbox_id)
+        .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+    )
+    if commit:
+        await session.commit()
+
+async def mark_outbox_sent_many(session, outbox_ids: list[int]):
+    await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(outbox_ids))
+        .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+    )
+    await session.commit()
+
+async def mark_outbox_failed(session, outbox_id: int, attempts: int, error: str, retry_at: datetime | None):
+    # retry_at=None means the message has run out of attempts
+    await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id == outbox_id)
+        .values(
+            status="pending" if retry_at else "failed",
+            attempts=attempts,
+            last_error=error[:1024],
+            next_attempt_at=retry_at,
+        )
+    )
+    await session.commit()
+
+async def prune_outbox(session, older_than: datetime):
+    await session.execute(delete(OutboxMessage).where(OutboxMessage.status == "sent", OutboxMessage.sent_at < older_than))
+    await session.commit()
@@ -0,0 +1,21 @@
+# database/dialect.py
+#
+# The few statements that differ between the Postgres and SQLite backends.
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database.connection import is_sqlite
+
+def insert(table):
+    """
+    INSERT for the configured backend. Both dialects support `on_conflict_do_update`,
+    `on_conflict_do_nothing`, `excluded` and `returning` with the same signatures,
+    so upserts are written once.
+    """
+    return sqlite.insert(table) if is_sqlite() else postgresql.insert(table)
+
+def least(*columns: str) -> str:
+    # Postgres' LEAST/GREATEST skip NULLs; SQLite's multi-argument min/max return NULL instead
+    return f"COALESCE({'min' if is_sqlite() else 'LEAST'}({', '.join(columns)}), {', '.join(columns)})"
+
+def greatest(*columns: str) -> str:
+    return f"COALESCE({'max' if is_sqlite() else 'GREATEST'}({', '.join(columns)}), {', '.join(columns)})"
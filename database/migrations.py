@@ -0,0 +1,127 @@
+# database/migrations.py
+#
+# `Base.metadata.create_all` only creates missing tables. These idempotent
+# statements bring databases created by earlier versions of the schema up to
+# date; each one is safe to run on every start.
+import logging
+from sqlalchemy import text
+
+POSTGRES_MIGRATIONS = [
+    # progress_updates (outbox): surrogate key, message_id is filled in after the outbox delivers the message.
+    # Each step is checked on its own, so a table patched by hand part of the way still converges.
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'progress_updates' AND column_name = 'id') THEN
+            ALTER TABLE progress_updates ADD COLUMN id BIGSERIAL;
+        END IF;
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = 'progress_updates'::regclass AND i.indisprimary AND a.attname = 'id'
+        ) THEN
+            ALTER TABLE progress_updates DROP CONSTRAINT IF EXISTS progress_updates_pkey;
+            ALTER TABLE progress_updates ADD PRIMARY KEY (id);
+        END IF;
+    END $$
+    """,
+    # The old key's serial default would hand undelivered rows a made-up message id
+    "ALTER TABLE progress_updates ALTER COLUMN message_id DROP NOT NULL, ALTER COLUMN message_id DROP DEFAULT",
+    "DROP SEQUENCE IF EXISTS progress_updates_message_id_seq",
+    # server_settings (digest mode): read by server_config_cache and /digest
+    "ALTER TABLE server_settings ADD COLUMN IF NOT EXISTS digest_mode VARCHAR NOT NULL DEFAULT 'off'",
+    "ALTER TABLE server_settings ADD COLUMN IF NOT EXISTS digest_window_minutes INTEGER NOT NULL DEFAULT 5",
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_digest_mode') THEN
+            ALTER TABLE server_settings ADD CONSTRAINT ck_digest_mode CHECK (digest_mode IN ('off', 'shelf', 'member'));
+        END IF;
+    END $$
+    """,
+    # Shelves are stored once per Goodreads account instead of per (guild, member)
+    "ALTER TABLE progress_updates DROP CONSTRAINT IF EXISTS progress_updates_user_id_fkey",
+    # The old table is kept as user_books_legacy (dropped in a later release); rows of members
+    # without a Goodreads account have nowhere to go and are only counted
+    """
+    DO $$
+    DECLARE
+        total BIGINT;
+        copied BIGINT;
+        unlinked BIGINT;
+    BEGIN
+        IF to_regclass('user_books') IS NOT NULL THEN
+            SELECT count(*) INTO total FROM user_books;
+            SELECT count(*) INTO unlinked FROM user_books ub
+            WHERE NOT EXISTS (
+                SELECT 1 FROM users u
+                WHERE u.server_id = ub.server_id AND u.user_id = ub.user_id AND u.goodreads_user_id IS NOT NULL
+            );
+            INSERT INTO account_books (goodreads_user_id, book_id, shelf, rating, review, review_date)
+            SELECT DISTINCT ON (u.goodreads_user_id, ub.book_id)
+                u.goodreads_user_id, ub.book_id, ub.shelf, ub.rating, ub.review, ub.review_date
+            FROM user_books ub
+            JOIN users u ON u.server_id = ub.server_id AND u.user_id = ub.user_id
+            WHERE u.goodreads_user_id IS NOT NULL
+            ORDER BY u.goodreads_user_id, ub.book_id, ub.review_date DESC NULLS LAST
+            ON CONFLICT DO NOTHING;
+            GET DIAGNOSTICS copied = ROW_COUNT;
+            ALTER TABLE user_books RENAME TO user_books_legacy;
+            -- A plain copy: its foreign keys would pin the users constraints dropped below
+            ALTER TABLE user_books_legacy
+                DROP CONSTRAINT IF EXISTS user_books_user_id_fkey,
+                DROP CONSTRAINT IF EXISTS user_books_server_id_fkey,
+                DROP CONSTRAINT IF EXISTS user_books_book_id_fkey;
+            RAISE WARNING 'user_books: % rows, % copied to account_books, % of members without a Goodreads account skipped, % merged into rows of the same account; kept as user_books_legacy',
+                total, copied, unlinked, total - copied - unlinked;
+        END IF;
+    END $$
+    """,
+    "ALTER TABLE users DROP CONSTRAINT IF EXISTS users_user_id_key",
+    "CREATE INDEX IF NOT EXISTS ix_users_goodreads_user_id ON users (goodreads_user_id)",
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'progress_updates_server_id_user_id_fkey') THEN
+            ALTER TABLE progress_updates ADD CONSTRAINT progress_updates_server_id_user_id_fkey
+                FOREIGN KEY (server_id, user_id) REFERENCES users (server_id, user_id) ON DELETE CASCADE NOT VALID;
+        END IF;
+    END $$
+    """,
+    # progress_updates: numeric progress columns, backfilled from the status text
+    "ALTER TABLE progress_updates ADD COLUMN IF NOT EXISTS percent DOUBLE PRECISION",
+    "ALTER TABLE progress_updates ADD COLUMN IF NOT EXISTS page INTEGER",
+    "ALTER TABLE progress_updates ADD COLUMN IF NOT EXISTS total_pages INTEGER",
+    """
+    UPDATE progress_updates SET
+        page = substring(value from ' is on page (\\d+) of \\d+ of ')::integer,
+        total_pages = substring(value from ' is on page \\d+ of (\\d+) of ')::integer
+    WHERE page IS NULL AND value ~ ' is on page \\d+ of \\d+ of '
+    """,
+    """
+    UPDATE progress_updates SET percent = CASE
+        WHEN page IS NOT NULL THEN LEAST(100.0, 100.0 * page / total_pages)
+        ELSE substring(value from ' is (\\d+)% done with ')::double precision
+    END
+    WHERE percent IS NULL AND ((page IS NOT NULL AND total_pages > 0) OR value ~ ' is \\d+% done with ')
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_progress_updates_server_published ON progress_updates (server_id, published)",
+    "CREATE INDEX IF NOT EXISTS ix_progress_updates_member_published ON progress_updates (server_id, user_id, published)",
+    # Full-text fallback of the /book search (crud.search_books)
+    "CREATE INDEX IF NOT EXISTS ix_books_search ON books USING gin (to_tsvector('simple', title || ' ' || coalesce(author, '')))",
+]
+
+async def run_migrations(conn):
+    # SQLite databases are always created by create_all with the current schema
+    if conn.dialect.name != "postgresql":
+        return
+    # What the migrations report with RAISE WARNING goes to the bot's log; the
+    # "already exists, skipping" notices of every start don't
+    await conn.execute(text("SET LOCAL client_min_messages = warning"))
+    driver_connection = (await conn.get_raw_connection()).driver_connection
+    def log_warning(connection, message):
+        logging.warning(f"Migration: {message.message}")
+    driver_connection.add_log_listener(log_warning)
+    try:
+        for statement in POSTGRES_MIGRATIONS:
+            await conn.execute(text(statement))
+    finally:
+        driver_connection.remove_log_listener(log_warning)
+    logging.info(f"Applied {len(POSTGRES_MIGRATIONS)} schema migrations.")
@@ -1,15 +1,11 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from sqlalchemy import Column, Integer, BigInteger, Double, String, Text, ForeignKey, DateTime, PrimaryKeyConstraint, UniqueConstraint, CheckConstraint
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, BigInteger, Double, String, Text, ForeignKey, ForeignKeyConstraint, DateTime, PrimaryKeyConstraint, UniqueConstraint, CheckConstraint, Index, JSON
 from datetime import datetime
-from dotenv import load_dotenv
-import os
+from database.connection import get_engine
+from database.migrations import run_migrations
 
-load_dotenv()
-pg_url = os.getenv("PG_CONNECTION_STRING") if os.getenv("ENV") == "dev" else os.getenv("PG_CONNECTION_STRING").replace("localhost", os.getenv("PG_HOST"))
-engine = create_async_engine(pg_url, echo=True)
-
-AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+# SQLite only autoincrements INTEGER PRIMARY KEY columns (which are 64-bit there anyway)
+SurrogateKey = BigInteger().with_variant(Integer, "sqlite")
 
 Base = declarative_base()
 
@@ -19,18 +15,21 @@ class Server(Base):
     server_name = Column(String, nullable=False)
 
     users = relationship("User", back_populates="server")
-    user_books = relationship("UserBook", back_populates="server")
     settings = relationship("ServerSettings", back_populates="server")
     forum_threads = relationship("ForumThread", back_populates="server")
-    progress_updates = relationship("ProgressUpdate", back_populates="server")
+    progress_updates = relationship("ProgressUpdate", back_populates="server", overlaps="user,progress_updates")
     
 class ServerSettings(Base):
     __tablename__ = "server_settings"
     server_id = Column(BigInteger, ForeignKey("servers.server_id"), primary_key=True)
     channel_id = Column(BigInteger)
     channel_type = Column(String, nullable=False)
+    # 'off' posts every member's updates separately; 'shelf'/'member' group a cycle's updates into a digest
+    digest_mode = Column(String, nullable=False, default="off", server_default="off")
+    digest_window_minutes = Column(Integer, nullable=False, default=5, server_default="5")
     __table_args__ = (
         CheckConstraint("channel_type IN ('text', 'forum')", name="ck_channel_type"),
+        CheckConstraint("digest_mode IN ('off', 'shelf', 'member')", name="ck_digest_mode"),
     )
 
     server = relationship("Server", back_populates="settings")
@@ -50,18 +49,20 @@ class ForumThread(Base):
 class User(Base):
     __tablename__ = "users"
     server_id = Column(BigInteger, ForeignKey("servers.server_id"))
-    user_id = Column(BigInteger, unique=True, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
     discord_username = Column(String, nullable=False)
     goodreads_user_id = Column(String)
     goodreads_display_name = Column(String)
     registered_at = Column(DateTime, default=datetime.utcnow)
 
     server = relationship("Server", back_populates="users")
-    books = relationship("UserBook", back_populates="user")
-    progress_updates = relationship("ProgressUpdate", back_populates="user")
+    # Shelves belong to the Goodreads account, shared by every guild the member is registered in
+    books = relationship("AccountBook", primaryjoin="User.goodreads_user_id == foreign(AccountBook.goodreads_user_id)", viewonly=True)
+    progress_updates = relationship("ProgressUpdate", back_populates="user", overlaps="server,progress_updates")
     
     __table_args__ = (
         PrimaryKeyConstraint('server_id', 'user_id'),
+        Index("ix_users_goodreads_user_id", "goodreads_user_id"),
     )
     
     def __str__(self):
@@ -76,57 +77,194 @@ class Book(Base):
     goodreads_url = Column(String)
     average_rating = Column(Double)
 
-    users = relationship("UserBook", back_populates="book")
+    accounts = relationship("AccountBook", back_populates="book")
     progress_updates = relationship("ProgressUpdate", back_populates="book") 
     
     def __str__(self):
         return f"{self.title} by {self.author} (ID: {self.book_id})"
     
 
-class UserBook(Base):
-    __tablename__ = "user_books"
-    server_id = Column(BigInteger, ForeignKey("servers.server_id"))
-    user_id = Column(BigInteger, ForeignKey("users.user_id"))
-    book_id = Column(BigInteger, ForeignKey("books.book_id"))
+class AccountBook(Base):
+    __tablename__ = "account_books"
+    goodreads_user_id = Column(String, nullable=False)
+    book_id = Column(BigInteger, ForeignKey("books.book_id"), nullable=False)
     shelf = Column(String)
     rating = Column(Integer)
     review = Column(Text)
     review_date = Column(DateTime)
 
-    server = relationship("Server", back_populates="user_books")
-    user = relationship("User", back_populates="books")
-    book = relationship("Book", back_populates="users")
+    book = relationship("Book", back_populates="accounts")
     
     __table_args__ = (
-        PrimaryKeyConstraint('server_id', 'user_id', 'book_id'),
-        UniqueConstraint("server_id", "user_id", "book_id", name="uq_user_book"),
+        PrimaryKeyConstraint('goodreads_user_id', 'book_id'),
     )
     
     def __str__(self):
-        return f"{self.user.discord_username} - {self.book.title} ({self.shelf})"
+        return f"{self.goodreads_user_id} - {self.book.title} ({self.shelf})"
     
 class ProgressUpdate(Base):
     __tablename__ = "progress_updates"
-    message_id = Column(BigInteger, primary_key=True)
+    id = Column(SurrogateKey, primary_key=True, autoincrement=True)
+    # Set by the outbox dispatcher once the Discord message has been sent
+    message_id = Column(BigInteger, nullable=True)
     server_id = Column(BigInteger, ForeignKey("servers.server_id"))
-    user_id = Column(BigInteger, ForeignKey("users.user_id"))
+    user_id = Column(BigInteger)
     book_id = Column(BigInteger, ForeignKey("books.book_id"))
     value = Column(String(1024))
+    # Parsed from value; percent is derived from page / total_pages for page-based updates
+    percent = Column(Double)
+    page = Column(Integer)
+    total_pages = Column(Integer)
     published = Column(DateTime)
 
-    server = relationship("Server", back_populates="progress_updates")
-    user = relationship("User", back_populates="progress_updates")
+    server = relationship("Server", back_populates="progress_updates", overlaps="user,progress_updates")
+    user = relationship("User", back_populates="progress_updates", overlaps="server,progress_updates")
     book = relationship("Book", back_populates="progress_updates")
 
     __table_args__ = (
-        PrimaryKeyConstraint('message_id'),
+        ForeignKeyConstraint(["server_id", "user_id"], ["users.server_id", "users.user_id"], ondelete="CASCADE"),
         UniqueConstraint("server_id", "user_id", "book_id", "published", name="uq_progress_update"),
+        Index("ix_progress_updates_server_published", "server_id", "published"),
+        # check_sent_update; get_last_progress_update is served by uq_progress_update
+        Index("ix_progress_updates_member_published", "server_id", "user_id", "published"),
     )
     
     def __str__(self):
         return f"Progress Update by {self.user.discord_username} for {self.book.title} on {self.published.strftime('%Y-%m-%d %H:%M:%S')}"
 
+class ProgressSummary(Base):
+    # What the retention job folded away: one row per (server, user, book) series
+    __tablename__ = "progress_summaries"
+    server_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    book_id = Column(BigInteger, ForeignKey("books.book_id"), nullable=False)
+    archived_count = Column(Integer, nullable=False, default=0)
+    first_published = Column(DateTime)
+    last_published = Column(DateTime)
+    min_percent = Column(Double)
+    max_percent = Column(Double)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('server_id', 'user_id', 'book_id'),
+        ForeignKeyConstraint(["server_id", "user_id"], ["users.server_id", "users.user_id"], ondelete="CASCADE"),
+    )
+
+class Poll(Base):
+    __tablename__ = "polls"
+    id = Column(SurrogateKey, primary_key=True, autoincrement=True)
+    server_id = Column(BigInteger, ForeignKey("servers.server_id"), nullable=False)
+    channel_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger)
+    question = Column(String, nullable=False)
+    # [{"title": ..., "book_id": ... or None}, ...], in button order
+    options = Column(JSON, nullable=False)
+    created_by = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    closes_at = Column(DateTime)
+    closed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_polls_server_closed", "server_id", "closed_at"),
+    )
+
+class PollVote(Base):
+    # One row per voter; written in batches from the in-memory tally (cogs/polls.py)
+    __tablename__ = "poll_votes"
+    poll_id = Column(BigInteger, ForeignKey("polls.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    option = Column(Integer, nullable=False)
+    voted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('poll_id', 'user_id'),
+    )
+
+class DiscussionThread(Base):
+    # One discussion thread per book and guild, opened once enough members read it (cogs/discussions.py)
+    __tablename__ = "discussion_threads"
+    server_id = Column(BigInteger, ForeignKey("servers.server_id"), nullable=False)
+    book_id = Column(BigInteger, ForeignKey("books.book_id"), nullable=False)
+    thread_id = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('server_id', 'book_id'),
+    )
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    id = Column(SurrogateKey, primary_key=True, autoincrement=True)
+    idempotency_key = Column(String, nullable=False, unique=True)
+    server_id = Column(BigInteger, ForeignKey("servers.server_id"), nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        CheckConstraint("kind IN ('feed_update', 'progress_update')", name="ck_outbox_kind"),
+        CheckConstraint("status IN ('pending', 'sending', 'sent', 'failed')", name="ck_outbox_status"),
+        Index("ix_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class AccountStat(Base):
+    # Rollup of account_books: number of books per (shelf, year shelved, rating); year 0 when unknown
+    __tablename__ = "account_stats"
+    goodreads_user_id = Column(String, nullable=False)
+    shelf = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    rating = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('goodreads_user_id', 'shelf', 'year', 'rating'),
+    )
+
+class ServerStat(Base):
+    # Same rollup summed over the accounts registered in a server
+    __tablename__ = "server_stats"
+    server_id = Column(BigInteger, ForeignKey("servers.server_id"), nullable=False)
+    shelf = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    rating = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('server_id', 'shelf', 'year', 'rating'),
+    )
+
+class ServerBookStat(Base):
+    # Per-book readers and ratings within a server, indexed for the leaderboards
+    __tablename__ = "server_book_stats"
+    server_id = Column(BigInteger, ForeignKey("servers.server_id"), nullable=False)
+    book_id = Column(BigInteger, ForeignKey("books.book_id"), nullable=False)
+    readers = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    average_rating = Column(Double)
+
+    book = relationship("Book")
+
+    __table_args__ = (
+        PrimaryKeyConstraint('server_id', 'book_id'),
+        Index("ix_server_book_stats_average_rating", "server_id", "average_rating"),
+        Index("ix_server_book_stats_readers", "server_id", "readers"),
+    )
+
+class BotState(Base):
+    __tablename__ = "bot_state"
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 async def init_db():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
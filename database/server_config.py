@@ -0,0 +1,102 @@
+# database/server_config.py
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+
+from database.connection import AsyncSessionLocal, get_engine, is_sqlite
+from database.models import ServerSettings, ForumThread
+
+NOTIFY_CHANNEL = "server_config"
+
+@dataclass
+class ServerConfig:
+    channel_id: int | None = None
+    channel_type: str | None = None
+    digest_mode: str = "off"
+    digest_window_minutes: int = 5
+    threads: dict[str, int] = field(default_factory=dict)
+
+class ServerConfigCache:
+    """
+    In-memory routing config (notification channel and forum threads) per guild.
+
+    Entries are loaded on first use and dropped when the config changes, either
+    locally through `invalidate` or from another worker via Postgres NOTIFY.
+    """
+
+    def __init__(self):
+        self.configs: dict[int, ServerConfig] = {}
+        self.listener: asyncio.Task | None = None
+
+    async def get(self, server_id: int) -> ServerConfig:
+        config = self.configs.get(server_id)
+        if config is None:
+            config = await self.load(server_id)
+            self.configs[server_id] = config
+        return config
+
+    async def get_thread(self, server_id: int, thread_type: str) -> int | None:
+        return (await self.get(server_id)).threads.get(thread_type)
+
+    async def load(self, server_id: int) -> ServerConfig:
+        async with AsyncSessionLocal() as session:
+            settings = (await session.execute(
+                select(
+                    ServerSettings.channel_id,
+                    ServerSettings.channel_type,
+                    ServerSettings.digest_mode,
+                    ServerSettings.digest_window_minutes,
+                ).where(ServerSettings.server_id == server_id)
+            )).first()
+            threads = (await session.execute(
+                select(ForumThread.thread_type, ForumThread.thread_id).where(ForumThread.server_id == server_id)
+            )).fetchall()
+        return ServerConfig(
+            channel_id=settings.channel_id if settings else None,
+            channel_type=settings.channel_type if settings else None,
+            digest_mode=settings.digest_mode if settings else "off",
+            digest_window_minutes=settings.digest_window_minutes if settings else 5,
+            threads={row.thread_type: row.thread_id for row in threads},
+        )
+
+    def invalidate(self, server_id: int | None = None):
+        if server_id is None:
+            self.configs.clear()
+        else:
+            self.configs.pop(server_id, None)
+
+    def start_listener(self):
+        # An embedded SQLite database has a single worker; its own writes invalidate directly
+        if self.listener is None and not is_sqlite():
+            self.listener = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        # Holds one connection with LISTEN so config changes made by other workers evict our copy
+        def on_notify(connection, pid, channel, payload):
+            self.invalidate(int(payload) if payload else None)
+
+        while True:
+            try:
+                async with get_engine().connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    driver_connection = raw.driver_connection
+                    await driver_connection.add_listener(NOTIFY_CHANNEL, on_notify)
+                    # Anything could have changed while we weren't listening
+                    self.invalidate()
+                    logging.info(f"Listening for '{NOTIFY_CHANNEL}' notifications.")
+                    try:
+                        while not driver_connection.is_closed():
+                            await asyncio.sleep(30)
+                    finally:
+                        if not driver_connection.is_closed():
+                            await driver_connection.remove_listener(NOTIFY_CHANNEL, on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Server config listener failed, retrying: {e}")
+            self.invalidate()
+            await asyncio.sleep(5)
+
+server_config_cache = ServerConfigCache()
@@ -0,0 +1,288 @@
+# database/stats.py
+#
+# Reading-stats rollups (account_stats, server_stats, server_book_stats).
+# They are kept up to date incrementally from the feed cycle's shelf diff and
+# from membership changes, and can be recomputed from account_books with
+# `rebuild_stats` to verify them.
+import logging
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, delete, func, or_, literal, case, cast, extract, Integer, text
+
+from database.connection import is_sqlite
+from database.dialect import insert
+from database.models import User, Book, AccountBook, AccountStat, ServerStat, ServerBookStat
+
+def stat_key(shelf: str, shelved_at: datetime | None, rating: int | None) -> tuple[str, int, int]:
+    return (shelf, shelved_at.year if shelved_at else 0, rating or 0)
+
+class StatsDelta:
+    """
+    Net change to the rollups caused by one account's shelf diff.
+    """
+
+    def __init__(self):
+        self.shelves: Counter = Counter()
+        # book_id -> [readers, rating_count, rating_sum]
+        self.books: dict[int, list[int]] = {}
+
+    def add(self, book_id: int, shelf: str, shelved_at: datetime | None, rating: int | None, sign: int = 1):
+        if shelf is None:
+            return
+        self.shelves[stat_key(shelf, shelved_at, rating)] += sign
+        book = self.books.setdefault(int(book_id), [0, 0, 0])
+        book[0] += sign if shelf == "read" else 0
+        book[1] += sign if rating else 0
+        book[2] += sign * (rating or 0)
+
+    def remove(self, book_id: int, shelf: str, shelved_at: datetime | None, rating: int | None):
+        self.add(book_id, shelf, shelved_at, rating, sign=-1)
+
+    def compact(self) -> "StatsDelta":
+        # Unchanged books cancel out; only the net changes are written
+        self.shelves = Counter({key: count for key, count in self.shelves.items() if count})
+        self.books = {book_id: change for book_id, change in self.books.items() if any(change)}
+        return self
+
+    def __bool__(self) -> bool:
+        return bool(self.shelves or self.books)
+
+async def lock_stats(session):
+    if is_sqlite():
+        # SQLite has a single writer: a no-op write takes it before the rebuild reads anything
+        await session.execute(text("DELETE FROM account_stats WHERE 0"))
+        return
+    # Delta writers take row locks on these tables, so they wait for a running rebuild
+    # (and it for them) instead of writing into rollups it's about to replace
+    await session.execute(text("LOCK TABLE account_stats, server_stats, server_book_stats IN SHARE ROW EXCLUSIVE MODE"))
+
+async def get_account_servers(session, goodreads_user_id: str) -> dict[int, int]:
+    # server_id -> memberships of the account there; two members of a guild may share an account
+    result = await session.execute(
+        select(User.server_id, func.count().label("memberships"))
+        .where(User.goodreads_user_id == goodreads_user_id)
+        .group_by(User.server_id)
+    )
+    return {row.server_id: row.memberships for row in result.fetchall()}
+
+def upsert_counts(model, rows: list[dict], key: list[str]):
+    stmt = insert(model).values(rows)
+    return stmt.on_conflict_do_update(index_elements=key, set_={"count": model.count + stmt.excluded.count})
+
+def upsert_book_stats(rows: list[dict]):
+    stmt = insert(ServerBookStat).values(rows)
+    rating_count = ServerBookStat.rating_count + stmt.excluded.rating_count
+    rating_sum = ServerBookStat.rating_sum + stmt.excluded.rating_sum
+    return stmt.on_conflict_do_update(
+        index_elements=["server_id", "book_id"],
+        set_={
+            "readers": ServerBookStat.readers + stmt.excluded.readers,
+            "rating_count": rating_count,
+            "rating_sum": rating_sum,
+            "average_rating": cast(rating_sum, ServerBookStat.average_rating.type) / func.nullif(rating_count, 0),
+        },
+    )
+
+async def prune_stats(session, server_ids: list[int], goodreads_user_id: str | None = None):
+    if goodreads_user_id is not None:
+        await session.execute(delete(AccountStat).where(AccountStat.goodreads_user_id == goodreads_user_id, AccountStat.count <= 0))
+    if server_ids:
+        await session.execute(delete(ServerStat).where(ServerStat.server_id.in_(server_ids), ServerStat.count <= 0))
+        await session.execute(delete(ServerBookStat).where(
+            ServerBookStat.server_id.in_(server_ids),
+            ServerBookStat.readers <= 0,
+            ServerBookStat.rating_count <= 0,
+        ))
+
+async def apply_stats_delta(session, goodreads_user_id: str, delta: StatsDelta):
+    """
+    Applies an account's shelf diff to its own rollup and to the rollups of every
+    server it's registered in, once per membership like `rebuild_stats` counts it.
+    Each server appears once per statement, as ON CONFLICT can't update a row twice.
+    Runs inside the caller's transaction.
+    """
+    if not delta.compact():
+        return
+    servers = await get_account_servers(session, goodreads_user_id)
+    server_ids = list(servers)
+    if delta.shelves:
+        await session.execute(upsert_counts(AccountStat, [
+            {"goodreads_user_id": goodreads_user_id, "shelf": shelf, "year": year, "rating": rating, "count": count}
+            for (shelf, year, rating), count in delta.shelves.items()
+        ], ["goodreads_user_id", "shelf", "year", "rating"]))
+    if server_ids and delta.shelves:
+        await session.execute(upsert_counts(ServerStat, [
+            {"server_id": server_id, "shelf": shelf, "year": year, "rating": rating, "count": count * memberships}
+            for server_id, memberships in servers.items()
+            for (shelf, year, rating), count in delta.shelves.items()
+        ], ["server_id", "shelf", "year", "rating"]))
+    if server_ids and delta.books:
+        await session.execute(upsert_book_stats([
+            {
+                "server_id": server_id,
+                "book_id": book_id,
+                "readers": readers * memberships,
+                "rating_count": rating_count * memberships,
+                "rating_sum": rating_sum * memberships,
+                "average_rating": rating_sum / rating_count if rating_count > 0 else None,
+            }
+            for server_id, memberships in servers.items()
+            for book_id, (readers, rating_count, rating_sum) in delta.books.items()
+        ]))
+    await prune_stats(session, server_ids, goodreads_user_id)
+
+async def apply_membership(session, server_id: int, goodreads_user_id: str, sign: int):
+    """
+    Adds (sign=1) or subtracts (sign=-1) an account's rollup to a server's when a
+    member registers or unregisters. Runs inside the caller's transaction.
+    """
+    server_stats = insert(ServerStat).from_select(
+        ["server_id", "shelf", "year", "rating", "count"],
+        select(literal(server_id), AccountStat.shelf, AccountStat.year, AccountStat.rating, AccountStat.count * sign)
+        .where(AccountStat.goodreads_user_id == goodreads_user_id),
+    )
+    await session.execute(server_stats.on_conflict_do_update(
+        index_elements=["server_id", "shelf", "year", "rating"],
+        set_={"count": ServerStat.count + server_stats.excluded.count},
+    ))
+    rating = func.coalesce(AccountBook.rating, 0)
+    book_stats = insert(ServerBookStat).from_select(
+        ["server_id", "book_id", "readers", "rating_count", "rating_sum", "average_rating"],
+        select(
+            literal(server_id),
+            AccountBook.book_id,
+            case((AccountBook.shelf == "read", sign), else_=0),
+            case((rating > 0, sign), else_=0),
+            rating * sign,
+            case((rating > 0, cast(rating, ServerBookStat.average_rating.type)), else_=None),
+        ).where(AccountBook.goodreads_user_id == goodreads_user_id),
+    )
+    rating_count = ServerBookStat.rating_count + book_stats.excluded.rating_count
+    rating_sum = ServerBookStat.rating_sum + book_stats.excluded.rating_sum
+    await session.execute(book_stats.on_conflict_do_update(
+        index_elements=["server_id", "book_id"],
+        set_={
+            "readers": ServerBookStat.readers + book_stats.excluded.readers,
+            "rating_count": rating_count,
+            "rating_sum": rating_sum,
+            "average_rating": cast(rating_sum, ServerBookStat.average_rating.type) / func.nullif(rating_count, 0),
+        },
+    ))
+    await prune_stats(session, [server_id])
+
+async def delete_account_stats(session, goodreads_user_id: str):
+    await session.execute(delete(AccountStat).where(AccountStat.goodreads_user_id == goodreads_user_id))
+
+# ------------------------
+# Rebuild
+# ------------------------
+def expected_account_stats():
+    year = func.coalesce(cast(extract("year", AccountBook.review_date), Integer), 0)
+    rating = func.coalesce(AccountBook.rating, 0)
+    return select(
+        AccountBook.goodreads_user_id, AccountBook.shelf, year.label("year"), rating.label("rating"), func.count().label("count")
+    ).where(AccountBook.shelf.is_not(None)).group_by(AccountBook.goodreads_user_id, AccountBook.shelf, year, rating)
+
+def expected_server_stats():
+    account_stats = expected_account_stats().subquery()
+    return select(
+        User.server_id, account_stats.c.shelf, account_stats.c.year, account_stats.c.rating, func.sum(account_stats.c.count).label("count")
+    ).join(account_stats, account_stats.c.goodreads_user_id == User.goodreads_user_id).group_by(
+        User.server_id, account_stats.c.shelf, account_stats.c.year, account_stats.c.rating
+    )
+
+def expected_server_book_stats():
+    rating = func.coalesce(AccountBook.rating, 0)
+    rating_count = func.count().filter(rating > 0)
+    rating_sum = func.coalesce(func.sum(rating), 0)
+    readers = func.count().filter(AccountBook.shelf == "read")
+    return select(
+        User.server_id,
+        AccountBook.book_id,
+        readers.label("readers"),
+        rating_count.label("rating_count"),
+        rating_sum.label("rating_sum"),
+        (cast(rating_sum, ServerBookStat.average_rating.type) / func.nullif(rating_count, 0)).label("average_rating"),
+    ).join(AccountBook, AccountBook.goodreads_user_id == User.goodreads_user_id).group_by(
+        User.server_id, AccountBook.book_id
+    ).having(or_(readers > 0, rating_count > 0))
+
+async def count_mismatches(session, model, expected, key: list[str], values: list[str]) -> int:
+    current = {
+        tuple(getattr(row, column) for column in key): tuple(getattr(row, column) for column in values)
+        for row in (await session.execute(select(*(getattr(model, column) for column in key + values)))).fetchall()
+    }
+    mismatches = 0
+    for row in (await session.execute(expected)).fetchall():
+        row_key = tuple(getattr(row, column) for column in key)
+        if current.pop(row_key, None) != tuple(getattr(row, column) for column in values):
+            mismatches += 1
+    return mismatches + len(current)
+
+async def rebuild_stats(session) -> dict[str, int]:
+    """
+    Recomputes every rollup from account_books and replaces the incrementally
+    maintained tables. Returns the number of rows that differed per table.
+    """
+    await lock_stats(session)
+    tables = [
+        (AccountStat, expected_account_stats(), ["goodreads_user_id", "shelf", "year", "rating"], ["count"]),
+        (ServerStat, expected_server_stats(), ["server_id", "shelf", "year", "rating"], ["count"]),
+        (ServerBookStat, expected_server_book_stats(), ["server_id", "book_id"], ["readers", "rating_count", "rating_sum"]),
+    ]
+    mismatches = {}
+    for model, expected, key, values in tables:
+        mismatches[model.__tablename__] = await count_mismatches(session, model, expected, key, values)
+        await session.execute(delete(model))
+        columns = key + values + (["average_rating"] if model is ServerBookStat else [])
+        await session.execute(insert(model).from_select(columns, expected))
+    await session.commit()
+    if any(mismatches.values()):
+        logging.warning(f"Stats rebuild corrected drifted rollups: {mismatches}")
+    else:
+        logging.info("Stats rebuild found the rollups up to date.")
+    return mismatches
+
+# ------------------------
+# Leaderboards
+# ------------------------
+async def get_top_readers(session, server_id: int, year: int, limit: int = 10) -> list:
+    books = func.sum(AccountStat.count).label("books")
+    result = await session.execute(
+        select(User.user_id, User.discord_username, User.goodreads_display_name, books)
+        .join(AccountStat, AccountStat.goodreads_user_id == User.goodreads_user_id)
+        .where(User.server_id == server_id, AccountStat.shelf == "read", AccountStat.year == year)
+        .group_by(User.user_id, User.discord_username, User.goodreads_display_name)
+        .order_by(books.desc())
+        .limit(limit)
+    )
+    return result.fetchall()
+
+async def get_top_rated_books(session, server_id: int, min_ratings: int = 2, limit: int = 10) -> list:
+    result = await session.execute(
+        select(Book.title, Book.goodreads_url, ServerBookStat.average_rating, ServerBookStat.rating_count)
+        .join(Book, Book.book_id == ServerBookStat.book_id)
+        .where(ServerBookStat.server_id == server_id, ServerBookStat.average_rating.is_not(None), ServerBookStat.rating_count >= min_ratings)
+        .order_by(ServerBookStat.average_rating.desc(), ServerBookStat.rating_count.desc())
+        .limit(limit)
+    )
+    return result.fetchall()
+
+async def get_most_read_books(session, server_id: int, limit: int = 10) -> list:
+    result = await session.execute(
+        select(Book.title, Book.goodreads_url, ServerBookStat.readers, ServerBookStat.average_rating)
+        .join(Book, Book.book_id == ServerBookStat.book_id)
+        .where(ServerBookStat.server_id == server_id, ServerBookStat.readers > 0)
+        .order_by(ServerBookStat.readers.desc())
+        .limit(limit)
+    )
+    return result.fetchall()
+
+async def get_server_shelf_totals(session, server_id: int, year: int) -> dict[str, int]:
+    result = await session.execute(
+        select(ServerStat.shelf, func.sum(ServerStat.count).label("count"))
+        .where(ServerStat.server_id == server_id, ServerStat.year == year)
+        .group_by(ServerStat.shelf)
+    )
+    return {row.shelf: row.count for row in result.fetchall()}
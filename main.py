@@ -1,11 +1,16 @@
 import asyncio
-import bot
+import importlib
 import web
 
 async def main():
+    # Bring the health endpoint up first, then import the heavy bot stack
+    # (discord, SQLAlchemy, APScheduler, ...) off the event loop
+    web_task = asyncio.create_task(web.start_web_server())    # FastAPI ping route to keep the web service alive
+    await web.wait_until_started(web_task)
+    bot = await asyncio.to_thread(importlib.import_module, "bot")
     await asyncio.gather(
         bot.run_discord_bot(),    # Connects to Discord, handles RSS, etc.
-        web.start_web_server()    # FastAPI ping route to keep the web service alive
+        web_task
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+# startup_check.py
+#
+# Import-time report and startup budget check:
+#   python startup_check.py            # report + budget check
+#   python startup_check.py --report   # import-time breakdown only
+#
+# Exits non-zero when the health endpoint takes longer than
+# STARTUP_BUDGET_SECONDS (default 5) to answer after launching main.py.
+# tests/test_startup.py runs the same budget check under pytest.
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", 5))
+PORT = int(os.getenv("PORT", 8080))
+TOP_N = 20
+
+def import_time_report(module: str):
+    # Same data as `python -X importtime`, aggregated per top-level import
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_part, cumulative_part, name = line.split("|", 2)
+        self_us = int(self_part.split(":")[1])
+        cumulative_us = int(cumulative_part)
+        name = name[1:]  # drop the separator space, keep the nesting indentation
+        # Nested imports are indented; keep the direct children of the top-level import
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, name.strip(), self_us, cumulative_us))
+
+    total_us = sum(cumulative for depth, _, _, cumulative in rows if depth == 0)
+    print(f"Import of '{module}' took {total_us / 1e6:.3f}s")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for depth, name, self_us, cumulative_us in sorted(rows, key=lambda row: row[3], reverse=True)[:TOP_N]:
+        print(f"{cumulative_us / 1e3:10.1f}ms {self_us / 1e3:8.1f}ms  {'  ' * depth}{name}")
+    if result.returncode != 0:
+        print(result.stderr.splitlines()[-1] if result.stderr else "import failed")
+
+def time_to_healthy(port: int = PORT, env: dict | None = None) -> float | None:
+    # Seconds from launching main.py until its health endpoint answers, or None if it never does
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "main.py"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, **(env or {}), "PORT": str(port)},
+    )
+    try:
+        while time.monotonic() - started < STARTUP_BUDGET_SECONDS * 4:
+            if process.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.monotonic() - started
+            except OSError:
+                time.sleep(0.05)
+        return None
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+if __name__ == "__main__":
+    import_time_report("main")
+    import_time_report("bot")
+    if "--report" in sys.argv:
+        sys.exit(0)
+
+    elapsed = time_to_healthy()
+    if elapsed is None:
+        print("❌ Health endpoint never became ready.")
+        sys.exit(1)
+    if elapsed > STARTUP_BUDGET_SECONDS:
+        print(f"❌ Health endpoint ready after {elapsed:.2f}s, over the {STARTUP_BUDGET_SECONDS:.2f}s budget.")
+        sys.exit(1)
+    print(f"✅ Health endpoint ready after {elapsed:.2f}s (budget {STARTUP_BUDGET_SECONDS:.2f}s).")
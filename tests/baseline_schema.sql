@@ -0,0 +1,109 @@
+-- Schema of a database created by the baseline release (pg_dump --schema-only), for the migration tests
+CREATE TABLE public.books (
+    book_id bigint NOT NULL,
+    title character varying NOT NULL,
+    author character varying NOT NULL,
+    cover_image_url character varying,
+    goodreads_url character varying,
+    average_rating double precision
+);
+CREATE SEQUENCE public.books_book_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+ALTER SEQUENCE public.books_book_id_seq OWNED BY public.books.book_id;
+CREATE TABLE public.forum_threads (
+    server_id bigint NOT NULL,
+    thread_type character varying NOT NULL,
+    thread_id bigint NOT NULL
+);
+CREATE TABLE public.progress_updates (
+    message_id bigint NOT NULL,
+    server_id bigint,
+    user_id bigint,
+    book_id bigint,
+    value character varying(1024),
+    published timestamp without time zone
+);
+CREATE SEQUENCE public.progress_updates_message_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+ALTER SEQUENCE public.progress_updates_message_id_seq OWNED BY public.progress_updates.message_id;
+CREATE TABLE public.server_settings (
+    server_id bigint NOT NULL,
+    channel_id bigint,
+    channel_type character varying NOT NULL,
+    CONSTRAINT ck_channel_type CHECK (((channel_type)::text = ANY ((ARRAY['text'::character varying, 'forum'::character varying])::text[])))
+);
+CREATE TABLE public.servers (
+    server_id bigint NOT NULL,
+    server_name character varying NOT NULL
+);
+CREATE SEQUENCE public.servers_server_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+ALTER SEQUENCE public.servers_server_id_seq OWNED BY public.servers.server_id;
+CREATE TABLE public.user_books (
+    server_id bigint NOT NULL,
+    user_id bigint NOT NULL,
+    book_id bigint NOT NULL,
+    shelf character varying,
+    rating integer,
+    review text,
+    review_date timestamp without time zone
+);
+CREATE TABLE public.users (
+    server_id bigint NOT NULL,
+    user_id bigint NOT NULL,
+    discord_username character varying NOT NULL,
+    goodreads_user_id character varying,
+    goodreads_display_name character varying,
+    registered_at timestamp without time zone
+);
+ALTER TABLE ONLY public.books ALTER COLUMN book_id SET DEFAULT nextval('public.books_book_id_seq'::regclass);
+ALTER TABLE ONLY public.progress_updates ALTER COLUMN message_id SET DEFAULT nextval('public.progress_updates_message_id_seq'::regclass);
+ALTER TABLE ONLY public.servers ALTER COLUMN server_id SET DEFAULT nextval('public.servers_server_id_seq'::regclass);
+ALTER TABLE ONLY public.books
+    ADD CONSTRAINT books_pkey PRIMARY KEY (book_id);
+ALTER TABLE ONLY public.forum_threads
+    ADD CONSTRAINT forum_threads_pkey PRIMARY KEY (server_id, thread_type);
+ALTER TABLE ONLY public.progress_updates
+    ADD CONSTRAINT progress_updates_pkey PRIMARY KEY (message_id);
+ALTER TABLE ONLY public.server_settings
+    ADD CONSTRAINT server_settings_pkey PRIMARY KEY (server_id);
+ALTER TABLE ONLY public.servers
+    ADD CONSTRAINT servers_pkey PRIMARY KEY (server_id);
+ALTER TABLE ONLY public.progress_updates
+    ADD CONSTRAINT uq_progress_update UNIQUE (server_id, user_id, book_id, published);
+ALTER TABLE ONLY public.user_books
+    ADD CONSTRAINT uq_user_book PRIMARY KEY (server_id, user_id, book_id);
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_pkey PRIMARY KEY (server_id, user_id);
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_user_id_key UNIQUE (user_id);
+ALTER TABLE ONLY public.forum_threads
+    ADD CONSTRAINT forum_threads_server_id_fkey FOREIGN KEY (server_id) REFERENCES public.servers(server_id);
+ALTER TABLE ONLY public.progress_updates
+    ADD CONSTRAINT progress_updates_book_id_fkey FOREIGN KEY (book_id) REFERENCES public.books(book_id);
+ALTER TABLE ONLY public.progress_updates
+    ADD CONSTRAINT progress_updates_server_id_fkey FOREIGN KEY (server_id) REFERENCES public.servers(server_id);
+ALTER TABLE ONLY public.progress_updates
+    ADD CONSTRAINT progress_updates_user_id_fkey FOREIGN KEY (user_id) REFERENCES public.users(user_id);
+ALTER TABLE ONLY public.server_settings
+    ADD CONSTRAINT server_settings_server_id_fkey FOREIGN KEY (server_id) REFERENCES public.servers(server_id);
+ALTER TABLE ONLY public.user_books
+    ADD CONSTRAINT user_books_book_id_fkey FOREIGN KEY (book_id) REFERENCES public.books(book_id);
+ALTER TABLE ONLY public.user_books
+    ADD CONSTRAINT user_books_server_id_fkey FOREIGN KEY (server_id) REFERENCES public.servers(server_id);
+ALTER TABLE ONLY public.user_books
+    ADD CONSTRAINT user_books_user_id_fkey FOREIGN KEY (user_id) REFERENCES public.users(user_id);
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_server_id_fkey FOREIGN KEY (server_id) REFERENCES public.servers(server_id);
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from database import connection
+
+# A scratch Postgres database for the tests that need Postgres itself; they're skipped without one
+TEST_PG_CONNECTION_STRING = os.getenv("TEST_PG_CONNECTION_STRING")
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    # A fresh embedded SQLite database per test; no Postgres needed
+    monkeypatch.setattr(connection, "DATABASE_BACKEND", "sqlite")
+    monkeypatch.setattr(connection, "SQLITE_PATH", str(tmp_path / "readz.db"))
+    monkeypatch.setattr(connection, "_engine", None)
+    monkeypatch.setattr(connection, "_session_factory", None)
+    from database.models import init_db
+    await init_db()
+    yield
+    await connection.get_engine().dispose()
+
+
+@pytest_asyncio.fixture
+async def pg_engine(monkeypatch):
+    # Points the app at an emptied TEST_PG_CONNECTION_STRING database, without creating the schema
+    if not TEST_PG_CONNECTION_STRING:
+        pytest.skip("TEST_PG_CONNECTION_STRING is not set")
+    monkeypatch.setattr(connection, "DATABASE_BACKEND", "postgresql")
+    monkeypatch.setattr(connection, "get_database_url", lambda: TEST_PG_CONNECTION_STRING)
+    monkeypatch.setattr(connection, "_engine", None)
+    monkeypatch.setattr(connection, "_session_factory", None)
+    engine = connection.get_engine()
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP SCHEMA public CASCADE"))
+        await conn.execute(text("CREATE SCHEMA public"))
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def pg(pg_engine):
+    # The current schema on the scratch Postgres database
+    from database.models import init_db
+    await init_db()
+    yield
@@ -0,0 +1,33 @@
+# Builders for feed entries and stored shelf snapshots, shared by the feed tests
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from cogs.FeedEntry import FeedEntry
+from cogs.feed_diff import review_hash
+
+PUBLISHED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def entry(book_id: int, shelf: str = "read", rating: int = 0, review: str | None = None, published: datetime = PUBLISHED) -> FeedEntry:
+    return FeedEntry(
+        book_id=book_id,
+        title=f"Book {book_id}",
+        author="Author",
+        cover_image_url=None,
+        goodreads_url=f"https://www.goodreads.com/book/show/{book_id}",
+        shelf=shelf,
+        rating=rating,
+        average_rating=4.0,
+        review=review,
+        published=published,
+    )
+
+
+def stored(*entries: FeedEntry) -> dict[int, SimpleNamespace]:
+    # Stand-ins for the rows of crud.get_account_shelf
+    return {
+        e.book_id: SimpleNamespace(
+            book_id=e.book_id, shelf=e.shelf, rating=e.rating, review_hash=review_hash(e.review), review_date=e.published.replace(tzinfo=None)
+        )
+        for e in entries
+    }
@@ -0,0 +1,87 @@
+import pytest
+
+import database.crud as crud
+from cogs import feed_read
+from cogs.feed_diff import diff_shelf
+from cogs.user_commands import BOOK_CHOICE_PATTERN
+from database.book_index import BookIndex
+from tests.feed_factories import entry
+
+
+def build(books) -> BookIndex:
+    index = BookIndex()
+    index.add_many(books)
+    index.sort()
+    index.loaded = True
+    return index
+
+
+BOOKS = [
+    (1, "Jane Eyre", "Charlotte Brontë"),
+    (2, "Wuthering Heights", "Emily Brontë"),
+    (3, "Dune", "Frank Herbert"),
+    (4, "Dune Messiah", "Frank Herbert"),
+    (5, "1984", "George Orwell"),
+]
+
+
+def test_title_prefix_comes_first():
+    index = build(BOOKS)
+    assert [book_id for book_id, _, _ in index.search("dune")] == [3, 4]
+
+
+def test_words_match_title_and_author_without_accents():
+    index = build(BOOKS)
+    assert {book_id for book_id, _, _ in index.search("bronte")} == {1, 2}
+    assert [book_id for book_id, _, _ in index.search("heights emily")] == [2]
+
+
+def test_typo_falls_back_to_trigrams():
+    index = build(BOOKS)
+    assert [book_id for book_id, _, _ in index.search("wutherng")] == [2]
+
+
+def test_add_after_load_keeps_the_index_sorted():
+    index = build(BOOKS)
+    index.add(6, "Children of Dune", "Frank Herbert")
+    index.add(3, "Duplicate", "Ignored")
+    assert index.titles == sorted(index.titles)
+    assert [book_id for book_id, _, _ in index.search("dune")] == [3, 4, 6]
+
+
+def test_remove():
+    index = build(BOOKS)
+    index.remove(5)
+    assert index.search("1984") == []
+    assert "orwell" not in index.vocabulary
+
+
+def test_book_choices_carry_a_prefixed_id():
+    assert BOOK_CHOICE_PATTERN.fullmatch("id:42").group(1) == "42"
+    # A title that happens to be a number is searched as text
+    assert BOOK_CHOICE_PATTERN.fullmatch("1984") is None
+    # Out of the id column's range
+    assert BOOK_CHOICE_PATTERN.fullmatch("id:" + "9" * 30) is None
+
+
+@pytest.mark.asyncio
+async def test_process_feed_indexes_books_after_commit(db, monkeypatch):
+    index = build([])
+    monkeypatch.setattr(feed_read, "book_index", index)
+    await feed_read.process_feed("g1", list(diff_shelf({}, [entry(1), entry(2)])))
+    assert set(index.books) == {1, 2}
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_books_stay_out_of_the_index(db, monkeypatch):
+    index = build([])
+    monkeypatch.setattr(feed_read, "book_index", index)
+    monkeypatch.setattr(crud, "book_index", index)
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("rollup failed")
+
+    monkeypatch.setattr(feed_read.stats, "apply_stats_delta", fail)
+    with pytest.raises(RuntimeError):
+        await feed_read.process_feed("g1", list(diff_shelf({}, [entry(1)])))
+    assert index.books == {}
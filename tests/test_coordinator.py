@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from cogs.coordinator import FeedCoordinator, MANUAL_PRIORITY, SCHEDULED_PRIORITY
+
+
+@pytest.mark.asyncio
+async def test_same_key_shares_one_run():
+    coordinator = FeedCoordinator()
+    runs = []
+
+    async def run():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    first, _ = coordinator.submit(("server", 1), run)
+    second, _ = coordinator.submit(("server", 1), run)
+    assert first is second
+    assert await asyncio.shield(first) == "done"
+    assert runs == [1]
+    assert not coordinator.is_pending(("server", 1))
+
+
+@pytest.mark.asyncio
+async def test_manual_jobs_run_ahead_of_scheduled_ones():
+    coordinator = FeedCoordinator()
+    order = []
+    blocker = asyncio.Event()
+
+    async def job(name):
+        order.append(name)
+        if name == "running":
+            await blocker.wait()
+
+    running, _ = coordinator.submit("running", lambda: job("running"))
+    await asyncio.sleep(0)
+    scheduled, position = coordinator.submit("scheduled", lambda: job("scheduled"), SCHEDULED_PRIORITY)
+    assert position == 1
+    # The dedicated manual worker doesn't wait for the running scheduled cycle
+    manual, _ = coordinator.submit("manual", lambda: job("manual"), MANUAL_PRIORITY)
+    await asyncio.shield(manual)
+    assert order == ["running", "manual"]
+    blocker.set()
+    await asyncio.gather(running, scheduled)
+    assert order == ["running", "manual", "scheduled"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_run():
+    coordinator = FeedCoordinator()
+    release = asyncio.Event()
+
+    async def run():
+        await release.wait()
+        return "done"
+
+    async def wait():
+        future, _ = coordinator.submit(("server", 1), run)
+        return await asyncio.shield(future)
+
+    impatient = asyncio.create_task(wait())
+    patient = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    impatient.cancel()
+    release.set()
+    assert await patient == "done"
+    assert impatient.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_failure_reaches_every_waiter():
+    coordinator = FeedCoordinator()
+
+    async def run():
+        raise LookupError("not registered")
+
+    first, _ = coordinator.submit(("user", 1, 2), run)
+    second, _ = coordinator.submit(("user", 1, 2), run)
+    for future in (first, second):
+        with pytest.raises(LookupError):
+            await asyncio.shield(future)
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+
+import database.crud as crud
+from cogs.message_sender import (
+    EMBED_FIELD_LIMIT, EMBED_FIELD_VALUE_LIMIT, EMBED_TOTAL_LIMIT, build_digest_embeds,
+)
+from database.connection import AsyncSessionLocal
+from database.models import OutboxMessage, Server
+from tests.feed_factories import entry
+
+WINDOW = timedelta(minutes=5)
+ALICE = SimpleNamespace(user_id=10, discord_username="alice")
+BOB = SimpleNamespace(user_id=11, discord_username="bob")
+
+
+def sections(embeds) -> dict[str, str]:
+    return {field.name: field.value for embed in embeds for field in embed.fields}
+
+
+def test_shelf_digest_has_a_section_per_shelf():
+    embeds = build_digest_embeds(
+        [(ALICE, entry(1, "read")), (BOB, entry(2, "to-read")), (BOB, entry(3, "read"))],
+        [(ALICE, "alice is 50% done with Book 4")],
+        "shelf",
+        (),
+    )
+    fields = sections(embeds)
+    assert list(fields) == ["📚 To Read", "✅ Read", "📈 Reading Progress"]
+    assert "Book 1" in fields["✅ Read"] and "— alice" in fields["✅ Read"]
+    assert "Book 3" in fields["✅ Read"] and "— bob" in fields["✅ Read"]
+    assert "50% done" in fields["📈 Reading Progress"]
+    assert embeds[0].description == "3 shelf updates and 1 progress updates from 2 members."
+
+
+def test_member_digest_has_a_section_per_member():
+    embeds = build_digest_embeds(
+        [(ALICE, entry(1, "read")), (BOB, entry(2, "to-read"))],
+        [(ALICE, "alice is 50% done with Book 4")],
+        "member",
+        (),
+    )
+    fields = sections(embeds)
+    assert list(fields) == ["👤 alice", "👤 bob"]
+    assert "Book 1" in fields["👤 alice"] and "50% done" in fields["👤 alice"]
+    assert "(📚 To Read)" in fields["👤 bob"]
+
+
+@pytest.mark.parametrize("digest_mode", ["shelf", "member"])
+def test_large_digest_stays_within_embed_limits(digest_mode):
+    members = [SimpleNamespace(user_id=user_id, discord_username=f"member{user_id}") for user_id in range(40)]
+    feed_updates = [
+        (members[i % len(members)], entry(i, ["read", "to-read", "currently-reading"][i % 3], rating=4, review="A long review. " * 40))
+        for i in range(600)
+    ]
+    progress_updates = [(members[i % len(members)], f"member{i} is {i % 100}% done with Book {i}") for i in range(200)]
+    embeds = build_digest_embeds(feed_updates, progress_updates, digest_mode, ())
+    assert len(embeds) > 1
+    for embed in embeds:
+        assert len(embed.fields) <= EMBED_FIELD_LIMIT
+        assert all(len(field.value) <= EMBED_FIELD_VALUE_LIMIT for field in embed.fields)
+        assert len(embed) <= EMBED_TOTAL_LIMIT
+
+
+async def enqueue(session, key: str, age: timedelta):
+    await crud.enqueue_outbox_message(session, key, 1, 10, "feed_update", {"entries": [entry(1).to_dict()]})
+    await session.execute(
+        update(OutboxMessage).where(OutboxMessage.idempotency_key == key).values(created_at=datetime.utcnow() - age)
+    )
+
+
+@pytest.mark.asyncio
+async def test_digest_waits_for_the_flush_window(db):
+    async with AsyncSessionLocal() as session:
+        session.add(Server(server_id=1, server_name="One"))
+        await session.commit()
+        await enqueue(session, "new", timedelta(minutes=1))
+        await session.commit()
+        assert await crud.claim_outbox_digest(session, 1, WINDOW) == []
+
+        # Once the oldest message has waited out the window, everything pending goes in one digest
+        await enqueue(session, "old", timedelta(minutes=6))
+        await session.commit()
+        claimed = await crud.claim_outbox_digest(session, 1, WINDOW)
+    assert sorted(message.idempotency_key for message in claimed) == ["new", "old"]
+    assert all(message.status == "sending" for message in claimed)
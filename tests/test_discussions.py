@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import database.crud as crud
+from cogs import discussions
+from cogs.discussions import DISCUSSION_THREAD_READERS, DiscussionThreads, ReaderIndex
+from database.connection import AsyncSessionLocal
+from database.models import AccountBook, Book, DiscussionThread, Server
+
+THRESHOLD = DISCUSSION_THREAD_READERS
+
+
+def loaded_index() -> ReaderIndex:
+    index = ReaderIndex()
+    index.loaded = True
+    return index
+
+
+def test_crossing_is_queued_once_until_settled():
+    index = loaded_index()
+    crossings = [index.add(1, user_id, 100) for user_id in range(THRESHOLD + 1)]
+    assert crossings == [False] * (THRESHOLD - 1) + [True, False]
+    assert index.queued == {(1, 100)}
+    # Nothing is opened until a thread has been saved
+    assert index.opened == set()
+
+    # Handled without a thread: the next reader may queue it again
+    index.settle(1, 100)
+    assert index.add(1, 99, 100)
+
+
+def test_opened_book_never_triggers_again():
+    index = loaded_index()
+    index.mark_opened(1, 100)
+    assert not any(index.add(1, user_id, 100) for user_id in range(THRESHOLD + 1))
+
+
+def test_readers_are_counted_per_guild():
+    index = loaded_index()
+    for user_id in range(THRESHOLD - 1):
+        index.add(1, user_id, 100)
+        index.add(2, user_id, 100)
+    index.discard(1, 0, 100)
+    assert index.count(1, 100) == THRESHOLD - 2
+    assert index.count(2, 100) == THRESHOLD - 1
+    index.remove_member(2, 1)
+    assert index.count(2, 100) == THRESHOLD - 2
+
+
+@pytest.mark.asyncio
+async def test_load_queues_books_already_over_the_threshold(db):
+    async with AsyncSessionLocal() as session:
+        session.add(Server(server_id=1, server_name="One"))
+        session.add_all([Book(book_id=book_id, title=f"Book {book_id}", author="Author") for book_id in (100, 200, 300)])
+        await session.commit()
+        for user_id in range(THRESHOLD):
+            await crud.create_user(session, 1, user_id, f"member{user_id}", f"g{user_id}", None)
+            session.add_all([
+                AccountBook(goodreads_user_id=f"g{user_id}", book_id=100, shelf="currently-reading"),
+                AccountBook(goodreads_user_id=f"g{user_id}", book_id=200, shelf="currently-reading"),
+            ])
+        # Book 200 already has its thread
+        session.add(DiscussionThread(server_id=1, book_id=200, thread_id=1))
+        await session.commit()
+
+    index = ReaderIndex()
+    # A change recorded while the index loads, taking book 300 over the threshold
+    for user_id in range(THRESHOLD):
+        assert not index.add(1, user_id, 300)
+    assert sorted(await index.load()) == [(1, 100), (1, 300)]
+    assert index.opened == {(1, 200)}
+
+
+class FakeForum(discord.ForumChannel):
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+
+    async def create_thread(self, **kwargs):
+        if self.fail:
+            raise discord.DiscordException("forum unavailable")
+        return SimpleNamespace(thread=SimpleNamespace(id=555))
+
+
+def thread_cog(monkeypatch, index: ReaderIndex, forum: FakeForum) -> DiscussionThreads:
+    monkeypatch.setattr(discussions, "reader_index", index)
+
+    async def get_config(server_id):
+        return SimpleNamespace(channel_type="forum", channel_id=42)
+
+    monkeypatch.setattr(discussions.server_config_cache, "get", get_config)
+    bot = SimpleNamespace(get_guild=lambda server_id: object(), get_channel=lambda channel_id: forum)
+    return DiscussionThreads(bot)
+
+
+async def store_book(session):
+    session.add(Server(server_id=1, server_name="One"))
+    session.add(Book(book_id=100, title="Book 100", author="Author"))
+    await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_open_thread_marks_opened_after_saving(db, monkeypatch):
+    async with AsyncSessionLocal() as session:
+        await store_book(session)
+    index = loaded_index()
+    for user_id in range(THRESHOLD):
+        index.add(1, user_id, 100)
+    cog = thread_cog(monkeypatch, index, FakeForum())
+
+    await cog.open_thread(1, 100)
+    assert index.opened == {(1, 100)}
+    async with AsyncSessionLocal() as session:
+        assert (await crud.get_discussion_thread(session, 1, 100)).thread_id == 555
+
+
+@pytest.mark.asyncio
+async def test_failed_thread_is_not_marked_opened(db, monkeypatch):
+    async with AsyncSessionLocal() as session:
+        await store_book(session)
+    index = loaded_index()
+    for user_id in range(THRESHOLD):
+        index.add(1, user_id, 100)
+    cog = thread_cog(monkeypatch, index, FakeForum(fail=True))
+
+    with pytest.raises(discord.DiscordException):
+        await cog.open_thread(1, 100)
+    index.settle(1, 100)
+    assert index.opened == set()
+    # The next reader retries
+    assert index.add(1, 99, 100)
+
+
+@pytest.mark.asyncio
+async def test_open_thread_rechecks_the_readers(db, monkeypatch):
+    async with AsyncSessionLocal() as session:
+        await store_book(session)
+    index = loaded_index()
+    for user_id in range(THRESHOLD):
+        index.add(1, user_id, 100)
+    # A reader finished the book while the crossing waited in the queue
+    index.discard(1, 0, 100)
+    cog = thread_cog(monkeypatch, index, FakeForum())
+
+    await cog.open_thread(1, 100)
+    assert index.opened == set()
+    async with AsyncSessionLocal() as session:
+        assert await crud.get_discussion_thread(session, 1, 100) is None
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from cogs.fair_scheduler import FairScheduler, parse_weights
+
+
+def dispatch_order(scheduler: FairScheduler) -> list[int]:
+    # Dispatches one item at a time, finishing it before the next is picked
+    order = []
+    while picked := scheduler.next_item():
+        lane, _ = picked
+        order.append(lane.server_id)
+        lane.running -= 1
+    return order
+
+
+def test_guilds_take_turns_regardless_of_size():
+    scheduler = FairScheduler(concurrency=1, guild_concurrency=1)
+    scheduler.add(1, list(range(100)))
+    scheduler.add(2, list(range(2)))
+    scheduler.add(3, list(range(1)))
+    order = dispatch_order(scheduler)
+    # Every small guild is served within the first round
+    assert order[:5] == [1, 2, 3, 1, 2]
+    assert order[5:] == [1] * 98
+
+
+def test_weights_set_the_share_of_turns():
+    scheduler = FairScheduler(concurrency=1, guild_concurrency=1)
+    scheduler.add(1, list(range(30)), weight=2.0)
+    scheduler.add(2, list(range(30)), weight=1.0)
+    first_round = dispatch_order(scheduler)[:30]
+    assert first_round.count(1) == 20
+    assert first_round.count(2) == 10
+
+
+def test_guild_added_mid_cycle_starts_at_the_current_clock():
+    scheduler = FairScheduler(concurrency=1, guild_concurrency=1)
+    scheduler.add(1, list(range(10)))
+    for _ in range(5):
+        lane, _ = scheduler.next_item()
+        lane.running -= 1
+    scheduler.add(2, list(range(10)))
+    # The latecomer gets its fair share from now on, not five turns in a row to catch up
+    assert dispatch_order(scheduler)[:4] == [2, 1, 2, 1]
+
+
+def test_guild_concurrency_caps_a_lane():
+    scheduler = FairScheduler(concurrency=4, guild_concurrency=2)
+    scheduler.add(1, list(range(10)))
+    assert scheduler.next_item() is not None
+    assert scheduler.next_item() is not None
+    # Both of guild 1's slots are taken and nobody else has work
+    assert scheduler.next_item() is None
+
+
+@pytest.mark.asyncio
+async def test_run_returns_each_guilds_results_and_respects_the_caps():
+    scheduler = FairScheduler(concurrency=3, guild_concurrency=2)
+    scheduler.add(1, list(range(6)))
+    scheduler.add(2, list(range(3)))
+    in_flight = {1: 0, 2: 0}
+    peak = {"total": 0, 1: 0, 2: 0}
+
+    async def work(server_id, item):
+        in_flight[server_id] += 1
+        peak[server_id] = max(peak[server_id], in_flight[server_id])
+        peak["total"] = max(peak["total"], sum(in_flight.values()))
+        await asyncio.sleep(0.001)
+        in_flight[server_id] -= 1
+        return item
+
+    results = await scheduler.run(work)
+    assert sorted(results[1]) == list(range(6))
+    assert sorted(results[2]) == list(range(3))
+    assert peak["total"] <= 3
+    assert peak[1] <= 2 and peak[2] <= 2
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_going_after_a_failed_item():
+    scheduler = FairScheduler(concurrency=2, guild_concurrency=1)
+    scheduler.add(1, [1, 2, 3])
+
+    async def work(server_id, item):
+        if item == 2:
+            raise ValueError("boom")
+        return item
+
+    results = await scheduler.run(work)
+    assert [result for result in results[1] if not isinstance(result, Exception)] == [1, 3]
+    assert sum(isinstance(result, ValueError) for result in results[1]) == 1
+
+
+def test_parse_weights_skips_malformed_entries():
+    assert parse_weights("1:2, 2:0.5,bad,3:x,4:0") == {1: 2.0, 2: 0.5, 4: 0.01}
@@ -0,0 +1,132 @@
+import io
+import urllib.error
+
+import pytest
+
+from cogs import feed_archive
+from cogs.feed_health import FeedUnavailableError
+
+URL = "https://www.goodreads.com/review/list_rss/1"
+RSS = b"<?xml version='1.0'?><rss version='2.0'><channel><title>Shelf</title><item><title>Dune</title></item></channel></rss>"
+
+
+class FakeTime:
+    # Stands in for the time module in cogs.feed_archive; sleeping moves the clock forward
+    def __init__(self, now: float):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def replay_from(monkeypatch, archive: str):
+    monkeypatch.setattr(feed_archive, "FEED_ARCHIVE_MODE", "replay")
+    monkeypatch.setattr(feed_archive, "_replayer", feed_archive.FeedReplayer(archive, "fast"))
+
+
+def test_replay_serves_recorded_feed(tmp_path, monkeypatch):
+    archive = str(tmp_path / "archive.jsonl.gz")
+    feed_archive.FeedRecorder(archive).record(URL, RSS, 0.0)
+    replay_from(monkeypatch, archive)
+
+    assert feed_archive.fetch_feed(URL).entries[0].title == "Dune"
+    # Exhausted URLs keep serving their last response
+    assert feed_archive.fetch_feed(URL).entries[0].title == "Dune"
+
+
+def test_replay_miss_is_feed_unavailable(tmp_path, monkeypatch):
+    archive = str(tmp_path / "archive.jsonl.gz")
+    feed_archive.FeedRecorder(archive).record(URL, RSS, 0.0)
+    replay_from(monkeypatch, archive)
+
+    with pytest.raises(FeedUnavailableError):
+        feed_archive.fetch_feed(URL + "?page=2")
+
+
+def test_record_parses_error_response_without_refetching(tmp_path, monkeypatch):
+    downloads = []
+
+    def download(url):
+        downloads.append(url)
+        raise urllib.error.HTTPError(url, 404, "Not Found", {}, io.BytesIO(b"<html>Not found</html>"))
+
+    monkeypatch.setattr(feed_archive, "_download", download)
+    monkeypatch.setattr(feed_archive, "FEED_ARCHIVE_MODE", "record")
+    monkeypatch.setattr(feed_archive, "_recorder", feed_archive.FeedRecorder(str(tmp_path / "archive.jsonl.gz")))
+
+    feed = feed_archive.fetch_feed(URL)
+    assert feed["status"] == 404
+    assert downloads == [URL]
+
+
+def test_record_network_failure_is_feed_unavailable(tmp_path, monkeypatch):
+    def download(url):
+        raise urllib.error.URLError("connection refused")
+
+    monkeypatch.setattr(feed_archive, "_download", download)
+    monkeypatch.setattr(feed_archive, "FEED_ARCHIVE_MODE", "record")
+    monkeypatch.setattr(feed_archive, "_recorder", feed_archive.FeedRecorder(str(tmp_path / "archive.jsonl.gz")))
+
+    with pytest.raises(FeedUnavailableError):
+        feed_archive.fetch_feed(URL)
+
+
+def test_original_timing_keeps_the_recorded_offsets(tmp_path, monkeypatch):
+    archive = str(tmp_path / "archive.jsonl.gz")
+    clock = FakeTime(10)
+    monkeypatch.setattr(feed_archive, "time", clock)
+    recorder = feed_archive.FeedRecorder(archive)
+    clock.now = 12
+    recorder.record(URL, RSS, 0.5)
+    clock.now = 15
+    recorder.record(URL + "?page=2", RSS, 1.5)
+
+    clock.now = 100
+    replayer = feed_archive.FeedReplayer(archive, "original")
+    replayer.replay(URL)
+    assert clock.now == 102
+    # Time spent between fetches counts towards the next offset
+    clock.now += 1
+    replayer.replay(URL + "?page=2")
+    assert clock.now == 105
+    assert clock.sleeps == [2, 2]
+    # Responses already due are served straight away
+    replayer.replay(URL)
+    assert clock.now == 105
+
+
+def test_recorded_http_error_is_replayed_with_its_status(tmp_path, monkeypatch):
+    archive = str(tmp_path / "archive.jsonl.gz")
+
+    def download(url):
+        raise urllib.error.HTTPError(url, 404, "Not Found", {}, io.BytesIO(b"<html>Not found</html>"))
+
+    monkeypatch.setattr(feed_archive, "_download", download)
+    monkeypatch.setattr(feed_archive, "FEED_ARCHIVE_MODE", "record")
+    monkeypatch.setattr(feed_archive, "_recorder", feed_archive.FeedRecorder(archive))
+    feed_archive.fetch_feed(URL)
+
+    replay_from(monkeypatch, archive)
+    assert feed_archive.fetch_feed(URL)["status"] == 404
+
+
+def test_recorded_network_failure_is_replayed(tmp_path, monkeypatch):
+    archive = str(tmp_path / "archive.jsonl.gz")
+
+    def download(url):
+        raise urllib.error.URLError("connection refused")
+
+    monkeypatch.setattr(feed_archive, "_download", download)
+    monkeypatch.setattr(feed_archive, "FEED_ARCHIVE_MODE", "record")
+    monkeypatch.setattr(feed_archive, "_recorder", feed_archive.FeedRecorder(archive))
+    with pytest.raises(FeedUnavailableError):
+        feed_archive.fetch_feed(URL)
+
+    replay_from(monkeypatch, archive)
+    with pytest.raises(FeedUnavailableError, match="connection refused"):
+        feed_archive.fetch_feed(URL)
@@ -0,0 +1,65 @@
+from cogs.feed_diff import ADDED, MOVED, RATED, RERATED, REVIEWED, REMOVED, diff_shelf
+from tests.feed_factories import entry, stored
+
+
+def diff(snapshot, feed) -> dict[int, tuple[str, ...]]:
+    return {change.book_id: change.events for change in diff_shelf(snapshot, feed)}
+
+
+def test_unchanged_shelf_yields_nothing():
+    books = [entry(1), entry(2, "to-read")]
+    assert diff(stored(*books), books) == {}
+
+
+def test_added():
+    changes = list(diff_shelf(stored(entry(1)), [entry(1), entry(2, "to-read")]))
+    assert [(change.book_id, change.events) for change in changes] == [(2, (ADDED,))]
+    assert changes[0].previous is None and changes[0].announced
+
+
+def test_moved():
+    changes = list(diff_shelf(stored(entry(1, "currently-reading")), [entry(1, "read")]))
+    assert changes[0].events == (MOVED,)
+    assert changes[0].previous.shelf == "currently-reading" and changes[0].entry.shelf == "read"
+    assert changes[0].announced
+
+
+def test_rated_and_rerated():
+    assert diff(stored(entry(1)), [entry(1, rating=4)]) == {1: (RATED,)}
+    assert diff(stored(entry(1, rating=4)), [entry(1, rating=2)]) == {1: (RERATED,)}
+
+
+def test_rating_alone_is_announced_only_for_read_books():
+    [read] = diff_shelf(stored(entry(1)), [entry(1, rating=4)])
+    [unread] = diff_shelf(stored(entry(2, "to-read")), [entry(2, "to-read", rating=4)])
+    assert read.announced
+    assert not unread.announced
+
+
+def test_reviewed():
+    assert diff(stored(entry(1, rating=5)), [entry(1, rating=5, review="Loved it.")]) == {1: (REVIEWED,)}
+    assert diff(stored(entry(1, review="Good.")), [entry(1, review="Better.")]) == {1: (REVIEWED,)}
+
+
+def test_cleared_review_is_stored_but_not_announced():
+    [change] = diff_shelf(stored(entry(1, review="Good.")), [entry(1)])
+    assert change.events == ()
+    assert not change.announced
+
+
+def test_several_events_on_one_book():
+    assert diff(stored(entry(1, "currently-reading")), [entry(1, "read", rating=5, review="Wow.")]) == {1: (MOVED, RATED, REVIEWED)}
+
+
+def test_removed():
+    changes = list(diff_shelf(stored(entry(1), entry(2)), [entry(1)]))
+    assert [(change.book_id, change.events, change.entry) for change in changes] == [(2, (REMOVED,), None)]
+    assert changes[0].previous.book_id == 2
+    assert not changes[0].announced
+
+
+def test_duplicate_entries_are_compared_once_on_the_first():
+    # The feed lists the newest shelving first; later listings of the same book are stale
+    assert diff(stored(entry(1, "to-read")), [entry(1, "read"), entry(1, "to-read")]) == {1: (MOVED,)}
+    assert diff(stored(entry(1, "read")), [entry(1, "read"), entry(1, "to-read")]) == {}
+    assert diff({}, [entry(2, "read"), entry(2, "to-read")]) == {2: (ADDED,)}
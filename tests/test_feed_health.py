@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from cogs import feed_health as feed_health_module
+from cogs import feed_read
+from cogs.feed_health import (
+    FEED_BACKOFF_BASE_MINUTES, FEED_BACKOFF_MAX_HOURS, FEED_FAILURE_THRESHOLD, FeedHealth, FeedUnavailableError,
+)
+
+
+class Clock(datetime):
+    # Stands in for datetime in cogs.feed_health; tests move `current` forward
+    current = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(feed_health_module, "datetime", Clock)
+    monkeypatch.setattr(Clock, "current", Clock.current)
+    return Clock
+
+
+def fail(health: FeedHealth, times: int = 1):
+    for _ in range(times):
+        health.record_failure("g1", "shelf", "HTTP 500")
+
+
+def test_circuit_opens_at_the_threshold(clock):
+    health = FeedHealth()
+    fail(health, FEED_FAILURE_THRESHOLD - 1)
+    assert health.should_fetch("g1", "shelf")
+    assert health.tripped() == []
+    fail(health)
+    assert not health.should_fetch("g1", "shelf")
+    assert [(state["feed"], state["failures"]) for state in health.tripped()] == [("shelf", FEED_FAILURE_THRESHOLD)]
+    # Other feeds of the same account are unaffected
+    assert health.should_fetch("g1", "progress")
+
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    health = FeedHealth()
+    fail(health, FEED_FAILURE_THRESHOLD - 1)
+    delays = []
+    for _ in range(12):
+        fail(health)
+        delays.append(health.states["g1", "shelf"].next_attempt_at - clock.current)
+    base = timedelta(minutes=FEED_BACKOFF_BASE_MINUTES)
+    assert delays[:3] == [base, base * 2, base * 4]
+    assert max(delays) == delays[-1] == timedelta(hours=FEED_BACKOFF_MAX_HOURS)
+
+
+def test_feed_is_probed_once_the_backoff_has_passed(clock):
+    health = FeedHealth()
+    fail(health, FEED_FAILURE_THRESHOLD)
+    clock.current += timedelta(minutes=FEED_BACKOFF_BASE_MINUTES) - timedelta(seconds=1)
+    assert not health.should_fetch("g1", "shelf")
+    clock.current += timedelta(seconds=1)
+    assert health.should_fetch("g1", "shelf")
+
+    # A failed probe waits twice as long for the next one
+    fail(health)
+    assert not health.should_fetch("g1", "shelf")
+    assert health.states["g1", "shelf"].next_attempt_at == clock.current + timedelta(minutes=FEED_BACKOFF_BASE_MINUTES * 2)
+
+
+def test_success_resets_the_failures(clock):
+    health = FeedHealth()
+    fail(health, FEED_FAILURE_THRESHOLD + 2)
+    health.record_success("g1", "shelf")
+    assert health.should_fetch("g1", "shelf")
+    assert health.tripped() == []
+    # Counting starts over rather than reopening on the next failure
+    fail(health)
+    assert health.should_fetch("g1", "shelf")
+
+
+@pytest.mark.asyncio
+async def test_successful_probe_closes_the_circuit(clock, monkeypatch):
+    health = FeedHealth()
+    monkeypatch.setattr(feed_read, "feed_health", health)
+    reads = []
+
+    def read(goodreads_user_id):
+        reads.append(goodreads_user_id)
+        if len(reads) <= FEED_FAILURE_THRESHOLD:
+            raise FeedUnavailableError("HTTP 500")
+        return "feed"
+
+    for _ in range(FEED_FAILURE_THRESHOLD + 1):
+        assert await feed_read.fetch_tracked(read, "g1", "shelf") is None
+    # The last call was skipped without reading the feed
+    assert len(reads) == FEED_FAILURE_THRESHOLD
+
+    clock.current += timedelta(minutes=FEED_BACKOFF_BASE_MINUTES)
+    assert await feed_read.fetch_tracked(read, "g1", "shelf") == "feed"
+    assert health.states == {}
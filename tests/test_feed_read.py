@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+import database.crud as crud
+from cogs import feed_read
+from cogs.feed_diff import REMOVED
+from cogs.feed_health import FEED_FAILURE_THRESHOLD, FeedHealth
+from database.connection import AsyncSessionLocal
+from database.models import AccountBook, Book, OutboxMessage, Server
+from tests.feed_factories import entry, stored
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_skips_the_snapshot_query(monkeypatch):
+    health = FeedHealth()
+    for _ in range(FEED_FAILURE_THRESHOLD):
+        health.record_failure("g1", "shelf", "HTTP 500")
+    monkeypatch.setattr(feed_read, "feed_health", health)
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("the stored shelf was loaded for a skipped feed")
+
+    monkeypatch.setattr(feed_read, "AsyncSessionLocal", unexpected)
+    assert await feed_read.fetch_shelf_changes("g1") is None
+
+
+def paged_feed(monkeypatch, pages):
+    # Serves `pages` (lists of FeedEntry) as the account's feed, recording which pages were fetched
+    fetched = []
+
+    def read_feed_page(goodreads_user_id, page):
+        fetched.append(page)
+        entries = pages[page - 1] if page <= len(pages) else []
+        return entries, entries[0].book_id if entries else None
+
+    monkeypatch.setattr(feed_read, "read_feed_page", read_feed_page)
+    return fetched
+
+
+def test_periodic_sync_reads_only_the_newest_page(monkeypatch):
+    newest = [entry(1, published=datetime(2024, 3, 1, tzinfo=timezone.utc)), entry(2, published=datetime(2024, 2, 1, tzinfo=timezone.utc))]
+    older = [entry(3, published=datetime(2023, 1, 1, tzinfo=timezone.utc))]
+    fetched = paged_feed(monkeypatch, [newest, older])
+    snapshot = stored(*newest, *older, entry(4, published=datetime(2024, 2, 15, tzinfo=timezone.utc)))
+
+    changes = feed_read.read_shelf_changes(snapshot, max_pages=1)("g1")
+
+    assert fetched == [1]
+    # Book 4 falls inside page 1's date window and isn't on it, so it was removed; book 3 is just out of view
+    assert [(change.book_id, change.events) for change in changes] == [(4, (REMOVED,))]
+
+
+def test_full_resync_reads_every_page_and_removes_old_books(monkeypatch):
+    newest = [entry(1, published=datetime(2024, 3, 1, tzinfo=timezone.utc))]
+    older = [entry(3, published=datetime(2023, 1, 1, tzinfo=timezone.utc))]
+    fetched = paged_feed(monkeypatch, [newest, older])
+    snapshot = stored(*newest, *older, entry(5, published=datetime(2020, 1, 1, tzinfo=timezone.utc)))
+
+    changes = feed_read.read_shelf_changes(snapshot)("g1")
+
+    assert fetched == [1, 2, 3]
+    assert [(change.book_id, change.events) for change in changes] == [(5, (REMOVED,))]
+
+
+@pytest.mark.asyncio
+async def test_resync_after_import_announces_only_changes_outside_the_import(db, monkeypatch):
+    async with AsyncSessionLocal() as session:
+        session.add(Server(server_id=1, server_name="One"))
+        session.add_all([Book(book_id=book_id, title=f"Book {book_id}", author="Author") for book_id in (1, 2)])
+        await session.commit()
+        await crud.create_user(session, 1, 10, "alice", "g1", "Alice")
+        # Book 1 came from the export, with the export's own date; book 2 was stored by the last cycle
+        session.add_all([
+            AccountBook(goodreads_user_id="g1", book_id=1, shelf="to-read", review_date=datetime(2023, 12, 30)),
+            AccountBook(goodreads_user_id="g1", book_id=2, shelf="to-read", review_date=datetime(2024, 1, 1)),
+        ])
+        await session.commit()
+    # Since then both moved to read on Goodreads
+    paged_feed(monkeypatch, [[entry(1, "read"), entry(2, "read")]])
+
+    await feed_read.resync_after_import("g1", {1})
+
+    async with AsyncSessionLocal() as session:
+        messages = (await session.execute(select(OutboxMessage))).scalars().all()
+        shelf = await crud.get_account_shelf(session, "g1")
+    assert [[entry["book_id"] for entry in message.payload["entries"]] for message in messages] == [[2]]
+    assert {book_id: row.shelf for book_id, row in shelf.items()} == {1: "read", 2: "read"}
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from cogs.message_sender import (
+    EMBED_FIELD_LIMIT, EMBED_FIELD_VALUE_LIMIT, EMBED_TOTAL_LIMIT, MESSAGE_EMBED_LIMIT,
+    build_batch_feed_update_embeds, chunk_lines, pack_sections, send_embeds,
+)
+from tests.feed_factories import entry
+
+USER = SimpleNamespace(user_id=10, discord_username="alice", goodreads_user_id="g1", goodreads_display_name="Alice")
+DISCORD_USER = SimpleNamespace(mention="@alice", avatar=None)
+
+
+def assert_within_limits(embeds: list[discord.Embed]):
+    for embed in embeds:
+        assert len(embed.fields) <= EMBED_FIELD_LIMIT
+        assert all(len(field.value) <= EMBED_FIELD_VALUE_LIMIT for field in embed.fields)
+        assert len(embed) <= EMBED_TOTAL_LIMIT
+
+
+def test_over_long_line_is_truncated_to_a_field():
+    [chunk] = chunk_lines(["x" * 3000])
+    assert chunk == "x" * (EMBED_FIELD_VALUE_LIMIT - 1) + "…"
+
+
+def test_lines_fill_a_field_exactly():
+    # 512 + newline + 511 is the whole 1024 characters of a field
+    assert chunk_lines(["a" * 512, "b" * 511]) == ["a" * 512 + "\n" + "b" * 511]
+    assert chunk_lines(["a" * 512, "b" * 512]) == ["a" * 512, "b" * 512]
+    assert chunk_lines(["x" * EMBED_FIELD_VALUE_LIMIT]) == ["x" * EMBED_FIELD_VALUE_LIMIT]
+
+
+def test_sections_are_split_across_fields_and_embeds():
+    embeds = pack_sections(
+        [("Long", [f"line {i} " + "x" * 200 for i in range(300)]), ("Short", ["one line"])],
+        lambda first: discord.Embed(title="Update" if first else "Update (continued)"),
+    )
+    assert len(embeds) > 1
+    assert [embed.title for embed in embeds[:2]] == ["Update", "Update (continued)"]
+    names = [field.name for embed in embeds for field in embed.fields]
+    assert names[0].startswith("Long (1/") and names[-1] == "Short"
+    assert_within_limits(embeds)
+
+
+def test_many_fields_start_a_new_embed():
+    embeds = pack_sections([(f"Section {i}", ["x"]) for i in range(EMBED_FIELD_LIMIT + 1)], lambda first: discord.Embed())
+    assert [len(embed.fields) for embed in embeds] == [EMBED_FIELD_LIMIT, 1]
+
+
+def test_large_batch_update_stays_within_embed_limits():
+    entries = [entry(i, ["read", "to-read", "currently-reading"][i % 3], rating=i % 6, review="A long review. " * (i % 80) or None) for i in range(500)]
+    embeds = build_batch_feed_update_embeds(entries, (), USER, DISCORD_USER)
+    assert len(embeds) > 1
+    assert_within_limits(embeds)
+    assert sum(field.value.count("• [") for embed in embeds for field in embed.fields) == len(entries)
+
+
+class FakeChannel:
+    def __init__(self):
+        self.posted = []
+
+    async def send(self, embeds):
+        self.posted.append(embeds)
+        return SimpleNamespace(id=len(self.posted))
+
+
+@pytest.mark.asyncio
+async def test_send_embeds_packs_up_to_ten_embeds_per_message():
+    channel = FakeChannel()
+    messages = await send_embeds(channel, [discord.Embed(title=f"Part {i}") for i in range(MESSAGE_EMBED_LIMIT + 2)])
+    assert [len(embeds) for embeds in channel.posted] == [MESSAGE_EMBED_LIMIT, 2]
+    assert [message.id for message in messages] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_send_embeds_keeps_each_message_within_6000_characters():
+    channel = FakeChannel()
+    await send_embeds(channel, [discord.Embed(title=f"Part {i}", description="x" * 2500) for i in range(5)])
+    assert [len(embeds) for embeds in channel.posted] == [2, 2, 1]
+    assert all(sum(len(embed) for embed in embeds) <= EMBED_TOTAL_LIMIT for embeds in channel.posted)
@@ -0,0 +1,71 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import database.crud as crud
+from database.connection import AsyncSessionLocal
+from database.models import init_db
+
+BASELINE_SCHEMA = Path(__file__).with_name("baseline_schema.sql")
+
+BASELINE_ROWS = """
+    INSERT INTO servers VALUES (1, 'One'), (2, 'Two');
+    INSERT INTO books (book_id, title, author) VALUES (100, 'A', 'X'), (200, 'B', 'Y');
+    INSERT INTO users VALUES (1, 10, 'alice', 'g1', 'Alice', now()), (2, 11, 'bob', NULL, NULL, now());
+    INSERT INTO progress_updates VALUES
+        (555, 1, 10, 100, 'Alice is on page 50 of 200 of A', now()),
+        (556, 1, 10, 200, 'Alice is 30% done with B', now() - interval '1 day');
+    INSERT INTO server_settings VALUES (1, 77, 'text');
+    -- bob never linked a Goodreads account, so his row has no account to move to
+    INSERT INTO user_books VALUES
+        (1, 10, 100, 'read', 5, NULL, now()),
+        (1, 10, 200, 'to-read', NULL, NULL, now()),
+        (2, 11, 100, 'read', 3, NULL, now());
+"""
+
+
+async def scalar(conn, query: str):
+    return (await conn.execute(text(query))).scalar()
+
+
+@pytest_asyncio.fixture
+async def baseline(pg_engine):
+    # A database as the baseline release left it, with some data in it
+    async with pg_engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await driver_connection.execute(BASELINE_SCHEMA.read_text())
+        await driver_connection.execute(BASELINE_ROWS)
+    return pg_engine
+
+
+@pytest.mark.asyncio
+async def test_baseline_database_migrates_and_stays_migrated(baseline, caplog):
+    await init_db()
+    assert "user_books: 3 rows, 2 copied to account_books, 1 of members without a Goodreads account skipped" in caplog.text
+    # Every start runs the migrations again
+    await init_db()
+
+    async with baseline.connect() as conn:
+        assert await scalar(conn, """
+            SELECT a.attname FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = 'progress_updates'::regclass AND i.indisprimary
+        """) == "id"
+        assert await scalar(conn, "SELECT count(*) FROM progress_updates WHERE message_id IN (555, 556)") == 2
+        assert await scalar(conn, "SELECT column_default FROM information_schema.columns WHERE table_name = 'progress_updates' AND column_name = 'message_id'") is None
+        assert await scalar(conn, "SELECT digest_mode || ':' || digest_window_minutes FROM server_settings") == "off:5"
+        assert (await conn.execute(text("SELECT goodreads_user_id, book_id, shelf FROM account_books ORDER BY book_id"))).fetchall() == [
+            ("g1", 100, "read"), ("g1", 200, "to-read"),
+        ]
+        # Kept whole until a later release drops it
+        assert await scalar(conn, "SELECT count(*) FROM user_books_legacy") == 3
+        with pytest.raises(IntegrityError):
+            await conn.execute(text("UPDATE server_settings SET digest_mode = 'weekly'"))
+
+    # The outbox stores progress rows before their message exists
+    async with AsyncSessionLocal() as session:
+        row = await crud.save_new_update(session, None, 1, 10, 100, "Alice is on page 80 of 200 of A", datetime(2024, 1, 1))
+        assert row.message_id is None
@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import discord
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, update
+
+import database.crud as crud
+from cogs import outbox
+from cogs.message_sender import SentMessages, send_embeds
+from cogs.outbox import OUTBOX_MAX_ATTEMPTS, OutboxDispatcher, feed_update_key, next_retry_at
+from database.connection import AsyncSessionLocal
+from database.models import OutboxMessage, Server
+from tests.feed_factories import entry
+
+BOT_ID = 999
+STALE = timedelta(minutes=5)
+
+
+def test_retry_backoff_doubles_up_to_an_hour():
+    now = datetime.utcnow()
+    delays = [(next_retry_at(attempts) - now).total_seconds() for attempts in range(1, OUTBOX_MAX_ATTEMPTS)]
+    assert delays[0] == pytest.approx(30, abs=1)
+    assert delays[1] == pytest.approx(60, abs=1)
+    assert all(later >= earlier for earlier, later in zip(delays, delays[1:]))
+    assert max(delays) <= 3600 + 1
+
+
+def test_backoff_is_capped_at_an_hour(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 20)
+    assert (next_retry_at(19) - datetime.utcnow()).total_seconds() == pytest.approx(3600, abs=1)
+
+
+def test_no_retry_once_out_of_attempts():
+    assert next_retry_at(OUTBOX_MAX_ATTEMPTS) is None
+
+
+def test_feed_update_key_ignores_entry_order():
+    assert feed_update_key(1, 10, [entry(1), entry(2)]) == feed_update_key(1, 10, [entry(2), entry(1)])
+
+
+def test_feed_update_key_tells_changes_and_recipients_apart():
+    key = feed_update_key(1, 10, [entry(1, rating=3)])
+    assert key != feed_update_key(1, 10, [entry(1, rating=4)])
+    assert key != feed_update_key(1, 10, [entry(1, rating=3, review="Great")])
+    assert key != feed_update_key(2, 10, [entry(1, rating=3)])
+    assert key != feed_update_key(1, 11, [entry(1, rating=3)])
+
+
+async def enqueue(session, key: str, server_id: int = 1):
+    await crud.enqueue_outbox_message(session, key, server_id, 10, "feed_update", {"entries": [entry(1).to_dict()]})
+
+
+async def outbox_rows(session) -> dict[str, OutboxMessage]:
+    return {message.idempotency_key: message for message in (await session.execute(select(OutboxMessage))).scalars()}
+
+
+@pytest_asyncio.fixture
+async def servers(db):
+    async with AsyncSessionLocal() as session:
+        session.add_all([Server(server_id=1, server_name="One"), Server(server_id=2, server_name="Two")])
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_is_idempotent(servers):
+    async with AsyncSessionLocal() as session:
+        await enqueue(session, "a")
+        await enqueue(session, "a")
+        await session.commit()
+        assert list(await outbox_rows(session)) == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_claim_takes_due_messages_once(servers):
+    async with AsyncSessionLocal() as session:
+        for key in ("a", "b", "c"):
+            await enqueue(session, key)
+        await enqueue(session, "other", server_id=2)
+        await session.execute(update(OutboxMessage).where(OutboxMessage.idempotency_key == "c").values(next_attempt_at=datetime.utcnow() + timedelta(hours=1)))
+        await session.commit()
+
+    async with AsyncSessionLocal() as session:
+        claimed = await crud.claim_outbox_messages(session, [1], 10, STALE)
+    assert [message.idempotency_key for message in claimed] == ["a", "b"]
+    assert all(message.status == "sending" for message in claimed)
+    async with AsyncSessionLocal() as session:
+        # Claimed messages aren't handed out again while their delivery is running
+        assert await crud.claim_outbox_messages(session, [1], 10, STALE) == []
+
+
+@pytest.mark.asyncio
+async def test_claim_respects_the_batch_size(servers):
+    async with AsyncSessionLocal() as session:
+        for key in ("a", "b", "c"):
+            await enqueue(session, key)
+        await session.commit()
+        assert [message.idempotency_key for message in await crud.claim_outbox_messages(session, [1], 2, STALE)] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_stale_claim_is_reclaimed_as_an_attempt(servers):
+    async with AsyncSessionLocal() as session:
+        await enqueue(session, "stale")
+        await enqueue(session, "running")
+        await session.commit()
+        await crud.claim_outbox_messages(session, [1], 10, STALE)
+        await session.execute(
+            update(OutboxMessage).where(OutboxMessage.idempotency_key == "stale").values(claimed_at=datetime.utcnow() - STALE * 2)
+        )
+        await session.commit()
+
+    async with AsyncSessionLocal() as session:
+        reclaimed = await crud.claim_outbox_messages(session, [1], 10, STALE)
+    assert [(message.idempotency_key, message.attempts) for message in reclaimed] == [("stale", 1)]
+
+
+@pytest.mark.asyncio
+async def test_failed_message_waits_for_its_retry(servers):
+    async with AsyncSessionLocal() as session:
+        await enqueue(session, "a")
+        await session.commit()
+        [message] = await crud.claim_outbox_messages(session, [1], 10, STALE)
+        await crud.mark_outbox_failed(session, message.id, 1, "HTTP 500", next_retry_at(1))
+        assert await crud.claim_outbox_messages(session, [1], 10, STALE) == []
+        await crud.mark_outbox_failed(session, message.id, OUTBOX_MAX_ATTEMPTS, "HTTP 500", None)
+        assert (await outbox_rows(session))["a"].status == "failed"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_skip_locked_rows(pg):
+    async with AsyncSessionLocal() as session:
+        session.add(Server(server_id=1, server_name="One"))
+        await session.commit()
+        for key in ("a", "b", "c"):
+            await enqueue(session, key)
+        await session.commit()
+
+    async with AsyncSessionLocal() as holder, AsyncSessionLocal() as session:
+        # Another worker is in the middle of claiming "a"
+        await holder.execute(select(OutboxMessage).where(OutboxMessage.idempotency_key == "a").with_for_update())
+        claimed = await crud.claim_outbox_messages(session, [1], 10, STALE)
+        assert [message.idempotency_key for message in claimed] == ["b", "c"]
+        await holder.rollback()
+
+
+class FakeThread:
+    # Records what is posted and serves it back as the channel history
+    def __init__(self):
+        self.posted = []
+        self.guild = SimpleNamespace(emojis=())
+
+    async def send(self, embeds=None, embed=None):
+        message = SimpleNamespace(id=len(self.posted) + 1, author=SimpleNamespace(id=BOT_ID), embeds=embeds or [embed])
+        self.posted.append(message)
+        return message
+
+    async def history(self, limit, after):
+        for message in self.posted[:limit]:
+            yield message
+
+
+def numbered_embeds(count: int) -> list[discord.Embed]:
+    # Each fills a message on its own: 5000 characters of the 6000 a message may carry
+    return [discord.Embed(title=f"Part {i}", description="x" * 5000) for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_retry_skips_messages_already_posted():
+    thread = FakeThread()
+    await thread.send(embeds=numbered_embeds(2)[:1])
+    sent = await SentMessages.fetch(thread, BOT_ID, datetime.utcnow(), 100)
+    # Rebuilt for the retry, with new timestamps; only the missing part goes out
+    messages = await send_embeds(thread, numbered_embeds(2), sent)
+    assert [message.embeds[0].title for message in thread.posted] == ["Part 0", "Part 1"]
+    assert [message.id for message in messages] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_retried_delivery_is_not_posted_twice(servers, monkeypatch):
+    thread = FakeThread()
+    async with AsyncSessionLocal() as session:
+        await crud.create_user(session, 1, 10, "alice", "g1", "Alice")
+        await enqueue(session, "a")
+        await session.commit()
+        [message] = await crud.claim_outbox_messages(session, [1], 10, STALE)
+
+    async def get_thread(server_id, thread_type):
+        return 42
+
+    monkeypatch.setattr(outbox.server_config_cache, "get_thread", get_thread)
+    discord_user = SimpleNamespace(mention="@alice", avatar=None)
+    bot = SimpleNamespace(get_channel=lambda channel_id: thread, get_user=lambda user_id: discord_user, user=SimpleNamespace(id=BOT_ID))
+    dispatcher = OutboxDispatcher(bot)
+    await dispatcher.deliver(message)
+    assert len(thread.posted) == 1
+
+    # The process died before the delivery was recorded; the claim goes stale and is retried
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(OutboxMessage).values(status="sending", claimed_at=datetime.utcnow() - STALE * 2))
+        await session.commit()
+        [message] = await crud.claim_outbox_messages(session, [1], 10, STALE)
+    await dispatcher.deliver(message)
+    assert len(thread.posted) == 1
+    async with AsyncSessionLocal() as session:
+        assert (await outbox_rows(session))["a"].status == "sent"
@@ -0,0 +1,65 @@
+from cogs import polls
+from cogs.polls import PollTally
+
+
+def test_open_counts_stored_votes_and_skips_unknown_options():
+    tally = PollTally()
+    tally.open(1, 3, [(10, 0), (11, 2), (12, 0), (13, 7)])
+    assert tally.counts[1] == [2, 0, 1]
+    assert tally.choices[1] == {10: 0, 11: 2, 12: 0}
+
+
+def test_vote_switch_and_withdraw():
+    tally = PollTally()
+    tally.open(1, 2)
+    assert tally.vote(1, 10, 0) == 0
+    assert tally.counts[1] == [1, 0]
+    # Switching moves the vote
+    assert tally.vote(1, 10, 1) == 1
+    assert tally.counts[1] == [0, 1]
+    # Clicking the same option again withdraws it
+    assert tally.vote(1, 10, 1) is None
+    assert tally.counts[1] == [0, 0]
+    assert 10 not in tally.choices[1]
+    # Only the latest state per voter is written
+    assert tally.pending == {(1, 10): None}
+
+
+def test_drain_hands_over_the_pending_votes():
+    tally = PollTally()
+    tally.open(1, 2)
+    tally.vote(1, 10, 0)
+    tally.vote(1, 11, 1)
+    assert tally.drain() == {(1, 10): 0, (1, 11): 1}
+    assert tally.pending == {}
+
+
+def test_requeue_keeps_votes_cast_since_the_drain():
+    tally = PollTally()
+    tally.open(1, 2)
+    tally.vote(1, 10, 0)
+    tally.vote(1, 11, 0)
+    failed = tally.drain()
+    tally.vote(1, 10, 1)
+    tally.requeue(failed)
+    assert tally.pending == {(1, 10): 1, (1, 11): 0}
+
+
+def test_full_batch_wakes_the_flush(monkeypatch):
+    monkeypatch.setattr(polls, "POLL_FLUSH_BATCH", 2)
+    polls._flush_wakeup.clear()
+    tally = PollTally()
+    tally.open(1, 2)
+    tally.vote(1, 10, 0)
+    assert not polls._flush_wakeup.is_set()
+    tally.vote(1, 11, 0)
+    assert polls._flush_wakeup.is_set()
+    polls._flush_wakeup.clear()
+
+
+def test_close_returns_the_final_counts():
+    tally = PollTally()
+    tally.open(1, 2, [(10, 1)])
+    assert tally.close(1) == [0, 1]
+    assert 1 not in tally.counts and 1 not in tally.choices
+    assert tally.close(1) == []
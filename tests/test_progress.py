@@ -0,0 +1,137 @@
+import re
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, text
+
+from cogs.progress import compute_pace, parse_progress, series_pace
+from database.connection import AsyncSessionLocal
+from database.migrations import POSTGRES_MIGRATIONS
+from database.models import Book, ProgressUpdate, Server, User
+
+START = datetime(2024, 1, 1)
+
+STATUSES = [
+    "Alice is 42% done with The Name of the Wind",
+    "Alice is 100% done with Dune",
+    "Alice is on page 50 of 200 of Dune",
+    "Alice is on page 320 of 300 of Dune",
+    "Alice is on page 5 of 0 of Dune",
+    "Alice is done with Dune",
+    "Alice wants to read Dune",
+]
+# The migrations backfill the progress columns of older rows with their own copy of the patterns
+BACKFILL = [statement for statement in POSTGRES_MIGRATIONS if statement.lstrip().startswith("UPDATE progress_updates")]
+
+
+def point(day: float, percent: float, user_id: int = 10, book_id: int = 100, total_pages: int | None = None):
+    # A row of crud.get_progress_points
+    return SimpleNamespace(
+        user_id=user_id, book_id=book_id, title=f"Book {book_id}", published=START + timedelta(days=day),
+        percent=percent, page=None, total_pages=total_pages,
+    )
+
+
+def test_parse_percent():
+    assert parse_progress("Alice is 42% done with The Name of the Wind") == {
+        "user_name": "Alice", "book_title": "The Name of the Wind", "percent": 42.0, "page": None, "total_pages": None,
+    }
+
+
+def test_parse_page():
+    assert parse_progress("Alice is on page 50 of 200 of Dune") == {
+        "user_name": "Alice", "book_title": "Dune", "percent": 25.0, "page": 50, "total_pages": 200,
+    }
+
+
+def test_parse_page_past_the_end_is_capped():
+    assert parse_progress("Alice is on page 320 of 300 of Dune")["percent"] == 100.0
+
+
+def test_parse_zero_total_pages_has_no_percent():
+    progress = parse_progress("Alice is on page 5 of 0 of Dune")
+    assert progress["page"] == 5 and progress["percent"] is None
+
+
+@pytest.mark.parametrize("value", ["Alice wants to read Dune", "Alice is done with Dune", "is 42% done with Dune"])
+def test_parse_other_statuses(value):
+    assert parse_progress(value) is None
+
+
+def test_series_pace_is_the_least_squares_slope():
+    slope, latest = series_pace([point(0, 10), point(1, 20), point(2, 30)])
+    assert slope == pytest.approx(10)
+    assert latest == 30
+
+
+def test_series_pace_starts_over_on_a_restart():
+    # Read to 80%, then started again from the beginning
+    slope, latest = series_pace([point(0, 40), point(1, 80), point(5, 5), point(7, 15)])
+    assert slope == pytest.approx(5)
+    assert latest == 15
+
+
+def test_series_pace_needs_two_points_at_different_times():
+    assert series_pace([point(0, 10)]) is None
+    assert series_pace([point(1, 10), point(1, 20)]) is None
+    # A restart leaves a single point of the current read-through
+    assert series_pace([point(0, 50), point(1, 60), point(2, 10)]) is None
+
+
+def test_compute_pace_estimates_the_finish():
+    [pace] = compute_pace([point(0, 10, total_pages=300), point(1, 20, total_pages=300)])
+    assert pace.percent_per_day == pytest.approx(10)
+    assert pace.pages_per_day == pytest.approx(30)
+    # 80% to go at 10% a day from the latest point
+    assert pace.estimated_finish == START + timedelta(days=9)
+
+
+def test_compute_pace_without_page_counts_or_progress():
+    [pace] = compute_pace([point(0, 30), point(2, 30)])
+    assert pace.pages_per_day is None
+    assert pace.estimated_finish is None
+
+
+def test_compute_pace_skips_finished_books_and_keeps_series_apart():
+    rows = [
+        point(0, 50, book_id=100), point(1, 100, book_id=100),
+        point(0, 10, book_id=200), point(2, 30, book_id=200),
+        point(0, 10, user_id=11, book_id=200),
+    ]
+    assert [(pace.user_id, pace.book_id) for pace in compute_pace(rows)] == [(10, 200)]
+
+
+def test_backfill_patterns_capture_what_parse_progress_does():
+    page_pattern, total_pages_pattern, percent_pattern = (
+        pattern for statement in BACKFILL for pattern in re.findall(r"substring\(value from '([^']+)'\)", statement)
+    )
+    for value in STATUSES:
+        progress = parse_progress(value) or {"page": None, "total_pages": None, "percent": None}
+        page, total_pages, percent = (re.search(pattern, value) for pattern in (page_pattern, total_pages_pattern, percent_pattern))
+        assert (page and int(page[1])) == progress["page"], value
+        assert (total_pages and int(total_pages[1])) == progress["total_pages"], value
+        if progress["page"] is None:
+            assert (percent and float(percent[1])) == progress["percent"], value
+
+
+@pytest.mark.asyncio
+async def test_backfill_agrees_with_parse_progress(pg):
+    async with AsyncSessionLocal() as session:
+        session.add(Server(server_id=1, server_name="One"))
+        session.add(Book(book_id=100, title="Dune", author="Frank Herbert"))
+        await session.flush()
+        session.add(User(server_id=1, user_id=10, discord_username="alice"))
+        await session.flush()
+        session.add_all(
+            ProgressUpdate(server_id=1, user_id=10, book_id=100, value=value, published=START + timedelta(days=day))
+            for day, value in enumerate(STATUSES)
+        )
+        await session.commit()
+        for statement in BACKFILL:
+            await session.execute(text(statement))
+        await session.commit()
+        rows = (await session.execute(select(ProgressUpdate).order_by(ProgressUpdate.published))).scalars()
+        for row in rows:
+            progress = parse_progress(row.value) or {"page": None, "total_pages": None, "percent": None}
+            assert (row.page, row.total_pages, row.percent) == (progress["page"], progress["total_pages"], progress["percent"]), row.value
@@ -0,0 +1,31 @@
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from startup_check import STARTUP_BUDGET_SECONDS, time_to_healthy
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_bot_import_within_budget():
+    # In a fresh interpreter, so modules already imported by other tests don't hide the cost
+    started = time.monotonic()
+    subprocess.run([sys.executable, "-c", "import bot"], cwd=ROOT, check=True, capture_output=True)
+    elapsed = time.monotonic() - started
+    assert elapsed < STARTUP_BUDGET_SECONDS, f"import bot took {elapsed:.2f}s"
+
+
+def test_health_endpoint_ready_within_budget(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    # No Discord token or Postgres needed: the health endpoint answers before the bot connects
+    elapsed = time_to_healthy(free_port(), {"DATABASE_BACKEND": "sqlite", "SQLITE_PATH": str(tmp_path / "readz.db")})
+    assert elapsed is not None, "health endpoint never became ready"
+    assert elapsed < STARTUP_BUDGET_SECONDS, f"health endpoint ready after {elapsed:.2f}s"
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+import database.crud as crud
+from database import stats
+from database.connection import AsyncSessionLocal
+from database.models import AccountBook, Book, Server, ServerBookStat, ServerStat
+from database.stats import StatsDelta
+
+
+@pytest.fixture
+def upserted_keys(monkeypatch):
+    # The conflict keys of every rollup upsert; Postgres rejects a statement that updates a row twice
+    keys = []
+    upsert_counts, upsert_book_stats = stats.upsert_counts, stats.upsert_book_stats
+
+    def record_counts(model, rows, key):
+        keys.append([tuple(row[column] for column in key) for row in rows])
+        return upsert_counts(model, rows, key)
+
+    def record_book_stats(rows):
+        keys.append([(row["server_id"], row["book_id"]) for row in rows])
+        return upsert_book_stats(rows)
+
+    monkeypatch.setattr(stats, "upsert_counts", record_counts)
+    monkeypatch.setattr(stats, "upsert_book_stats", record_book_stats)
+    return keys
+
+
+@pytest.mark.asyncio
+async def test_shared_account_in_one_guild_matches_rebuild(db, upserted_keys):
+    async with AsyncSessionLocal() as session:
+        session.add_all([Server(server_id=1, server_name="One"), Server(server_id=2, server_name="Two")])
+        session.add_all([Book(book_id=7, title="Dune", author="Frank Herbert"), Book(book_id=8, title="Emma", author="Jane Austen")])
+        await session.commit()
+        # Two members of guild 1 registered the same Goodreads account
+        await crud.create_user(session, 1, 10, "alice", "g1", "Alice")
+        await crud.create_user(session, 1, 11, "bob", "g1", "Alice")
+        await crud.create_user(session, 2, 12, "alice", "g1", "Alice")
+        assert await stats.get_account_servers(session, "g1") == {1: 2, 2: 1}
+
+        read_at = datetime(2024, 5, 1)
+        session.add_all([
+            AccountBook(goodreads_user_id="g1", book_id=7, shelf="read", rating=4, review_date=read_at),
+            AccountBook(goodreads_user_id="g1", book_id=8, shelf="to-read"),
+        ])
+        delta = StatsDelta()
+        delta.add(7, "read", read_at, 4)
+        delta.add(8, "to-read", None, None)
+        await stats.apply_stats_delta(session, "g1", delta)
+        await session.commit()
+
+        assert upserted_keys and all(len(keys) == len(set(keys)) for keys in upserted_keys)
+        server_stat = await session.get(ServerStat, (1, "read", 2024, 4))
+        assert server_stat.count == 2
+        book_stat = await session.get(ServerBookStat, (1, 7))
+        assert (book_stat.readers, book_stat.rating_count, book_stat.rating_sum) == (2, 2, 8)
+        assert book_stat.average_rating == 4
+
+        assert await stats.rebuild_stats(session) == {"account_stats": 0, "server_stats": 0, "server_book_stats": 0}
@@ -1,13 +1,89 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 import uvicorn
+import asyncio
+import hmac
+import os
+import sys
 
 app = FastAPI()
+server: uvicorn.Server | None = None
 
 @app.get("/")
 def root():
     return {"status": "ok"}
 
+@app.get("/metrics/startup")
+def startup_metrics():
+    # The bot module is imported after the web server is up; don't block on its import here
+    bot = sys.modules.get("bot")
+    metrics = getattr(bot, "startup_metrics", None)
+    return metrics if metrics is not None else {"status": "starting"}
+
+def require_admin(token: str | None):
+    # Admin routes are disabled unless ADMIN_TOKEN is configured
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or not token or not hmac.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+def get_ready_bot():
+    bot = getattr(sys.modules.get("bot"), "bot", None)
+    if bot is None or not bot.is_ready():
+        raise HTTPException(status_code=503, detail="Bot is not ready")
+    return bot
+
+@app.post("/admin/refresh/{server_id}/{user_id}")
+async def refresh_user(server_id: int, user_id: int, x_admin_token: str | None = Header(default=None)):
+    require_admin(x_admin_token)
+    from cogs.coordinator import MANUAL_PRIORITY
+    from cogs.feed_read import request_user_refresh
+
+    run, position = request_user_refresh(get_ready_bot(), server_id, user_id, priority=MANUAL_PRIORITY)
+    try:
+        summary = await asyncio.shield(run)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if summary is None:
+        return {"status": "ok", "queue_position": position, "summary": None}
+    return {
+        "status": "ok",
+        "queue_position": position,
+        "summary": {
+            "updates": [{"book_id": entry.book_id, "title": entry.title, "shelf": entry.shelf, "rating": entry.rating} for entry in summary["updates"]],
+            "progress": summary["progress"],
+        },
+    }
+
+@app.get("/admin/feeds")
+def tripped_feeds(x_admin_token: str | None = Header(default=None)):
+    require_admin(x_admin_token)
+    feed_health = getattr(sys.modules.get("cogs.feed_health"), "feed_health", None)
+    return {"tripped": feed_health.tripped() if feed_health else []}
+
+@app.get("/admin/latency")
+def feed_latency(x_admin_token: str | None = Header(default=None)):
+    require_admin(x_admin_token)
+    latency = getattr(sys.modules.get("cogs.feed_latency"), "feed_latency", None)
+    return {"guilds": latency.summaries() if latency else []}
+
+@app.post("/admin/stats/rebuild")
+async def rebuild_stats(x_admin_token: str | None = Header(default=None)):
+    require_admin(x_admin_token)
+    from database.connection import AsyncSessionLocal
+    from database import stats
+
+    async with AsyncSessionLocal() as session:
+        mismatches = await stats.rebuild_stats(session)
+    return {"status": "ok", "corrected_rows": mismatches}
+
 async def start_web_server():
-    config = uvicorn.Config(app, host="0.0.0.0", port=8080, log_level="info")
+    global server
+    config = uvicorn.Config(app, host="0.0.0.0", port=int(os.getenv("PORT", 8080)), log_level="info")
     server = uvicorn.Server(config)
-    await server.serve()
\ No newline at end of file
+    await server.serve()
+
+async def wait_until_started(web_task: asyncio.Task):
+    while not (server and server.started):
+        if web_task.done():
+            web_task.result()
+            raise RuntimeError("Web server stopped before it started serving.")
+        await asyncio.sleep(0.05)
\ No newline at end of file